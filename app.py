@@ -1,10 +1,31 @@
 
 import os
-import json
+import atexit
 import logging
+import time
+from collections import deque
+from functools import partial
 from datetime import datetime
 from flask import Flask, request, jsonify
-import requests
+from coalesce import MessageCoalescer
+from conversation_log import ConversationLog
+from conversation_store import ConversationStore, parse_time
+from graph_client import GraphClient, SendResult
+from ingress import JSON_BACKEND, parse_webhook, verify_signature
+from intent_classifier import create_intent_classifier
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from outbox import Outbox
+from page_shell import PageShell, StaticPage
+from reply_cache import ReplyCache
+from reply_rules import DEFAULT_RULES_PATH, RuleStore
+from rollups import CategoryRollups
+from rate_limit import SendScheduler
+from send_queue import SendQueue
+from sender_state import SenderIndex
+from state_backend import RespError, create_backend
+from structured_log import PayloadSampler, log_event, setup_logging
+from tenants import Tenant, TenantRegistry
+from webhook_batch import BatchReport, RetryGate, plan_batch
 
 ACCESS_TOKEN = os.getenv("INSTAGRAM_ACCESS_TOKEN")
 
@@ -14,35 +35,242 @@ IG_ID = os.getenv("INSTAGRAM_USER_ID")
 # Webhook verify token 
 WEBHOOK_VERIFY_TOKEN = os.getenv("WEBHOOK_VERIFY_TOKEN", "your_verify_token")
 
+# App secret: webhook POSTs must carry its X-Hub-Signature-256 (unset = unchecked)
+APP_SECRET = os.getenv("INSTAGRAM_APP_SECRET", "")
+
 # Brand settings
 BRAND_NAME = os.getenv("BRAND_NAME", "YourBrand")
 
 # Instagram Graph API URL 
-GRAPH_API_BASE = "https://graph.instagram.com/v24.0"
+GRAPH_API_BASE = os.getenv("GRAPH_API_BASE", "https://graph.instagram.com/v24.0")
 MESSAGES_ENDPOINT = f"{GRAPH_API_BASE}/{IG_ID}/messages"
 
+# More accounts served by this process: a JSON / YAML list, each with its own
+# token, brand, rule file and send rate (see tenants.py). The account above,
+# if set, is served too and is the default.
+TENANTS_PATH = os.getenv("TENANTS_PATH", "")
+
+# Outbound delivery: worker threads, queue bound, and how long (seconds) the
+# webhook waits for a free slot before asking Instagram to redeliver
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "1000"))
+SEND_QUEUE_TIMEOUT = float(os.getenv("SEND_QUEUE_TIMEOUT", "0.5"))
+
+# Process each webhook payload as one batch (bulk dedup, per-sender fan-out)
+WEBHOOK_BATCH_MODE = os.getenv("WEBHOOK_BATCH_MODE", "false").lower() in ("1", "true", "yes")
+
+# Graph API connection pool (one keep-alive connection per send worker) and timeouts
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", str(SEND_WORKERS)))
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "3.05"))
+GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "10"))
+
+# Graph API pacing: account-wide and per-recipient token buckets (sends/second,
+# burst), plus retry policy for throttled / transient failures
+SEND_RATE_PER_SECOND = float(os.getenv("SEND_RATE_PER_SECOND", "20"))
+SEND_RATE_BURST = int(os.getenv("SEND_RATE_BURST", "40"))
+RECIPIENT_RATE_PER_SECOND = float(os.getenv("RECIPIENT_RATE_PER_SECOND", "1"))
+RECIPIENT_RATE_BURST = int(os.getenv("RECIPIENT_RATE_BURST", "3"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+SEND_RETRY_BASE_DELAY = float(os.getenv("SEND_RETRY_BASE_DELAY", "1.0"))
+
+# Dedup window: how many message IDs to remember and for how long (seconds)
+DEDUP_MAX_SIZE = int(os.getenv("DEDUP_MAX_SIZE", "100000"))
+DEDUP_TTL_SECONDS = float(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+
+# Where dedup + counters live: memory (per worker), sqlite (per host), redis (shared)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "autodm_state.db")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+
+# Recent conversations kept in memory; older ones spill to a rotating JSONL
+# file when CONVERSATION_LOG_PATH is set (otherwise they are discarded)
+CONVERSATION_BUFFER_SIZE = int(os.getenv("CONVERSATION_BUFFER_SIZE", "1000"))
+CONVERSATION_LOG_PATH = os.getenv("CONVERSATION_LOG_PATH") or None
+CONVERSATION_LOG_MAX_BYTES = int(os.getenv("CONVERSATION_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+CONVERSATION_LOG_BACKUPS = int(os.getenv("CONVERSATION_LOG_BACKUPS", "5"))
+
+# Queryable history (SQLite) behind /conversations ("" = off); rows older
+# than CONVERSATION_DB_RETENTION_DAYS are deleted (0 = keep everything)
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "")
+CONVERSATION_DB_RETENTION_DAYS = float(os.getenv("CONVERSATION_DB_RETENTION_DAYS", "0"))
+
+# Per-category counts and send latency for /stats/timeseries: how many
+# one-minute and one-hour buckets to keep
+ROLLUP_MINUTES = int(os.getenv("ROLLUP_MINUTES", "60"))
+ROLLUP_HOURS = int(os.getenv("ROLLUP_HOURS", "48"))
+
+# Optional semantic intents: a sentence-transformers model name enables them
+# (e.g. sentence-transformers/all-MiniLM-L6-v2); messages scoring below the
+# threshold fall back to keyword matching. The index is built on first start.
+INTENT_MODEL = os.getenv("INTENT_MODEL", "")
+INTENT_INDEX_PATH = os.getenv("INTENT_INDEX_PATH", "intent_index.npy")
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.55"))
+
+# Reply rule table (JSON, or YAML with PyYAML) and how often (seconds) to
+# check it for changes; 0 disables polling (SIGHUP still reloads)
+REPLY_RULES_PATH = os.getenv("REPLY_RULES_PATH") or DEFAULT_RULES_PATH
+REPLY_RULES_RELOAD_INTERVAL = float(os.getenv("REPLY_RULES_RELOAD_INTERVAL", "2"))
+
+# Replies cached by normalised message text (0 disables)
+REPLY_CACHE_SIZE = int(os.getenv("REPLY_CACHE_SIZE", "10000"))
+
+# A sender who already got a reply of the same category within this many
+# seconds is not sent it again (0, the default, disables it); the per-sender
+# index is bounded and forgets senders idle for SENDER_IDLE_TTL
+SENDER_REPLY_WINDOW = float(os.getenv("SENDER_REPLY_WINDOW", "0"))
+SENDER_INDEX_SIZE = int(os.getenv("SENDER_INDEX_SIZE", "100000"))
+SENDER_IDLE_TTL = float(os.getenv("SENDER_IDLE_TTL", "3600"))
+
+# Coalescing: hold a sender's messages until they pause this long, then send
+# one reply for the lot (0 = off, reply to each message). A burst is flushed
+# after COALESCE_MAX_WAIT_MS (default 3x the window) or COALESCE_MAX_MESSAGES
+# regardless. Filler categories don't pick the reply when a burst has more.
+COALESCE_WINDOW_MS = float(os.getenv("COALESCE_WINDOW_MS", "0"))
+COALESCE_MAX_WAIT_MS = float(os.getenv("COALESCE_MAX_WAIT_MS", str(COALESCE_WINDOW_MS * 3)))
+COALESCE_MAX_MESSAGES = int(os.getenv("COALESCE_MAX_MESSAGES", "5"))
+COALESCE_FILLER_CATEGORIES = frozenset(
+    c.strip() for c in os.getenv("COALESCE_FILLER_CATEGORIES", "greeting,thanks,default").split(",") if c.strip()
+)
+
+# Durable outbox (SQLite): reply jobs are committed before the webhook is
+# acknowledged and re-sent after a crash or failed send ("" = off).
+# OUTBOX_SYNC=full fsyncs every (grouped) commit; normal only at checkpoints.
+# OUTBOX_LEASE must exceed how long a job can sit in the send queue + retries,
+# and COALESCE_MAX_WAIT_MS: messages held by the coalescing window are
+# committed too, and resumed as a burst if their process dies mid-window.
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "")
+OUTBOX_SYNC = os.getenv("OUTBOX_SYNC", "full").lower()
+OUTBOX_DEAD_LETTER_PATH = os.getenv("OUTBOX_DEAD_LETTER_PATH") or None
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "30"))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "3600"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "300"))
+OUTBOX_REPLAY_INTERVAL = float(os.getenv("OUTBOX_REPLAY_INTERVAL", "5"))
+
+# Logging: level, json|text, and the fraction of webhook payloads dumped in full
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+
 # ══════════════════════════════════════════════════════════
 # LOGGING SETUP
 # ══════════════════════════════════════════════════════════
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# JSON lines written by a background listener thread, off the request path
+setup_logging(LOG_LEVEL, json_format=LOG_FORMAT == "json", use_queue=True)
 logger = logging.getLogger(__name__)
+payload_sampler = PayloadSampler(LOG_PAYLOAD_SAMPLE_RATE)
+
+# ══════════════════════════════════════════════════════════
+# METRICS
+# ══════════════════════════════════════════════════════════
+
+# Per-process counters and stage latencies for /metrics (Prometheus scrapes
+# each worker); the cross-worker totals on /stats live in the state backend
+metrics = MetricsRegistry()
+events_total = metrics.counter("autodm_events_total", "Webhook and delivery events handled by this process", ("event",))
+stage_seconds = metrics.histogram("autodm_stage_seconds", "Time spent in each stage of the reply pipeline", ("stage",))
 
 # ══════════════════════════════════════════════════════════
 # MESSAGE TRACKING
 # ══════════════════════════════════════════════════════════
 
-processed_messages = set()  # Prevent duplicate replies
-conversation_history = []    # Store all conversations
-stats = {
-    "total_received": 0,
-    "total_sent": 0,
-    "total_errors": 0,
-    "start_time": datetime.now().isoformat()
-}
+# Dedup + counters, shared across workers unless STATE_BACKEND=memory
+state = create_backend(STATE_BACKEND, DEDUP_MAX_SIZE, DEDUP_TTL_SECONDS, STATE_SQLITE_PATH, STATE_REDIS_URL)
+atexit.register(state.close)
+
+# Fixed-size ring of recent conversations
+conversation_history = ConversationLog(
+    capacity=CONVERSATION_BUFFER_SIZE,
+    spill_path=CONVERSATION_LOG_PATH,
+    max_bytes=CONVERSATION_LOG_MAX_BYTES,
+    backups=CONVERSATION_LOG_BACKUPS
+)
+atexit.register(conversation_history.close)
+
+# Every reply outcome, by sender / time / category (None when CONVERSATION_DB_PATH is unset)
+conversation_store = None
+if CONVERSATION_DB_PATH:
+    conversation_store = ConversationStore(CONVERSATION_DB_PATH, retention_days=CONVERSATION_DB_RETENTION_DAYS)
+    atexit.register(conversation_store.close)
+
+# Pending reply jobs that must survive a crash (None when OUTBOX_PATH is unset)
+outbox = None
+if OUTBOX_PATH:
+    outbox = Outbox(
+        OUTBOX_PATH,
+        dead_letter_path=OUTBOX_DEAD_LETTER_PATH,
+        sync=OUTBOX_SYNC,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        retry_base=OUTBOX_RETRY_BASE,
+        retry_max=OUTBOX_RETRY_MAX,
+        lease=OUTBOX_LEASE
+    )
+    atexit.register(outbox.close)
+
+# Last reply category / time per sender, for repeat suppression
+sender_index = SenderIndex(SENDER_REPLY_WINDOW, SENDER_INDEX_SIZE, SENDER_IDLE_TTL)
+
+# Replies per category per minute / hour, fed by classify_reply() and record_reply()
+rollups = CategoryRollups(ROLLUP_MINUTES, ROLLUP_HOURS)
+
+STARTED_AT = datetime.now()
+START_TIME = STARTED_AT.isoformat()
+recent_batches = deque(maxlen=20)  # Reports for the last batch-mode payloads
+
+def count(name, amount=1):
+    """Increment a stats counter in the shared state backend (and this process's metrics)"""
+    state.incr(name, amount)
+    if amount > 0:
+        events_total.labels(name).inc(amount)
+
+def current_stats():
+    """Counters aggregated across all workers using the same backend"""
+    counters = state.counters()
+    return {
+        "total_received": counters.get("total_received", 0),
+        "total_sent": counters.get("total_sent", 0),
+        "total_errors": counters.get("total_errors", 0),
+        "total_throttled": counters.get("total_throttled", 0),
+        "sends_saved": counters.get("replies_suppressed", 0) + counters.get("messages_coalesced", 0),
+        "start_time": START_TIME
+    }
+
+def uptime_seconds():
+    return (datetime.now() - STARTED_AT).total_seconds()
+
+# Replies are delivered off the request thread; drained on interpreter exit
+send_queue = SendQueue(workers=SEND_WORKERS, max_size=SEND_QUEUE_SIZE, put_timeout=SEND_QUEUE_TIMEOUT)
+atexit.register(send_queue.shutdown)
+
+# Shared keep-alive session for every send_dm call
+graph_client = GraphClient(
+    ACCESS_TOKEN,
+    MESSAGES_ENDPOINT,
+    pool_size=GRAPH_POOL_SIZE,
+    connect_timeout=GRAPH_CONNECT_TIMEOUT,
+    read_timeout=GRAPH_READ_TIMEOUT
+)
+
+def create_scheduler(client, account_rate, account_burst):
+    """Paces send_dm through `client` and re-queues throttled / failed sends with jittered backoff"""
+    return SendScheduler(
+        lambda recipient_id, text: send_dm_result(recipient_id, text, client),
+        resubmit=send_queue.submit,
+        account_rate=account_rate,
+        account_burst=account_burst,
+        recipient_rate=RECIPIENT_RATE_PER_SECOND,
+        recipient_burst=RECIPIENT_RATE_BURST,
+        max_retries=SEND_MAX_RETRIES,
+        base_delay=SEND_RETRY_BASE_DELAY
+    )
+
+# The default account's scheduler; other tenants get theirs on first use
+scheduler = create_scheduler(graph_client, SEND_RATE_PER_SECOND, SEND_RATE_BURST)
+
+metrics.gauge("autodm_send_queue_depth", "Reply jobs waiting for a send worker", lambda: send_queue.metrics()["depth"])
+metrics.gauge("autodm_retry_queue_depth", "Sends waiting for a scheduled retry", lambda: scheduler.metrics()["retry_queue"])
+metrics.gauge("autodm_uptime_seconds", "Seconds since this process started", lambda: round(uptime_seconds(), 3))
 
 # ══════════════════════════════════════════════════════════
 # FLASK APP
@@ -54,12 +282,9 @@ app = Flask(__name__)
 # HOME PAGE
 # ══════════════════════════════════════════════════════════
 
-@app.route("/")
-def home():
-    """Server status page"""
-    uptime = (datetime.now() - datetime.fromisoformat(stats['start_time'])).total_seconds()
-    
-    return f"""
+# Formatted once at startup; each request only fills in the live values,
+# which the page then keeps fresh by polling /stats/live
+HOME_TEMPLATE = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -199,23 +424,23 @@ def home():
                     <h2><span class="icon">📊</span> Live Statistics</h2>
                     <div class="stat-row">
                         <span class="stat-label">Messages Received</span>
-                        <span class="stat-value">{stats['total_received']}</span>
+                        <span class="stat-value" id="stat-total-received">{total_received}</span>
                     </div>
                     <div class="stat-row">
                         <span class="stat-label">Replies Sent</span>
-                        <span class="stat-value">{stats['total_sent']}</span>
+                        <span class="stat-value" id="stat-total-sent">{total_sent}</span>
                     </div>
                     <div class="stat-row">
                         <span class="stat-label">Errors</span>
-                        <span class="stat-value">{stats['total_errors']}</span>
+                        <span class="stat-value" id="stat-total-errors">{total_errors}</span>
                     </div>
                     <div class="stat-row">
                         <span class="stat-label">Conversations</span>
-                        <span class="stat-value">{len(conversation_history)}</span>
+                        <span class="stat-value" id="stat-conversations">{conversations}</span>
                     </div>
                     <div class="stat-row">
                         <span class="stat-label">Uptime</span>
-                        <span class="stat-value">{int(uptime)} seconds</span>
+                        <span class="stat-value"><span id="stat-uptime">{uptime}</span> seconds</span>
                     </div>
                 </div>
 
@@ -223,11 +448,11 @@ def home():
                     <h2><span class="icon">⚙️</span> Configuration</h2>
                     <div class="stat-row">
                         <span class="stat-label">Brand</span>
-                        <span class="stat-value">{BRAND_NAME}</span>
+                        <span class="stat-value">{brand}</span>
                     </div>
                     <div class="stat-row">
                         <span class="stat-label">Instagram ID</span>
-                        <span class="stat-value">{IG_ID}</span>
+                        <span class="stat-value">{ig_id}</span>
                     </div>
                     <div class="stat-row">
                         <span class="stat-label">Token Type</span>
@@ -239,7 +464,7 @@ def home():
                     </div>
                     <div class="stat-row">
                         <span class="stat-label">Verify Token</span>
-                        <span class="stat-value">{WEBHOOK_VERIFY_TOKEN}</span>
+                        <span class="stat-value">{verify_token}</span>
                     </div>
                 </div>
 
@@ -258,6 +483,22 @@ def home():
                             <span class="endpoint-method method-get">GET</span>
                             <code>/stats</code>
                         </li>
+                        <li>
+                            <span class="endpoint-method method-get">GET</span>
+                            <code>/stats/live</code>
+                        </li>
+                        <li>
+                            <span class="endpoint-method method-get">GET</span>
+                            <code>/stats/timeseries</code>
+                        </li>
+                        <li>
+                            <span class="endpoint-method method-get">GET</span>
+                            <code>/conversations</code>
+                        </li>
+                        <li>
+                            <span class="endpoint-method method-get">GET</span>
+                            <code>/metrics</code>
+                        </li>
                         <li>
                             <span class="endpoint-method method-get">GET</span>
                             <code>/test</code>
@@ -271,15 +512,57 @@ def home():
                 <p style="margin-top: 10px; opacity: 0.8;">Running 24/7 • Auto-responds in real-time</p>
             </div>
         </div>
+
+        <script>
+            // Refresh the numbers in place instead of reloading the page
+            const STAT_FIELDS = ['total_received', 'total_sent', 'total_errors', 'conversations', 'uptime'];
+
+            function refreshStats() {{
+                fetch('/stats/live')
+                    .then(r => r.json())
+                    .then(data => {{
+                        for (const field of STAT_FIELDS) {{
+                            document.getElementById('stat-' + field.replaceAll('_', '-')).textContent = data[field];
+                        }}
+                    }})
+                    .catch(err => console.error('Error loading stats:', err));
+            }}
+
+            setInterval(refreshStats, 5000);
+        </script>
     </body>
     </html>
     """
+home_page = PageShell(
+    HOME_TEMPLATE,
+    slots=("total_received", "total_sent", "total_errors", "conversations", "uptime"),
+    brand=BRAND_NAME,
+    ig_id=IG_ID,
+    verify_token=WEBHOOK_VERIFY_TOKEN
+)
+
+def live_stats():
+    """Just the numbers shown on the status page"""
+    stats = current_stats()
+    return {
+        "total_received": stats["total_received"],
+        "total_sent": stats["total_sent"],
+        "total_errors": stats["total_errors"],
+        "conversations": len(conversation_history),
+        "uptime": int(uptime_seconds())
+    }
+
+@app.route("/")
+def home():
+    """Server status page"""
+    return home_page.render(**live_stats())
 
 # ══════════════════════════════════════════════════════════
 # WEBHOOK ENDPOINT
 # ══════════════════════════════════════════════════════════
 
 @app.route("/webhook", methods=["GET", "POST"])
+@stage_seconds.labels("webhook").timed
 def webhook():
     """Handle webhook verification and DM events"""
     
@@ -289,182 +572,643 @@ def webhook():
         token = request.args.get("hub.verify_token")
         challenge = request.args.get("hub.challenge")
         
-        logger.info("="*60)
-        logger.info("🔍 WEBHOOK VERIFICATION REQUEST")
-        logger.info("="*60)
-        logger.info(f"Mode:          {mode}")
-        logger.info(f"Verify Token:  {token}")
-        logger.info(f"Challenge:     {challenge}")
-        logger.info("="*60)
-        
-        if mode == "subscribe" and token == WEBHOOK_VERIFY_TOKEN:
-            logger.info(" VERIFICATION SUCCESS - Returning challenge")
+        if verify_subscription(mode, token):
             return challenge, 200
         else:
-            logger.warning(" VERIFICATION FAILED")
-            logger.warning(f"Expected token: {WEBHOOK_VERIFY_TOKEN}")
-            logger.warning(f"Got token:      {token}")
             return "Forbidden", 403
     
     # ─── POST: Receive DM Events ───
     elif request.method == "POST":
         try:
-            data = request.get_json()
+            # Signature is over the exact bytes Meta sent, so check before parsing
+            body = request.get_data()
+            if not verify_signature(body, request.headers.get("X-Hub-Signature-256"), APP_SECRET):
+                log_event(logger, "webhook_signature_invalid", logging.WARNING, bytes=len(body))
+                events_total.labels("signature_invalid").inc()
+                return jsonify({"error": "invalid signature"}), 403
             
-            logger.info("="*60)
-            logger.info(" WEBHOOK EVENT RECEIVED")
-            logger.info("="*60)
-            logger.info(f"Payload: {json.dumps(data, indent=2)}")
-            logger.info("="*60)
+            # Full payload dumps are sampled; the body is logged as received
+            if payload_sampler.sample():
+                log_event(logger, "webhook_payload", payload=body.decode("utf-8", "replace"))
             
-            stats["total_received"] += 1
+            count("total_received")
+            webhook_events = parse_webhook(body, tenants.accounts)
+            note_ingress(webhook_events)
             
             # Process Instagram events
-            if 'entry' in data:
-                for entry in data['entry']:
-                    if 'messaging' in entry:
-                        for event in entry['messaging']:
-                            process_message_event(event)
+            queued = True
+            if WEBHOOK_BATCH_MODE:
+                queued = process_batch(webhook_events)
+            else:
+                for sender_id, message_id, text, recipient_id in webhook_events.messages:
+                    queued = process_message_event(sender_id, message_id, text, recipient_id) and queued
+            
+            # Send queue full: ask Instagram to redeliver; accepted events are deduped
+            if not queued:
+                return jsonify({"status": "busy"}), 503
             
             return jsonify({"status": "ok"}), 200
             
         except Exception as e:
-            logger.error(f" Error processing webhook: {e}")
-            import traceback
-            traceback.print_exc()
-            stats["total_errors"] += 1
+            logger.exception("webhook_error")
+            count("total_errors")
             return jsonify({"error": str(e)}), 500
 
+def note_ingress(webhook_events):
+    """Count the events ingress dropped, by reason (shared with asgi_app.py)"""
+    if webhook_events.prefiltered:
+        events_total.labels("ingress_prefiltered").inc()
+    for reason, dropped in webhook_events.dropped.items():
+        if dropped:
+            events_total.labels(f"ingress_{reason}").inc(dropped)
+
+def verify_subscription(mode, token):
+    """Whether a GET /webhook is Meta's subscription handshake with our token"""
+    success = mode == "subscribe" and token == WEBHOOK_VERIFY_TOKEN
+    log_event(logger, "webhook_verification", logging.INFO if success else logging.WARNING, mode=mode, success=success)
+    return success
+
 # ══════════════════════════════════════════════════════════
 # PROCESS MESSAGE EVENT
 # ══════════════════════════════════════════════════════════
 
-def process_message_event(event):
-    """Process incoming DM and send auto-reply"""
+@stage_seconds.labels("process_message").timed
+def process_message_event(sender_id, message_id, message_text, recipient_id=None):
+    """
+    Process incoming DM and queue the auto-reply from the account it was
+    sent to (recipient_id; None = the default account).
+    
+    Returns False only when the send queue is full, so the webhook can push back.
+    """
     try:
-        # Extract message details
-        sender_id = event.get('sender', {}).get('id')
-        recipient_id = event.get('recipient', {}).get('id')
-        message = event.get('message', {})
-        message_id = message.get('mid')
-        message_text = message.get('text', '')
-        
-        logger.info("-"*60)
-        logger.info(" MESSAGE DETAILS")
-        logger.info("-"*60)
-        logger.info(f"From:       {sender_id}")
-        logger.info(f"To:         {recipient_id}")
-        logger.info(f"Message ID: {message_id}")
-        logger.info(f"Text:       {message_text}")
-        logger.info("-"*60)
-        
-        # Validate message
-        if recipient_id != IG_ID:
-            logger.info(" Not for our account, skipping")
-            return
-        
-        if not message_text:
-            logger.info(" No text content, skipping")
-            return
-        
-        if message_id in processed_messages:
-            logger.info(" Already processed, skipping")
-            return
-        
-        # Mark as processed
-        processed_messages.add(message_id)
-        
-        # Generate reply
-        reply_text = generate_reply(message_text)
-        logger.info(f" Generated reply: {reply_text}")
+        job = accept_message(sender_id, message_id, message_text, recipient_id)
+        if job is None:
+            return True
         
-        # Send reply
-        success = send_dm(sender_id, reply_text)
+        # Queue reply for a send worker
+        message_id, sender_id, message_text, category, reply_text, recipient_id = job
+        if not send_queue.submit(deliver_reply, sender_id, message_id, message_text, category, reply_text,
+                                 recipient_id):
+            log_event(logger, "send_queue_full", logging.WARNING, message_id=message_id)
+            release_jobs([job])
+            return False
         
-        # Log conversation
-        conversation_history.append({
-            "timestamp": datetime.now().isoformat(),
-            "sender_id": sender_id,
-            "inbound": message_text,
-            "reply": reply_text,
-            "sent": success
-        })
+        return True
         
-    except Exception as e:
-        logger.error(f" Error processing message: {e}")
-        import traceback
-        traceback.print_exc()
-        stats["total_errors"] += 1
+    except (OutboxError, StateUnavailable):
+        return False  # un-marked; Instagram redelivers after the 503
+    except Exception:
+        logger.exception("message_error")
+        count("total_errors")
+        return True
 
-# ══════════════════════════════════════════════════════════
-# GENERATE AUTO-REPLY (15+ Keyword Categories)
-# ══════════════════════════════════════════════════════════
+class StateUnavailable(Exception):
+    """The state backend failed while marking messages as seen"""
 
-def generate_reply(text):
-    """Generate auto-reply based on message keywords"""
-    t = text.lower().strip()
+def mark_seen(message_ids):
+    """
+    state.add_many_if_absent, raising StateUnavailable if the backend fails.
+    Its reply may have been lost after the marks were written, so they are
+    removed again (best effort) to let Instagram's redelivery through.
+    """
+    try:
+        return state.add_many_if_absent(message_ids)
+    except (OSError, RespError):
+        logger.exception("state_backend_error")
+        count("total_errors")
+        forget_messages(message_ids)
+        raise StateUnavailable() from None
+
+def forget_messages(message_ids):
+    """Un-mark messages as seen; stops at the first error (the backend is still down)"""
+    try:
+        for message_id in message_ids:
+            state.discard(message_id)
+    except Exception:
+        logger.exception("state_backend_error")
+
+def accept_message(sender_id, message_id, message_text, recipient_id=None):
+    """
+    Everything before the send for one text DM that passed ingress (shared
+    with asgi_app.py).
     
-    # Greetings
-    if any(word in t for word in ["hi", "hello", "hey", "hola", "good morning", "good evening", "sup", "yo"]):
-        return f"Hi there!  Welcome to {BRAND_NAME}! How can I help you today?"
+    Returns the persisted (message_id, sender_id, text, category, reply,
+    recipient_id) job to send, or None if there is nothing to send. Raises
+    OutboxError when the job could not be persisted, StateUnavailable when
+    the dedup mark could not be confirmed (both already un-marked).
+    """
+    tenant = tenants.get(recipient_id)
+    if tenant is None:
+        log_event(logger, "message_skipped", logging.DEBUG, reason="unknown_account",
+                  message_id=message_id, recipient_id=recipient_id)
+        return None
     
-    # Price inquiries
-    if any(word in t for word in ["price", "cost", "how much", "$", "expensive", "cheap", "pricing"]):
-        return "Great question!  All our prices are shown on each post. Looking for something specific?"
+    # Mark as processed (atomic check-and-insert)
+    if not mark_seen([message_id])[0]:
+        log_event(logger, "message_skipped", logging.DEBUG, reason="duplicate", message_id=message_id)
+        return None
+    count("messages_processed")
     
-    # Shipping & delivery
-    if any(word in t for word in ["ship", "delivery", "deliver", "arrive", "tracking", "when will", "how long"]):
-        return " We ship fast! Most orders arrive in 3-5 business days. Need tracking info?"
+    # Held for the rest of the sender's burst; flush_burst() replies. It is
+    # committed to the outbox first, so a crash inside the window can't lose it
+    if coalescer is not None:
+        if not hold_messages([(message_id, sender_id, message_text, tenant.ig_id)]):
+            state.discard(message_id)
+            count("messages_processed", -1)
+            count("messages_rejected")
+            raise OutboxError(message_id)
+        if coalescer.add(sender_id, message_id, message_text, tenant.ig_id):
+            return None
+        release_held([message_id])  # shutting down: answered directly below
     
-    # Stock & availability
-    if any(word in t for word in ["stock", "available", "in stock", "out of stock", "restock", "sold out"]):
-        return "We restock regularly!  Follow us to stay updated. Want me to check a specific item?"
+    # Generate reply
+    category, reply_text = classify_reply(message_text, tenant)
     
-    # Returns & refunds
-    if any(word in t for word in ["return", "refund", "exchange", "money back", "cancel"]):
-        return "No worries!  We have a hassle-free return policy. Share your order number and I'll help!"
+    # Same reply already sent to this sender within the window
+    if not sender_index.should_reply(sender_id, category):
+        log_event(logger, "reply_suppressed", logging.DEBUG, sender_id=sender_id,
+                  message_id=message_id, category=category)
+        count("replies_suppressed")
+        return None
     
-    # Discounts & promotions
-    if any(word in t for word in ["discount", "coupon", "promo", "code", "deal", "sale", "offer"]):
-        return "Love a good deal!  Keep an eye on our feed — we drop exclusive promos regularly!"
+    # Commit the job before Instagram gets its 200
+    job = (message_id, sender_id, message_text, category, reply_text, tenant.ig_id)
+    if not persist_replies([job]):
+        release_jobs([job], persisted=False)
+        raise OutboxError(message_id)
+    return job
+
+def release_jobs(jobs, persisted=True):
+    """Accepted jobs that won't be sent: forget them so Instagram's redelivery is processed"""
+    for message_id, sender_id, _, category, _, _ in jobs:
+        if persisted:
+            unpersist_reply(message_id)
+        sender_index.release(sender_id, category)
+        state.discard(message_id)
+    count("messages_processed", -len(jobs))
+    count("messages_rejected", len(jobs))
+
+def deliver_reply(sender_id, message_id, message_text, category, reply_text, recipient_id=None):
+    """Send worker job: deliver the reply through the account's rate-limited scheduler"""
+    on_result = partial(record_reply, sender_id, message_id, message_text, category, reply_text,
+                        recipient_id=recipient_id, started=time.monotonic())
+    tenant = tenants.get(recipient_id)
+    if tenant is None:
+        # An outbox job for an account no longer configured
+        log_event(logger, "reply_unroutable", logging.ERROR, message_id=message_id, recipient_id=recipient_id)
+        return on_result(False)
+    tenant.scheduler.deliver(sender_id, reply_text, on_result)
+
+def record_reply(sender_id, message_id, message_text, category, reply_text, success, recipient_id=None,
+                 started=None):
+    """
+    Final outcome of a reply (possibly after retries): log the conversation.
+    started is the time.monotonic() at which a send worker picked it up.
+    """
+    rollups.outcome(category, success, time.monotonic() - started if started is not None else None)
+    if outbox is not None:
+        try:
+            if success:
+                outbox.done(message_id)
+            else:
+                outbox.fail(message_id, "send failed")
+        except Exception:
+            logger.exception("outbox_error")
+    if not success:
+        sender_index.release(sender_id, category)  # the sender never got it
+    conversation_history.append(sender_id, message_text, reply_text, success)
+    if conversation_store is not None:
+        conversation_store.add(sender_id, message_id, message_text, category, reply_text, success, recipient_id)
+    log_event(logger, "message", sender_id=sender_id, message_id=message_id,
+              text=message_text, category=category, reply=reply_text, sent=success)
+
+# ══════════════════════════════════════════════════════════
+# PROCESS WEBHOOK BATCH
+# ══════════════════════════════════════════════════════════
+
+@stage_seconds.labels("process_batch").timed
+def process_batch(webhook_events):
+    """
+    Dedup, reply to and queue every message in a payload at once.
     
-    # Product questions
-    if any(word in t for word in ["size", "color", "material", "spec", "detail", "dimension"]):
-        return "Good question!  Check the product post for full specs. Which item are you asking about?"
+    Each sender's replies become one send job (so they stay in order);
+    different senders are delivered concurrently by the send workers.
+    Returns False if any sender's job could not be queued.
+    """
+    accepted = accept_batch(webhook_events)
+    if accepted is None:
+        return False
+    groups, report = accepted
     
-    # Order status
-    if any(word in t for word in ["order", "purchase", "buy", "bought", "ordered"]):
-        return "Thanks for your order!  Check your email for confirmation. Questions about your order?"
+    queued = True
+    for (recipient_id, sender_id), items in groups.items():
+        if not send_queue.submit(deliver_group, sender_id, items, report, recipient_id):
+            log_event(logger, "send_queue_full", logging.WARNING, sender_id=sender_id, messages=len(items))
+            release_jobs(group_jobs(sender_id, items, recipient_id))
+            report.group_done(0, 0, rejected=len(items))
+            queued = False
+    return queued
+
+def accept_batch(webhook_events):
+    """
+    Everything before the sends for a payload's WebhookEvents (shared with
+    asgi_app.py).
     
-    # Thanks / gratitude
-    if any(word in t for word in ["thank", "thanks", "thx", "ty", "appreciate", "thank you"]):
-        return "You're welcome!  Anything else I can help with? I'm here!"
+    Returns ({(recipient_id, sender_id): [(message_id, text, category,
+    reply), ...]}, report) with every job persisted, or None if the outbox
+    or the state backend failed (answer 503). Each account's messages are planned with its
+    own rules. With coalescing on, messages are buffered and no groups
+    returned.
+    """
+    report = BatchReport(webhook_events.events, webhook_events.skipped, on_finish=batch_finished)
+    if coalescer is not None:
+        try:
+            held = coalesce_batch(webhook_events.messages)
+        except StateUnavailable:
+            return None
+        return ({}, report) if held else None
     
-    # Quality questions
-    if any(word in t for word in ["quality", "good", "worth", "recommend", "review", "rating"]):
-        return "All our products are carefully selected!  Check the ratings on each post. Interested in something specific?"
+    groups = {}
+    for recipient_id, messages in webhook_events.by_account().items():
+        tenant = tenants.get(recipient_id)
+        if tenant is None:
+            continue
+        try:
+            planned, duplicates, suppressed = plan_batch(
+                messages, mark_seen, partial(classify_replies, tenant=tenant), sender_index.should_reply
+            )
+        except StateUnavailable:
+            # Nothing is persisted yet: give back what earlier accounts accepted so the whole payload is redelivered
+            for (_, sender_id), items in groups.items():
+                for _, _, category, _ in items:
+                    sender_index.release(sender_id, category)
+            forget_messages([message_id for items in groups.values() for message_id, _, _, _ in items])
+            return None
+        report.duplicates += duplicates
+        report.suppressed += suppressed
+        for sender_id, items in planned.items():
+            groups[(tenant.ig_id, sender_id)] = items
+    replies = sum(len(items) for items in groups.values())
+    count("messages_processed", replies + report.suppressed)
+    if report.suppressed:
+        count("replies_suppressed", report.suppressed)
     
-    # Payment methods
-    if any(word in t for word in ["payment", "pay", "credit card", "paypal", "cash", "venmo"]):
-        return "We accept all major payment methods! 💳 Secure checkout. Link in bio!"
+    jobs = [job for (recipient_id, sender_id), items in groups.items()
+            for job in group_jobs(sender_id, items, recipient_id)]
+    if not persist_replies(jobs):
+        release_jobs(jobs, persisted=False)
+        return None
     
-    # Complaints / issues
-    if any(word in t for word in ["problem", "issue", "broken", "damaged", "wrong", "complaint"]):
-        return "I'm sorry to hear that! 😟 Let me help fix this. Can you share your order number or more details?"
+    report.expect(len(groups), replies)
+    return groups, report
+
+def group_jobs(sender_id, items, recipient_id=None):
+    """plan_batch items of one sender as (message_id, sender_id, text, category, reply, recipient_id) jobs"""
+    return [(message_id, sender_id, text, category, reply, recipient_id) for message_id, text, category, reply in items]
+
+def deliver_group(sender_id, items, report, recipient_id=None):
+    """
+    Send worker job: deliver one sender's replies in arrival order.
+
+    A reply that goes to the retry queue holds back the rest of the group;
+    they follow as a new deliver_group (report=None: the batch has already
+    counted them as retrying) once its final outcome is in.
+    """
+    sent = retrying = 0
+    try:
+        tenant = tenants.get(recipient_id)
+        if tenant is None:
+            # Jobs for an account no longer configured: every reply fails
+            log_event(logger, "reply_unroutable", logging.ERROR, sender_id=sender_id, messages=len(items),
+                      recipient_id=recipient_id)
+            for message_id, message_text, category, reply_text in items:
+                record_reply(sender_id, message_id, message_text, category, reply_text, False,
+                             recipient_id=recipient_id)
+            return
+        for position, (message_id, message_text, category, reply_text) in enumerate(items):
+            gate = RetryGate(partial(record_reply, sender_id, message_id, message_text, category, reply_text,
+                                     recipient_id=recipient_id, started=time.monotonic()))
+            outcome = tenant.scheduler.deliver(sender_id, reply_text, gate)
+            if outcome is None:
+                rest = items[position + 1:]
+                retrying += 1 + len(rest)
+                if rest:
+                    gate.hold(partial(deliver_group, sender_id, rest, None, recipient_id))
+                break
+            sent += outcome
+    finally:
+        # Anything not sent or awaiting retry (including after an exception) counts as failed
+        if report is not None:
+            report.group_done(sent, len(items) - sent - retrying, retrying=retrying)
+
+def batch_finished(report):
+    summary = report.as_dict()
+    recent_batches.append(summary)
+    log_event(logger, "batch", **summary)
+
+# ══════════════════════════════════════════════════════════
+# DURABLE OUTBOX
+# ══════════════════════════════════════════════════════════
+
+class OutboxError(Exception):
+    """A reply job could not be committed to the outbox"""
+
+def persist_replies(jobs, release=()):
+    """
+    Commit (message_id, sender_id, text, category, reply, recipient_id) jobs
+    to the outbox, dropping the held messages in `release` in the same
+    transaction.
     
-    # Contact / support
-    if any(word in t for word in ["contact", "call", "email", "support", "help", "customer service"]):
-        return "You've reached the right place! 💬 I'm here to help. What do you need assistance with?"
+    False if it failed; the caller then un-marks the messages and answers
+    503, so Instagram redelivers them instead of the replies being lost.
+    """
+    if outbox is None or not (jobs or release):
+        return True
+    try:
+        outbox.put_many(jobs, release)
+        return True
+    except Exception:
+        logger.exception("outbox_error")
+        count("total_errors")
+        return False
+
+def hold_messages(messages):
+    """
+    Commit (message_id, sender_id, text, recipient_id) messages entering the
+    coalescing window. False if it failed (the caller un-marks them and
+    answers 503, as for persist_replies).
+    """
+    if outbox is None or not messages:
+        return True
+    try:
+        outbox.hold_many(messages)
+        return True
+    except Exception:
+        logger.exception("outbox_error")
+        count("total_errors")
+        return False
+
+def release_held(message_ids):
+    """Held messages whose burst was answered without a job (or directly)"""
+    if outbox is not None:
+        try:
+            outbox.release(message_ids)
+        except Exception:
+            logger.exception("outbox_error")
+
+def unpersist_reply(message_id):
+    """Drop a job that never reached a send worker"""
+    if outbox is not None:
+        try:
+            outbox.remove(message_id)
+        except Exception:
+            logger.exception("outbox_error")
+
+def replay_reply(message_id, sender_id, message_text, category, reply_text, recipient_id=None):
+    """Outbox replay: queue a job that is due again (a retry, or left by a dead process)"""
+    return send_queue.submit(deliver_reply, sender_id, message_id, message_text, category, reply_text, recipient_id)
+
+def resume_burst(sender_id, messages, recipient_id=None):
+    """Outbox replay: messages held by a coalescing window whose process died before the burst was flushed"""
+    (coalescer.flush if coalescer is not None else flush_burst)(sender_id, messages, recipient_id)
+
+# Replays start once the app is up, beginning with whatever the last run left
+if outbox is not None:
+    outbox.watch(replay_reply, OUTBOX_REPLAY_INTERVAL, resume=resume_burst)
+
+# ══════════════════════════════════════════════════════════
+# COALESCE MESSAGE BURSTS
+# ══════════════════════════════════════════════════════════
+
+def flush_burst(sender_id, messages, recipient_id=None):
+    """Coalescer callback (timer thread): queue one reply for a sender's burst"""
+    job = accept_burst(sender_id, messages, recipient_id)
+    if job is None:
+        return
+    message_id, sender_id, message_text, category, reply_text, recipient_id = job
+    if not send_queue.submit(deliver_reply, sender_id, message_id, message_text, category, reply_text,
+                             recipient_id):
+        log_event(logger, "send_queue_full", logging.WARNING, sender_id=sender_id, messages=len(messages))
+        if outbox is not None:
+            return  # the burst is no longer held anywhere else; the poller replays the job
+        unpersist_reply(message_id)
+        sender_index.release(sender_id, category)
+        count("messages_processed", -len(messages))
+        count("messages_rejected", len(messages))
+
+def accept_burst(sender_id, messages, recipient_id=None):
+    """
+    Classify, suppress and persist one reply for a burst (shared with
+    asgi_app.py). The job is answered as the burst's last message, with
+    the whole burst as its text; None if there is nothing to send.
+    """
+    message_ids = [message_id for message_id, _ in messages]
+    tenant = tenants.get(recipient_id)
+    if tenant is None:
+        release_held(message_ids)
+        return None
+    texts = [text for _, text in messages]
+    category, reply_text = classify_burst(texts, tenant)
+    if len(messages) > 1:
+        count("messages_coalesced", len(messages) - 1)
+        log_event(logger, "burst_coalesced", logging.DEBUG, sender_id=sender_id,
+                  message_ids=message_ids, category=category)
     
-    # Yes/No responses
-    if t in ["yes", "yeah", "yep", "yup", "ok", "okay", "sure", "k"]:
-        return "Great! How can I assist you further? 😊"
+    if not sender_index.should_reply(sender_id, category):
+        count("replies_suppressed")
+        release_held(message_ids)
+        return None
     
-    if t in ["no", "nope", "nah", "not really"]:
-        return "No problem! Let me know if you change your mind or need anything else. 👍"
+    # The job replaces the held messages in one commit. If that fails they
+    # stay held, and the outbox poller resumes the burst once their lease
+    # runs out (sending now would leave no record and could send twice)
+    job = (message_ids[-1], sender_id, "\n".join(texts), category, reply_text, tenant.ig_id)
+    if not persist_replies([job], release=message_ids):
+        sender_index.release(sender_id, category)
+        return None
+    return job
+
+def coalesce_batch(messages):
+    """
+    Batch mode with coalescing: bulk dedup, hold, then buffer like single
+    events. False if the hold failed (messages un-marked: answer 503).
+    """
+    fresh = mark_seen([message_id for _, message_id, _, _ in messages])
+    kept = [m for m, is_new in zip(messages, fresh) if is_new]
+    count("messages_processed", len(kept))
+    if not hold_messages([(message_id, sender_id, text, recipient_id)
+                          for sender_id, message_id, text, recipient_id in kept]):
+        forget_messages([message_id for _, message_id, _, _ in kept])
+        count("messages_processed", -len(kept))
+        count("messages_rejected", len(kept))
+        return False
+    for sender_id, message_id, text, recipient_id in kept:
+        if not coalescer.add(sender_id, message_id, text, recipient_id):
+            coalescer.flush(sender_id, [(message_id, text)], recipient_id)  # shutting down; reply directly
+    return True
+
+# Off unless COALESCE_WINDOW_MS is set; close() flushes open bursts on exit
+# (registered after the send queue, so it runs before the queue drains)
+coalescer = None
+if COALESCE_WINDOW_MS > 0:
+    coalescer = MessageCoalescer(
+        COALESCE_WINDOW_MS / 1000, flush_burst,
+        max_wait=COALESCE_MAX_WAIT_MS / 1000,
+        max_messages=COALESCE_MAX_MESSAGES
+    )
+    atexit.register(coalescer.close)
+
+# ══════════════════════════════════════════════════════════
+# GENERATE AUTO-REPLY (15+ Keyword Categories)
+# ══════════════════════════════════════════════════════════
+
+# Categories, keywords and replies come from reply_rules.json (shared with
+# lambda_handler.py). Edits are picked up without a restart: the file is
+# polled, and SIGHUP forces a reload. Requests read rule_store.snapshot
+# once, so a swap never mixes two tables within one request. "{brand}" is
+# left in the compiled replies and filled per tenant.
+rule_store = RuleStore(REPLY_RULES_PATH, brand=None)
+rule_store.watch(REPLY_RULES_RELOAD_INTERVAL)
+rule_store.reload_on_signal()
+
+# Example messages per category for the semantic classifier (INTENT_MODEL)
+INTENT_EXAMPLES = {
+    "greeting": ["hi", "hello there", "hey!", "good morning", "hola, anyone here?", "yo what's up"],
+    "price": ["how much is this?", "what's the price", "is it expensive?", "how much does it cost",
+              "price please", "what do you charge for the hoodie"],
+    "shipping": ["when will my order arrive?", "do you ship internationally", "how long is delivery",
+                 "can I get a tracking number", "when does it ship", "is shipping free"],
+    "stock": ["is this still available?", "do you have it in stock", "when will you restock",
+              "is the black one sold out", "any left in medium?", "will this come back"],
+    "returns": ["I want to return this", "can I get a refund", "how do I exchange an item",
+                "I'd like my money back", "please cancel my order", "what is your return policy"],
+    "discounts": ["any discount codes?", "do you have a promo", "is there a sale coming",
+                  "got a coupon for first order", "any deals right now", "student discount?"],
+    "product": ["what size should I get", "what material is it made of", "does it come in blue",
+                "what are the dimensions", "more details on this one please", "is it true to size"],
+    "order": ["I placed an order yesterday", "where is my order", "I want to buy this",
+              "how do I purchase", "I ordered two of these", "can I add to my order"],
+    "thanks": ["thank you!", "thanks so much", "ty", "appreciate it", "thx", "you're the best, thanks"],
+    "quality": ["is the quality good?", "would you recommend it", "is it worth the money",
+                "how are the reviews", "does it hold up well", "what's the rating"],
+    "payment": ["what payment methods do you accept", "can I pay with paypal", "do you take credit cards",
+                "is venmo ok", "can I pay cash on delivery", "my payment didn't go through"],
+    "complaint": ["my item arrived broken", "this is the wrong size", "I have a problem with my order",
+                  "the package was damaged", "very disappointed", "it stopped working after a day"],
+    "support": ["how can I contact you", "I need help", "can I talk to customer service",
+                "what's your support email", "can someone call me", "is there a person I can talk to"],
+    "yes": ["yes", "yeah sure", "yep", "okay", "sounds good", "ok"],
+    "no": ["no", "nope", "no thanks", "not really", "nah", "I'm good, no"],
+}
+
+# None unless INTENT_MODEL is set and its dependencies are installed
+intent_classifier = create_intent_classifier(INTENT_MODEL, INTENT_EXAMPLES, INTENT_INDEX_PATH, INTENT_THRESHOLD)
+
+# Near-identical DMs ("hi", "Hi!!", "hiii") share one cache entry; cleared
+# whenever the rule table's version changes
+reply_cache = ReplyCache(REPLY_CACHE_SIZE)
+
+def classify_messages(texts, tenant=None):
+    """(category, reply) per text, from the tenant's rule cache or classify_uncached()"""
+    tenant = tenant or default_tenant
+    store, cache = tenant.rules
+    snapshot = store.snapshot
+    results = cache.get_many(
+        texts, partial(classify_uncached, snapshot.matcher), snapshot.version, snapshot.normalize
+    )
+    return [(category, tenant.fill(reply)) for category, reply in results]
+
+def classify_uncached(matcher, texts):
+    """Semantic intent when confident (and still in the rule table), else keywords"""
+    if intent_classifier is None:
+        return matcher.match_many(texts)
+    try:
+        intents = intent_classifier.classify_many(texts)
+    except Exception:
+        logger.exception("intent_classifier_error")
+        return matcher.match_many(texts)
+    results = []
+    for text, (category, _) in zip(texts, intents):
+        reply = matcher.by_category.get(category)
+        if reply is None:
+            events_total.labels("intent_fallback").inc()
+            results.append(matcher.match(text))
+        else:
+            events_total.labels("intent_classified").inc()
+            results.append((category, reply))
+    return results
+
+@stage_seconds.labels("generate_reply").timed
+def classify_reply(text, tenant=None):
+    """(category, reply) for one message; the category is counted in the rollups"""
+    result = classify_messages([text], tenant)[0]
+    rollups.classified((result[0],))
+    return result
+
+@stage_seconds.labels("generate_replies").timed
+def classify_replies(texts, tenant=None):
+    """Batch version of classify_reply (one embedding batch for all texts)"""
+    results = classify_messages(texts, tenant)
+    rollups.classified([category for category, _ in results])
+    return results
+
+def classify_burst(texts, tenant=None):
+    """
+    (category, reply) for a coalesced burst, classified as one text.
     
-    # Default response
-    return f"Hey! 👋 Thanks for reaching out to {BRAND_NAME}. How can I help you today?"
+    Filler ("hey", "thanks") is dropped first when the burst has more, so a
+    greeting in front of the question doesn't outrank it.
+    """
+    if len(texts) == 1:
+        return classify_reply(texts[0], tenant)
+    substantive = [
+        text for text, (category, _) in zip(texts, classify_messages(texts, tenant))
+        if category not in COALESCE_FILLER_CATEGORIES
+    ]
+    return classify_reply(" ".join(substantive or texts), tenant)
+
+def generate_reply(text):
+    """Generate auto-reply based on message intent / keywords (classify_reply() for its category too)"""
+    return classify_reply(text)[1]
+
+def generate_replies(texts):
+    return [reply for _, reply in classify_replies(texts)]
+
+# ══════════════════════════════════════════════════════════
+# TENANTS
+# ══════════════════════════════════════════════════════════
+
+# Rule tables by file, each with its own reply cache. Compiled with "{brand}"
+# left in, so every tenant on a file shares both (Tenant.fill adds the brand).
+rule_books = {REPLY_RULES_PATH: (rule_store, reply_cache)}
+
+def rule_book(path):
+    book = rule_books.get(path)
+    if book is None:
+        store = RuleStore(path, brand=None)
+        store.watch(REPLY_RULES_RELOAD_INTERVAL)
+        book = rule_books[path] = (store, ReplyCache(REPLY_CACHE_SIZE))
+    return book
+
+def setup_tenant(tenant):
+    """TenantRegistry hook, on a tenant's first message: its client (on the shared pool), rules and scheduler"""
+    client = graph_client.for_account(tenant.access_token, f"{GRAPH_API_BASE}/{tenant.ig_id}/messages")
+    scheduler = create_scheduler(
+        client,
+        SEND_RATE_PER_SECOND if tenant.send_rate is None else tenant.send_rate,
+        SEND_RATE_BURST if tenant.send_burst is None else tenant.send_burst
+    )
+    return client, rule_book(tenant.rules_path or REPLY_RULES_PATH), scheduler
+
+# The INSTAGRAM_USER_ID account, set up with the objects above. Without an
+# ID it stands in for any account, unless TENANTS_PATH lists the accounts.
+default_tenant = Tenant(IG_ID, ACCESS_TOKEN, BRAND_NAME)
+default_tenant.client, default_tenant.rules, default_tenant.scheduler = graph_client, (rule_store, reply_cache), scheduler
+tenants = TenantRegistry(setup_tenant, default=default_tenant if IG_ID or not TENANTS_PATH else None)
+if TENANTS_PATH:
+    tenants.load(TENANTS_PATH)
+
+metrics.gauge("autodm_tenants_active", "Accounts that have received a message since startup", lambda: tenants.stats()["active"])
 
 # ══════════════════════════════════════════════════════════
 # SEND DM VIA INSTAGRAM GRAPH API
@@ -476,51 +1220,32 @@ def send_dm(recipient_id, text):
     
     Endpoint: POST https://graph.instagram.com/v24.0/{ig-user-id}/messages
     """
-    
-    payload = {
-        "recipient": {"id": recipient_id},
-        "message": {"text": text[:1000]}  # Instagram 1000 char limit
-    }
-    
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
+    return send_dm_result(recipient_id, text).ok
+
+@stage_seconds.labels("send_dm").timed
+def send_dm_result(recipient_id, text, client=None):
+    """Single send attempt (default account unless `client`); returns a SendResult with the parsed error / throttle info"""
     try:
-        logger.info(f" Sending DM to {recipient_id}...")
-        logger.info(f"Endpoint: {MESSAGES_ENDPOINT}")
-        
-        response = requests.post(
-            MESSAGES_ENDPOINT,
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        
-        logger.info(f"Response Status: {response.status_code}")
-        logger.info(f"Response Body: {response.text}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            msg_id = result.get('message_id', 'unknown')
-            logger.info(f" Reply sent successfully! (msg_id: {msg_id})")
-            stats["total_sent"] += 1
-            return True
-        else:
-            error_data = response.json()
-            error_msg = error_data.get('error', {}).get('message', response.text)
-            error_code = error_data.get('error', {}).get('code', 'unknown')
-            logger.error(f" Send failed ({response.status_code}, code: {error_code}): {error_msg}")
-            stats["total_errors"] += 1
-            return False
-    
+        result = SendResult.from_response((client or graph_client).send_message(recipient_id, text))
     except Exception as e:
-        logger.error(f" Send error: {e}")
-        import traceback
-        traceback.print_exc()
-        stats["total_errors"] += 1
-        return False
+        logger.exception("dm_error")
+        count("total_errors")
+        return SendResult.from_exception(e)
+    return note_send_result(recipient_id, result)
+
+def note_send_result(recipient_id, result):
+    """Log and count one send attempt's SendResult (shared with asgi_app.py)"""
+    if result.ok:
+        log_event(logger, "dm_sent", logging.DEBUG, recipient_id=recipient_id, msg_id=result.message_id)
+        count("total_sent")
+        return result
+    
+    # Throttling is tracked separately: the scheduler backs off and retries it
+    log_event(logger, "dm_failed", logging.WARNING if result.throttled else logging.ERROR,
+              recipient_id=recipient_id, status=result.status, error_code=result.error_code,
+              error=result.error_message, throttled=result.throttled)
+    count("total_throttled" if result.throttled else "total_errors")
+    return result
 
 # ══════════════════════════════════════════════════════════
 # STATS ENDPOINT (JSON)
@@ -529,11 +1254,14 @@ def send_dm(recipient_id, text):
 @app.route("/stats")
 def get_stats():
     """Return statistics as JSON"""
-    uptime = (datetime.now() - datetime.fromisoformat(stats['start_time'])).total_seconds()
+    return jsonify(stats_payload())
+
+def stats_payload():
+    stats = current_stats()
     
-    return jsonify({
+    return {
         "timestamp": datetime.now().isoformat(),
-        "uptime_seconds": uptime,
+        "uptime_seconds": uptime_seconds(),
         "config": {
             "ig_id": IG_ID,
             "brand": BRAND_NAME,
@@ -542,18 +1270,84 @@ def get_stats():
         },
         "stats": stats,
         "conversations": len(conversation_history),
-        "messages_processed": len(processed_messages),
-        "recent_conversations": conversation_history[-5:]  # Last 5
-    })
+        "messages_processed": state.counters().get("messages_processed", 0),
+        "dedup": state.dedup_stats(),
+        "send_queue": send_queue.metrics(),
+        "scheduler": scheduler.metrics(),
+        "tenants": tenants.stats(),
+        "recent_batches": list(recent_batches),
+        "conversation_log": conversation_history.stats(),
+        "conversation_store": conversation_store.stats() if conversation_store is not None else None,
+        "rollups": rollups.stats(),
+        "reply_cache": reply_cache.stats(),
+        "reply_rules": rule_store.stats(),
+        "sender_state": sender_index.stats(),
+        "coalescing": coalescer.stats() if coalescer is not None else None,
+        "outbox": outbox.stats() if outbox is not None else None,
+        "metrics": metrics.summary(),
+        "recent_conversations": conversation_history.recent(5)  # Last 5
+    }
+
+@app.route("/conversations")
+def get_conversations():
+    """Stored conversations, newest first: ?sender=&category=&account=&since=&until=&limit=&cursor="""
+    payload, status = conversations_payload(request.args)
+    return jsonify(payload), status
+
+def conversations_payload(args):
+    """One page from the conversation store for the query parameters in `args`; returns (payload, status)"""
+    if conversation_store is None:
+        return {"error": "conversation store is off (set CONVERSATION_DB_PATH)"}, 404
+    try:
+        records, next_cursor = conversation_store.query(
+            sender=args.get("sender") or None,
+            category=args.get("category") or None,
+            account=args.get("account") or None,
+            since=parse_time(args.get("since")),
+            until=parse_time(args.get("until")),
+            limit=int(args.get("limit") or 50),
+            cursor=args.get("cursor") or None
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return {"conversations": records, "count": len(records), "next": next_cursor}, 200
+
+@app.route("/stats/timeseries")
+def get_timeseries():
+    """Per-category rollups: ?window=minute|hour&last=<buckets>&category=<name>[,<name>...]"""
+    payload, status = timeseries_payload(request.args)
+    return jsonify(payload), status
+
+def timeseries_payload(args):
+    """The rollups for the query parameters in `args`; returns (payload, status)"""
+    categories = args.get("category")
+    try:
+        series = rollups.timeseries(
+            window=args.get("window") or None,
+            last=int(args.get("last") or 0),
+            categories={c for c in categories.split(",") if c} if categories else None
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return {"timestamp": datetime.now().isoformat(), "windows": series}, 200
+
+@app.route("/metrics")
+def get_metrics():
+    """This process's counters and stage latencies in Prometheus text format"""
+    return metrics.render(), 200, {"Content-Type": METRICS_CONTENT_TYPE}
+
+@app.route("/stats/live")
+def get_live_stats():
+    """Small JSON feed polled by the status and test pages"""
+    return jsonify(live_stats())
 
 # ══════════════════════════════════════════════════════════
 # TEST PAGE
 # ══════════════════════════════════════════════════════════
 
-@app.route("/test")
-def test_page():
-    """Interactive test page"""
-    return f"""
+# Nothing on the test page changes while the process runs, so it is
+# rendered once and served with an ETag / Last-Modified for 304s
+TEST_TEMPLATE = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -687,11 +1481,11 @@ def test_page():
                 const event = {{
                     object: "instagram",
                     entry: [{{
-                        id: "{IG_ID}",
+                        id: "{ig_id}",
                         time: Math.floor(Date.now() / 1000),
                         messaging: [{{
                             sender: {{ id: "test_" + Date.now() }},
-                            recipient: {{ id: "{IG_ID}" }},
+                            recipient: {{ id: "{ig_id}" }},
                             timestamp: Math.floor(Date.now() / 1000),
                             message: {{
                                 mid: "mid.test_" + Date.now(),
@@ -736,10 +1530,10 @@ def test_page():
                 const event = {{
                     object: "instagram",
                     entry: [{{
-                        id: "{IG_ID}",
+                        id: "{ig_id}",
                         messaging: [{{
                             sender: {{ id: "custom_test_" + Date.now() }},
-                            recipient: {{ id: "{IG_ID}" }},
+                            recipient: {{ id: "{ig_id}" }},
                             message: {{
                                 mid: "mid.custom_" + Date.now(),
                                 text: msg
@@ -767,16 +1561,16 @@ def test_page():
             }}
             
             function loadStats() {{
-                fetch('/stats')
+                fetch('/stats/live')
                     .then(r => r.json())
                     .then(data => {{
                         document.getElementById('stats-display').innerHTML = 
                             '<div style="background: white; padding: 15px; border-radius: 5px;">' +
-                            '<strong>Messages Received:</strong> ' + data.stats.total_received + '<br>' +
-                            '<strong>Replies Sent:</strong> ' + data.stats.total_sent + '<br>' +
-                            '<strong>Errors:</strong> ' + data.stats.total_errors + '<br>' +
+                            '<strong>Messages Received:</strong> ' + data.total_received + '<br>' +
+                            '<strong>Replies Sent:</strong> ' + data.total_sent + '<br>' +
+                            '<strong>Errors:</strong> ' + data.total_errors + '<br>' +
                             '<strong>Conversations:</strong> ' + data.conversations + '<br>' +
-                            '<strong>Uptime:</strong> ' + data.uptime_seconds.toFixed(0) + ' seconds' +
+                            '<strong>Uptime:</strong> ' + data.uptime + ' seconds' +
                             '</div>';
                     }})
                     .catch(err => {{
@@ -790,25 +1584,21 @@ def test_page():
     </body>
     </html>
     """
+test_page_static = StaticPage(TEST_TEMPLATE, ig_id=IG_ID)
+
+@app.route("/test")
+def test_page():
+    """Interactive test page"""
+    return test_page_static.respond(request.headers)
 
 # ══════════════════════════════════════════════════════════
 # RUN SERVER
 # ══════════════════════════════════════════════════════════
 
 if __name__ == '__main__':
-    logger.info("="*60)
-    logger.info(" INSTAGRAM AUTO DM WEBHOOK SERVER (PRODUCTION)")
-    logger.info("="*60)
-    logger.info(f"Brand:            {BRAND_NAME}")
-    logger.info(f"Instagram ID:     {IG_ID}")
-    logger.info(f"Token Type:       Instagram User Access Token (IGAA...)")
-    logger.info(f"API Version:      v24.0")
-    logger.info(f"Messages API:     {MESSAGES_ENDPOINT}")
-    logger.info(f"Verify Token:     {WEBHOOK_VERIFY_TOKEN}")
-    logger.info("="*60)
-    logger.info("\n Server starting on port 5000...")
-    logger.info(" This server runs independently of your Jupyter notebook")
-    logger.info(" It will respond to DMs in real-time 24/7")
-    logger.info("\n")
+    log_event(logger, "server_start", brand=BRAND_NAME, ig_id=IG_ID, api_version="v24.0",
+              messages_api=MESSAGES_ENDPOINT, port=5000, send_workers=SEND_WORKERS,
+              state_backend=STATE_BACKEND, batch_mode=WEBHOOK_BATCH_MODE, tenants=len(tenants),
+              signature_check=bool(APP_SECRET), json_backend=JSON_BACKEND)
     
     app.run(host='0.0.0.0', port=5000, debug=False)  # Set debug=False for production
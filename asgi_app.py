@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from functools import partial
+from urllib.parse import parse_qs
+
+import app as core
+from graph_client import AsyncGraphClient, SendResult
+from ingress import parse_webhook, verify_signature
+from structured_log import log_event
+
+# ══════════════════════════════════════════════════════════
+# ASGI ENTRY POINT
+# ══════════════════════════════════════════════════════════
+#
+# The same routes as app.py with async handlers, for when slow Graph API
+# calls (not CPU) cap throughput: in Flask each in-flight send holds a
+# worker thread for up to GRAPH_READ_TIMEOUT, here it is a suspended
+# coroutine.
+#
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000 --workers 2
+#
+# Configuration, dedup, rules, reply cache, sender index, outbox and stats
+# are app.py's own objects; only the send path differs:
+#   - replies are asyncio tasks sent through one pooled httpx client (each
+#     tenant's token on the same pool), paced by the account's SendScheduler
+#     and retried with asyncio.sleep
+#   - ASGI_SEND_CONCURRENCY caps Graph API calls in flight
+#   - ASGI_MAX_PENDING caps reply tasks; beyond it the webhook answers 503
+#     so Instagram redelivers (the send queue's backpressure, here)
+# Outbox replays stay on app.py's send workers; they are rare.
+
+ASGI_SEND_CONCURRENCY = int(os.getenv("ASGI_SEND_CONCURRENCY", "100"))
+ASGI_MAX_PENDING = int(os.getenv("ASGI_MAX_PENDING", str(core.SEND_QUEUE_SIZE)))
+ASGI_SHUTDOWN_TIMEOUT = float(os.getenv("ASGI_SHUTDOWN_TIMEOUT", "30"))
+
+logger = logging.getLogger(__name__)
+
+graph_client = AsyncGraphClient(
+    core.ACCESS_TOKEN,
+    core.MESSAGES_ENDPOINT,
+    pool_size=ASGI_SEND_CONCURRENCY,
+    connect_timeout=core.GRAPH_CONNECT_TIMEOUT,
+    read_timeout=core.GRAPH_READ_TIMEOUT
+)
+account_clients = {}  # tenant IG ID -> AsyncGraphClient on graph_client's pool
+send_slots = asyncio.Semaphore(ASGI_SEND_CONCURRENCY)
+pending = set()  # reply tasks not finished yet
+loop = None      # the server's event loop, set at startup
+
+# Shared state calls are microseconds in memory but disk / network I/O with
+# SQLite, Redis, the outbox or an embedding model; those go to a thread
+BLOCKING = core.STATE_BACKEND != "memory" or core.outbox is not None or core.intent_classifier is not None
+
+core.metrics.gauge("autodm_asgi_pending_replies", "Reply tasks not finished yet", lambda: len(pending))
+
+async def run_sync(fn, *args):
+    if BLOCKING:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+# ══════════════════════════════════════════════════════════
+# SEND PATH
+# ══════════════════════════════════════════════════════════
+
+def spawn(coro):
+    """Run a reply task in the background, keeping a reference until it ends"""
+    task = asyncio.create_task(guarded(coro))
+    pending.add(task)
+    task.add_done_callback(pending.discard)
+
+def has_room(jobs=1):
+    return len(pending) + jobs <= ASGI_MAX_PENDING
+
+async def guarded(coro):
+    try:
+        await coro
+    except Exception:
+        logger.exception("send_error")
+        core.count("total_errors")
+
+def account_client(tenant):
+    if tenant is core.default_tenant:
+        return graph_client
+    client = account_clients.get(tenant.ig_id)
+    if client is None:
+        client = account_clients[tenant.ig_id] = graph_client.for_account(
+            tenant.access_token, f"{core.GRAPH_API_BASE}/{tenant.ig_id}/messages"
+        )
+    return client
+
+async def send_dm_result(recipient_id, text, client=None):
+    """Single send attempt (default account unless `client`); returns a SendResult with the parsed error / throttle info"""
+    with core.stage_seconds.labels("send_dm").time():
+        try:
+            async with send_slots:
+                response = await (client or graph_client).send_message(recipient_id, text)
+            result = SendResult.from_response(response)
+        except Exception as e:
+            logger.exception("dm_error")
+            core.count("total_errors")
+            return SendResult.from_exception(e)
+    return core.note_send_result(recipient_id, result)
+
+async def deliver_reply(message_id, sender_id, message_text, category, reply_text, recipient_id=None):
+    """Pace, send (with retries) and record one reply job, from the account it was sent to"""
+    started = time.monotonic()
+    tenant = core.tenants.get(recipient_id)
+    ok = False
+    if tenant is not None:
+        send = partial(send_dm_result, client=account_client(tenant))
+        ok = await tenant.scheduler.deliver_async(sender_id, reply_text, send)
+    await run_sync(core.record_reply, sender_id, message_id, message_text, category, reply_text, ok, recipient_id,
+                   started)
+    return ok
+
+async def deliver_group(sender_id, items, report, recipient_id=None):
+    """One sender's batch replies, in arrival order"""
+    sent = 0
+    try:
+        for message_id, message_text, category, reply_text in items:
+            sent += await deliver_reply(message_id, sender_id, message_text, category, reply_text, recipient_id)
+    finally:
+        report.group_done(sent, len(items) - sent)
+
+async def deliver_burst(sender_id, messages, recipient_id=None):
+    job = await run_sync(core.accept_burst, sender_id, messages, recipient_id)
+    if job is not None:
+        await deliver_reply(*job)
+
+def flush_burst(sender_id, messages, recipient_id=None):
+    """Coalescer callback (its timer thread): hand the burst to the event loop"""
+    if loop is None:
+        return core.flush_burst(sender_id, messages, recipient_id)
+    asyncio.run_coroutine_threadsafe(guarded(deliver_burst(sender_id, messages, recipient_id)), loop)
+
+# ══════════════════════════════════════════════════════════
+# WEBHOOK PROCESSING
+# ══════════════════════════════════════════════════════════
+
+async def process_message_event(sender_id, message_id, message_text, recipient_id=None):
+    """Accept one DM and start its reply; False = no room, answer 503"""
+    with core.stage_seconds.labels("process_message").time():
+        if not has_room():
+            log_event(logger, "send_queue_full", logging.WARNING, pending=len(pending))
+            return False
+        try:
+            job = await run_sync(core.accept_message, sender_id, message_id, message_text, recipient_id)
+        except (core.OutboxError, core.StateUnavailable):
+            return False
+        except Exception:
+            logger.exception("message_error")
+            core.count("total_errors")
+            return True
+        if job is not None:
+            spawn(deliver_reply(*job))
+        return True
+
+async def process_batch(webhook_events):
+    """Batch mode: accept the payload at once, one reply task per sender"""
+    with core.stage_seconds.labels("process_batch").time():
+        if not has_room():
+            log_event(logger, "send_queue_full", logging.WARNING, pending=len(pending))
+            return False
+        accepted = await run_sync(core.accept_batch, webhook_events)
+        if accepted is None:
+            return False
+        groups, report = accepted
+        for (recipient_id, sender_id), items in groups.items():
+            spawn(deliver_group(sender_id, items, report, recipient_id))
+        return True
+
+# ══════════════════════════════════════════════════════════
+# ROUTES
+# ══════════════════════════════════════════════════════════
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+HTML_HEADERS = {"Content-Type": "text/html; charset=utf-8"}
+TEXT_HEADERS = {"Content-Type": "text/plain; charset=utf-8"}
+
+def json_response(payload, status=200):
+    return json.dumps(payload), status, JSON_HEADERS
+
+async def home(request):
+    stats = await run_sync(core.live_stats)
+    return core.home_page.render(**stats), 200, HTML_HEADERS
+
+async def webhook(request):
+    with core.stage_seconds.labels("webhook").time():
+        if request["method"] == "GET":
+            params = {k: v[0] for k, v in parse_qs(request["query_string"]).items()}
+            if core.verify_subscription(params.get("hub.mode"), params.get("hub.verify_token")):
+                return params.get("hub.challenge", ""), 200, TEXT_HEADERS
+            return "Forbidden", 403, TEXT_HEADERS
+
+        try:
+            body = request["body"]
+            if not verify_signature(body, request["headers"].get("X-Hub-Signature-256"), core.APP_SECRET):
+                log_event(logger, "webhook_signature_invalid", logging.WARNING, bytes=len(body))
+                core.events_total.labels("signature_invalid").inc()
+                return json_response({"error": "invalid signature"}, 403)
+            if core.payload_sampler.sample():
+                log_event(logger, "webhook_payload", payload=body.decode("utf-8", "replace"))
+            core.count("total_received")
+            webhook_events = parse_webhook(body, core.tenants.accounts)
+            core.note_ingress(webhook_events)
+
+            queued = True
+            if core.WEBHOOK_BATCH_MODE:
+                queued = await process_batch(webhook_events)
+            else:
+                for sender_id, message_id, text, recipient_id in webhook_events.messages:
+                    queued = await process_message_event(sender_id, message_id, text, recipient_id) and queued
+
+            if not queued:
+                return json_response({"status": "busy"}, 503)
+            return json_response({"status": "ok"})
+        except Exception as e:
+            logger.exception("webhook_error")
+            core.count("total_errors")
+            return json_response({"error": str(e)}, 500)
+
+async def stats(request):
+    payload = await run_sync(core.stats_payload)
+    payload["asgi"] = {
+        "pending_replies": len(pending),
+        "max_pending": ASGI_MAX_PENDING,
+        "send_concurrency": ASGI_SEND_CONCURRENCY
+    }
+    return json_response(payload)
+
+async def conversations(request):
+    params = {k: v[0] for k, v in parse_qs(request["query_string"]).items()}
+    payload, status = await run_sync(core.conversations_payload, params)
+    return json_response(payload, status)
+
+async def timeseries(request):
+    params = {k: v[0] for k, v in parse_qs(request["query_string"]).items()}
+    payload, status = await run_sync(core.timeseries_payload, params)
+    return json_response(payload, status)
+
+async def live_stats(request):
+    return json_response(await run_sync(core.live_stats))
+
+async def metrics(request):
+    return core.metrics.render(), 200, {"Content-Type": core.METRICS_CONTENT_TYPE}
+
+async def test_page(request):
+    return core.test_page_static.respond(request["headers"])
+
+ROUTES = {
+    "/": (home, ("GET",)),
+    "/webhook": (webhook, ("GET", "POST")),
+    "/stats": (stats, ("GET",)),
+    "/stats/live": (live_stats, ("GET",)),
+    "/stats/timeseries": (timeseries, ("GET",)),
+    "/conversations": (conversations, ("GET",)),
+    "/metrics": (metrics, ("GET",)),
+    "/test": (test_page, ("GET",)),
+}
+
+# ══════════════════════════════════════════════════════════
+# ASGI PLUMBING
+# ══════════════════════════════════════════════════════════
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    route = ROUTES.get(scope["path"].rstrip("/") or "/")
+    if route is None:
+        return await respond(send, "Not Found", 404, TEXT_HEADERS)
+    handler, methods = route
+    if scope["method"] not in methods:
+        return await respond(send, "Method Not Allowed", 405, TEXT_HEADERS)
+
+    body = b""
+    more = scope["method"] == "POST"
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+
+    request = {
+        "method": scope["method"],
+        "query_string": scope.get("query_string", b"").decode("latin-1"),
+        # Title-cased names, as StaticPage.respond() looks them up
+        "headers": {k.decode("latin-1").title(): v.decode("latin-1") for k, v in scope["headers"]},
+        "body": body
+    }
+    await respond(send, *(await handler(request)))
+
+async def respond(send, body, status, headers):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    raw = [(b"content-length", str(len(body)).encode())]
+    raw += [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in headers.items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw})
+    await send({"type": "http.response.body", "body": body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            startup()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+def startup():
+    global loop
+    loop = asyncio.get_running_loop()
+    if core.coalescer is not None:
+        core.coalescer.flush = flush_burst
+    log_event(logger, "server_start", server="asgi", brand=core.BRAND_NAME, ig_id=core.IG_ID,
+              messages_api=core.MESSAGES_ENDPOINT, send_concurrency=ASGI_SEND_CONCURRENCY,
+              max_pending=ASGI_MAX_PENDING, state_backend=core.STATE_BACKEND, batch_mode=core.WEBHOOK_BATCH_MODE,
+              tenants=len(core.tenants),
+              signature_check=bool(core.APP_SECRET), json_backend=core.JSON_BACKEND)
+
+async def shutdown():
+    """Flush open bursts and let in-flight replies finish before the loop stops"""
+    if core.coalescer is not None:
+        core.coalescer.flush = lambda sender_id, messages, recipient_id: spawn(
+            deliver_burst(sender_id, messages, recipient_id)
+        )
+        core.coalescer.close()
+    deadline = time.monotonic() + ASGI_SHUTDOWN_TIMEOUT
+    while pending and time.monotonic() < deadline:
+        await asyncio.wait(list(pending), timeout=deadline - time.monotonic())
+    if pending:
+        log_event(logger, "shutdown_pending_replies", logging.WARNING, pending=len(pending))
+    await graph_client.close()
@@ -0,0 +1,149 @@
+"""
+Flask (app.py) vs ASGI (asgi_app.py) under concurrent webhook POSTs when
+the Graph API is slow.
+
+Usage:
+    python benchmarks/bench_asgi.py [--posts 1000] [--concurrency 50] [--latency-ms 500]
+                                    [--send-workers 16] [--send-concurrency 100]
+
+Needs uvicorn + httpx for the ASGI side. Each server runs in its own process
+against an in-process Graph stub that sleeps --latency-ms per send. Every
+POST carries one DM from a new sender. Reported:
+    POST p50/p99  webhook response time (what Instagram sees)
+    503           POSTs refused because the send queue / pending limit was full
+    replies/s     replies the stub received, first POST -> last reply
+    reply p50/p99 POST sent -> reply received by the stub
+
+Flask is served by werkzeug's threaded server with SEND_WORKERS send
+threads (gunicorn is not needed); the ASGI app by one uvicorn worker.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from graph_stub import start_stub  # noqa: E402
+
+IG_ID = "17841400000000000"
+
+FLASK_CMD = [sys.executable, "-c",
+             "import sys, app; from werkzeug.serving import run_simple; "
+             "run_simple('127.0.0.1', int(sys.argv[1]), app.app, threaded=True)"]
+ASGI_CMD = [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--log-level", "warning", "--port"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(cmd, env):
+    port = free_port()
+    proc = subprocess.Popen(cmd + [str(port)], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/stats/live", timeout=1)
+            return proc, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"server did not start: {proc.stderr.read().decode()[-2000:]}")
+
+
+def load(url, posts, concurrency, tag):
+    local = threading.local()
+    sent_at = {}
+
+    def post(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        sender_id = f"{tag}_{i}"
+        event = {"sender": {"id": sender_id}, "recipient": {"id": IG_ID},
+                 "message": {"mid": f"mid_{sender_id}", "text": "how much is shipping?"}}
+        start = time.monotonic()
+        response = session.post(f"{url}/webhook", json={"object": "instagram", "entry": [{"messaging": [event]}]})
+        sent_at[sender_id] = start
+        return response.status_code, time.monotonic() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(post, range(posts)))
+    return results, sent_at
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent webhook POSTs")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Graph stub latency per send")
+    parser.add_argument("--send-workers", type=int, default=16, help="Flask SEND_WORKERS")
+    parser.add_argument("--send-concurrency", type=int, default=100, help="ASGI_SEND_CONCURRENCY")
+    parser.add_argument("--queue-size", type=int, default=1000, help="SEND_QUEUE_SIZE / ASGI_MAX_PENDING")
+    args = parser.parse_args()
+
+    server, base = start_stub(latency_ms=args.latency_ms, record=True)
+    env = {
+        **os.environ,
+        "GRAPH_API_BASE": base,
+        "INSTAGRAM_USER_ID": IG_ID,
+        "LOG_LEVEL": "ERROR",
+        "SEND_WORKERS": str(args.send_workers),
+        "SEND_QUEUE_SIZE": str(args.queue_size),
+        "ASGI_MAX_PENDING": str(args.queue_size),
+        "ASGI_SEND_CONCURRENCY": str(args.send_concurrency),
+        "SEND_RATE_PER_SECOND": "100000",
+        "SEND_RATE_BURST": "100000",
+        "SENDER_REPLY_WINDOW": "0",
+    }
+
+    print(f"{'server':<8}{'posts/s':>9}{'POST p50':>10}{'POST p99':>10}{'503':>6}"
+          f"{'replies':>9}{'replies/s':>11}{'reply p50':>11}{'reply p99':>11}")
+    for name, cmd in (("flask", FLASK_CMD), ("asgi", ASGI_CMD)):
+        proc, url = start_server(cmd, env)
+        try:
+            server.deliveries.clear()
+            start = time.monotonic()
+            results, sent_at = load(url, args.posts, args.concurrency, name)
+            post_s = time.monotonic() - start
+            accepted = sum(1 for status, _ in results if status == 200)
+
+            # Wait for the accepted replies to drain (or stop arriving)
+            deadline = time.monotonic() + 120
+            while len(server.deliveries) < accepted and time.monotonic() < deadline:
+                seen = len(server.deliveries)
+                time.sleep(1.0)
+                if len(server.deliveries) == seen and seen:
+                    break
+            deliveries = list(server.deliveries)
+        finally:
+            proc.terminate()
+            proc.wait(10)
+
+        reply_latency = [at - sent_at[recipient] for at, recipient in deliveries if recipient in sent_at]
+        last = max((at for at, _ in deliveries), default=start)
+        print(f"{name:<8}{args.posts / post_s:>9,.0f}{pct([d for _, d in results], 50):>10.1f}"
+              f"{pct([d for _, d in results], 99):>10.1f}{sum(s == 503 for s, _ in results):>6}"
+              f"{len(deliveries):>9}{len(deliveries) / max(last - start, 1e-9):>11,.0f}"
+              f"{pct(reply_latency, 50):>11.1f}{pct(reply_latency, 99):>11.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Message coalescing: outbound Graph API calls and end-to-end reply latency
+with COALESCE_WINDOW_MS off vs on.
+
+Usage:
+    python benchmarks/bench_coalescing.py [--bursts 200] [--windows 0 250 500]
+                                          [--burst-size 1 4] [--gap-ms 50 300]
+
+Each simulated sender sends one burst of messages (size and gaps drawn from
+the given ranges) to app.py's /webhook through the Flask test client; bursts
+from different senders overlap. The local Graph stub records when each reply
+arrives. Latencies are measured per burst:
+    first  - first message in -> first reply out (how long the sender waits)
+    last   - last message in  -> last reply out (how long after they stop)
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from graph_stub import start_stub  # noqa: E402
+
+IG_ID = "17841400000000000"
+BURSTS = [
+    ["hey", "how much", "for the red one"],
+    ["hi", "do you ship to canada?"],
+    ["hello!", "is the medium in stock", "the black one", "thanks"],
+    ["price?"],
+    ["yo", "my order hasn't arrived", "ordered last week", "order 1234"],
+]
+
+
+def load_app(window_ms, base):
+    """Fresh import of app.py with the given coalescing window"""
+    os.environ.update(
+        GRAPH_API_BASE=base,
+        INSTAGRAM_USER_ID=IG_ID,
+        LOG_LEVEL="WARNING",
+        COALESCE_WINDOW_MS=str(window_ms),
+        COALESCE_MAX_WAIT_MS=str(window_ms * 3),
+        SENDER_REPLY_WINDOW="0",  # measure coalescing alone
+        RECIPIENT_RATE_BURST="100",
+        SEND_RATE_PER_SECOND="10000",
+        SEND_RATE_BURST="10000",
+        SEND_WORKERS="8"
+    )
+    sys.modules.pop("app", None)
+    import app
+    return app
+
+
+def plan(bursts, burst_size, gap_ms, seed):
+    """The same senders, texts and gaps for every window"""
+    rng = random.Random(seed)
+    plans = []
+    for n in range(bursts):
+        texts = rng.choice(BURSTS)
+        texts = (texts * burst_size[1])[:rng.randint(burst_size[0], burst_size[1])]
+        gaps = [rng.uniform(*gap_ms) / 1000 for _ in texts[1:]]
+        plans.append((f"bench_{n}", texts, gaps, rng.uniform(0, 0.01)))
+    return plans
+
+
+def run(app, plans):
+    client = app.app.test_client()
+    timings = {}  # sender -> (first message at, last message at, messages)
+    lock = threading.Lock()
+
+    def sender(sender_id, texts, gaps):
+        first = None
+        for i, text in enumerate(texts):
+            if i:
+                time.sleep(gaps[i - 1])
+            event = {"sender": {"id": sender_id}, "recipient": {"id": IG_ID},
+                     "message": {"mid": f"{sender_id}_{i}", "text": text}}
+            sent_at = time.monotonic()
+            client.post("/webhook", json={"object": "instagram", "entry": [{"messaging": [event]}]})
+            first = first if first is not None else sent_at
+        with lock:
+            timings[sender_id] = (first, sent_at, len(texts))
+
+    threads = []
+    for sender_id, texts, gaps, stagger in plans:
+        thread = threading.Thread(target=sender, args=(sender_id, texts, gaps))
+        thread.start()
+        threads.append(thread)
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join()
+    return timings
+
+
+def settle(server, app, quiet=1.0):
+    """Wait until no reply has arrived for `quiet` seconds"""
+    seen = -1
+    while len(server.deliveries) != seen:
+        seen = len(server.deliveries)
+        time.sleep(quiet)
+    app.send_queue.shutdown()
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=200)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 250, 500], help="COALESCE_WINDOW_MS values")
+    parser.add_argument("--burst-size", type=int, nargs=2, default=[1, 4], metavar=("MIN", "MAX"))
+    parser.add_argument("--gap-ms", type=float, nargs=2, default=[50, 300], metavar=("MIN", "MAX"))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    plans = plan(args.bursts, args.burst_size, args.gap_ms, args.seed)
+    server, base = start_stub(record=True)
+    print(f"{'window ms':>10}{'messages':>10}{'sends':>8}{'saved':>8}"
+          f"{'first p50':>11}{'first p99':>11}{'last p50':>10}{'last p99':>10}")
+    for window in args.windows:
+        app = load_app(window, base)
+        server.deliveries.clear()
+        timings = run(app, plans)
+        settle(server, app)
+
+        replies = {}
+        for at, recipient in server.deliveries:
+            replies.setdefault(recipient, []).append(at)
+        first, last = [], []
+        for sender_id, (first_in, last_in, _) in timings.items():
+            out = sorted(replies.get(sender_id, []))
+            if out:
+                first.append(out[0] - first_in)
+                last.append(out[-1] - last_in)
+        messages = sum(n for _, _, n in timings.values())
+        sends = len(server.deliveries)
+        print(f"{window:>10.0f}{messages:>10}{sends:>8}{1 - sends / messages:>8.0%}"
+              f"{pct(first, 50):>11.1f}{pct(first, 99):>11.1f}{pct(last, 50):>10.1f}{pct(last, 99):>10.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
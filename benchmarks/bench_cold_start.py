@@ -0,0 +1,103 @@
+"""
+Lambda cold start: module import cost and time-to-first-response.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 10] [--top 10]
+
+Each run is a fresh interpreter (a cold container). It imports
+lambda_handler, then feeds it a synthetic API Gateway v2 POST /webhook
+event whose reply goes to a local Graph API stub, and a second one to
+show the warm cost. Also prints the slowest imports from -X importtime.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from graph_stub import start_stub  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import lambda_handler
+t1 = time.perf_counter()
+
+def event(mid):
+    body = {"object": "instagram", "entry": [{"id": "1784", "time": 0, "messaging": [{
+        "sender": {"id": "user_1"}, "recipient": {"id": "1784"}, "timestamp": 0,
+        "message": {"mid": mid, "text": "hi, how much is shipping?"}}]}]}
+    return {"version": "2.0", "rawPath": "/webhook", "body": json.dumps(body),
+            "requestContext": {"http": {"method": "POST", "path": "/webhook"}}}
+
+response = lambda_handler.handler(event("m_cold"), None)
+t2 = time.perf_counter()
+lambda_handler.handler(event("m_warm"), None)
+t3 = time.perf_counter()
+assert response["statusCode"] == 200, response
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_ms": (t2 - t0) * 1000,
+                  "warm_ms": (t3 - t2) * 1000, "sent": lambda_handler.state.counters().get("total_sent", 0)}))
+"""
+
+
+def child_env(base_url):
+    env = dict(os.environ)
+    env.update({
+        "GRAPH_API_BASE": base_url,
+        "INSTAGRAM_USER_ID": "1784",
+        "INSTAGRAM_ACCESS_TOKEN": "IGAA-bench",
+        "STATE_BACKEND": "memory",
+        "LOG_LEVEL": "WARNING",
+        "PYTHONDONTWRITEBYTECODE": "1"
+    })
+    return env
+
+
+def import_profile(env, top):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import lambda_handler"],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    total = next((us for us, name in rows if name.strip() == "lambda_handler"), 0)
+    return total, sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    server, base = start_stub()
+    env = child_env(base)
+
+    total_us, slowest = import_profile(env, args.top)
+    print(f"-X importtime: lambda_handler {total_us / 1000:.1f} ms cumulative")
+    for cumulative_us, name in slowest:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    assert all(r["sent"] == 2 for r in runs), runs
+
+    print(f"\n{args.runs} cold starts (median / max, ms):")
+    for key, label in (("import_ms", "import"), ("first_ms", "first response"), ("warm_ms", "warm response")):
+        values = [r[key] for r in runs]
+        print(f"  {label:<15}{statistics.median(values):8.1f} {max(values):8.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
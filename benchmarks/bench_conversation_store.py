@@ -0,0 +1,202 @@
+"""
+Conversation store: /conversations query latency with millions of stored
+messages, and the writer's insert rate.
+
+Usage:
+    python benchmarks/bench_conversation_store.py [--rows 10000000] [--path conv.db] [--queries 300]
+
+Fills an SQLite file (reused if --path already holds at least --rows rows)
+with --rows conversations spread over 30 days: --senders senders with a
+skewed (Zipf-like) activity, categories from reply_rules.json. Then, for
+each query shape, the p50 / p99 / max over --queries random instances:
+    ConversationStore.query()   the indexed lookup
+    /conversations              the same through app.py's Flask route
+                                (JSON encoding included)
+    no index                    query() with every index disabled, on a
+                                few samples: what a history scan costs
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from conversation_store import ConversationStore  # noqa: E402
+
+DAY = 86400
+FILL_BATCH = 50000
+
+
+def categories():
+    with open(os.path.join(ROOT, "reply_rules.json"), encoding="utf-8") as f:
+        rules = json.load(f)
+    return [rule["category"] for rule in rules.get("rules", [])] + ["default"]
+
+
+def sender_id(n):
+    return f"{n:016d}"
+
+
+def fill(store, rows, senders, cats, now, seed):
+    """Append rows in time order (as the writer would), returns inserts/s"""
+    rng = random.Random(seed)
+    start_ts = now - 30 * DAY
+    step = 30 * DAY / rows
+    # Skewed activity: a few senders write a lot, most write once or twice
+    weights = [1 / (i + 1) ** 0.8 for i in range(senders)]
+    cat_weights = [rng.random() + 0.1 for _ in cats]
+    started = time.perf_counter()
+    done = 0
+    while done < rows:
+        n = min(FILL_BATCH, rows - done)
+        people = rng.choices(range(senders), weights, k=n)
+        kinds = rng.choices(cats, cat_weights, k=n)
+        batch = [(start_ts + (done + i) * step, "17841400000000000", sender_id(people[i]), f"mid.{done + i}",
+                  kinds[i], "how much is the blue one?", "Great question! All our prices are shown on each post.",
+                  1) for i in range(n)]
+        store._write(batch)
+        done += n
+        if done % (FILL_BATCH * 20) == 0:
+            print(f"  {done:,} rows, {done / (time.perf_counter() - started):,.0f}/s", flush=True)
+    return rows / (time.perf_counter() - started)
+
+
+def stored_rows(path):
+    import sqlite3
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM conversations").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+def shapes(rng, senders, cats, now):
+    """(name, kwargs factory) for each query shape"""
+    def active_sender():
+        return sender_id(min(int(rng.paretovariate(0.8)) - 1, senders - 1))
+
+    return [
+        ("sender", lambda: {"sender": active_sender()}),
+        ("sender + since 7d", lambda: {"sender": active_sender(), "since": now - 7 * DAY}),
+        ("category", lambda: {"category": rng.choice(cats)}),
+        ("category + last hour", lambda: {"category": rng.choice(cats), "since": now - 3600}),
+        ("category + day range", lambda: {"category": rng.choice(cats),
+                                          "since": now - rng.randint(2, 29) * DAY,
+                                          "until": now - rng.randint(0, 1) * DAY}),
+        ("since 1d", lambda: {"since": now - DAY}),
+        ("sender + category", lambda: {"sender": active_sender(), "category": rng.choice(cats)}),
+        ("category, page 20", None),
+    ]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (samples[len(samples) // 2] * 1000, samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            samples[-1] * 1000)
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--senders", type=int, default=500_000)
+    parser.add_argument("--path", help="SQLite file to fill / reuse (default: a temporary file)")
+    parser.add_argument("--queries", type=int, default=300, help="random instances per query shape")
+    parser.add_argument("--limit", type=int, default=50, help="page size")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.path
+    if path is None:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "conversations.db")
+
+    cats = categories()
+    now = time.time()
+    store = ConversationStore(path)
+    have = stored_rows(path)
+    if have >= args.rows:
+        print(f"reusing {path}: {have:,} rows")
+        now = store._reader().execute("SELECT MAX(ts) FROM conversations").fetchone()[0]
+    else:
+        print(f"filling {path} with {args.rows:,} rows ({args.senders:,} senders, {len(cats)} categories)")
+        print(f"inserts/s (batches of {FILL_BATCH:,}): {fill(store, args.rows, args.senders, cats, now, args.seed):,.0f}")
+    print(f"file size: {os.path.getsize(path) / 2**30:.2f} GiB\n")
+
+    # Through the route as well: app.py opens the same file
+    os.environ.update(CONVERSATION_DB_PATH=path, LOG_LEVEL="WARNING", INSTAGRAM_USER_ID="17841400000000000")
+    import app
+    client = app.app.test_client()
+
+    rng = random.Random(args.seed)
+    print(f"{'query (limit ' + str(args.limit) + ')':<24}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'http p50':>10}{'http p99':>10}{'rows':>7}{'no index ms':>13}")
+    for name, make in shapes(rng, args.senders, cats, now):
+        if make is None:
+            # Follow `next` 19 times, then time the 20th page
+            def make(category=rng.choice(cats)):
+                kwargs = {"category": category}
+                for _ in range(19):
+                    _, kwargs["cursor"] = store.query(limit=args.limit, **kwargs)
+                return kwargs
+            instances = [make() for _ in range(min(args.queries, 50))]
+        else:
+            instances = [make() for _ in range(args.queries)]
+        it = iter(instances)
+        rows = 0
+
+        def direct():
+            nonlocal rows
+            records, _ = store.query(limit=args.limit, **next(it))
+            rows += len(records)
+        direct_p50, direct_p99, direct_max = percentiles(timed(direct, len(instances)))
+
+        it = iter(instances)
+
+        def http():
+            query = {k: v for k, v in next(it).items()}
+            response = client.get("/conversations", query_string={**query, "limit": args.limit})
+            assert response.status_code == 200, response.get_data(as_text=True)
+        http_p50, http_p99, _ = percentiles(timed(http, len(instances)))
+
+        # Full scan, as with no indexes: a handful of samples is plenty
+        scan = store._reader()
+        kwargs = instances[0]
+        clauses = [f"{key} = ?" if key in ("sender", "category") else ("ts >= ?" if key == "since" else "ts < ?")
+                   for key in kwargs if key != "cursor"]
+        sql = ("SELECT * FROM conversations NOT INDEXED"
+               + (" WHERE " + " AND ".join(c.replace("sender =", "sender_id =") for c in clauses) if clauses else "")
+               + " ORDER BY ts DESC LIMIT ?")
+        params = [v for k, v in kwargs.items() if k != "cursor"] + [args.limit]
+        start = time.perf_counter()
+        scan.execute(sql, params).fetchall()
+        scan_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{name:<24}{direct_p50:>9.2f}{direct_p99:>9.2f}{direct_max:>9.2f}{http_p50:>10.2f}{http_p99:>10.2f}"
+              f"{rows / len(instances):>7.0f}{scan_ms:>13.0f}")
+
+    store.close()
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
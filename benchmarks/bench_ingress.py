@@ -0,0 +1,156 @@
+"""
+Webhook ingress: events/second from raw body to the messages worth replying to.
+
+Usage:
+    python benchmarks/bench_ingress.py [--posts 5000] [--non-text-rate 0.35] [--echo-rate 0.3]
+
+The corpus is webhook_payloads.generate() with a realistic mix: besides text
+DMs, read receipts / reactions / attachments (--non-text-rate), echoes of
+our own replies (--echo-rate), duplicates and redelivered POSTs. Variants:
+    before         json.loads, then every event goes to the per-event checks
+                   (the old request.get_json() + accept_message() filtering)
+    json / orjson  ingress.parse_webhook(): one parse, events dropped in the walk,
+                   bodies without a "text" key skipped unparsed
+    + signature    verify_signature() on the raw bytes first
+
+Then the same corpus through app.py's webhook() (Flask test client, state
+in memory, sends to a local stub) with each JSON backend, for the share of
+ingress in a whole request.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ingress  # noqa: E402
+from metrics import MetricsRegistry  # noqa: E402
+from graph_stub import start_stub  # noqa: E402
+from webhook_payloads import generate  # noqa: E402
+
+IG_ID = "17841400000000000"
+ORJSON = ingress.orjson  # None if not installed
+SECRET = b"bench-app-secret"
+
+stage_seconds = MetricsRegistry().histogram("bench_stage_seconds", "", ("stage",))
+
+
+@stage_seconds.labels("process_message").timed
+def old_process_message_event(event):
+    """The checks at the top of the old accept_message(), behind the same stage timer"""
+    sender_id = event.get('sender', {}).get('id')
+    recipient_id = event.get('recipient', {}).get('id')
+    message = event.get('message', {})
+    message_id = message.get('mid')
+    message_text = message.get('text', '')
+    if recipient_id != IG_ID or not message_text:
+        return None
+    return sender_id, message_id, message_text
+
+
+def before(body):
+    """The old webhook(): parse with the stdlib, hand every event to process_message_event()"""
+    data = json.loads(body)
+    messages = []
+    if 'entry' in data:
+        for entry in data['entry']:
+            if 'messaging' in entry:
+                for event in entry['messaging']:
+                    message = old_process_message_event(event)
+                    if message is not None:
+                        messages.append(message)
+    return messages
+
+
+def after(body):
+    return ingress.parse_webhook(body, IG_ID).messages
+
+
+def after_signed(body, signature):
+    if not ingress.verify_signature(body, signature, SECRET):
+        raise AssertionError("bad signature")
+    return after(body)
+
+
+def run(fn, bodies, signatures, rounds):
+    best = float("inf")
+    kept = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        kept = 0
+        if signatures is None:
+            for body in bodies:
+                kept += len(fn(body))
+        else:
+            for body, signature in zip(bodies, signatures):
+                kept += len(fn(body, signature))
+        best = min(best, time.perf_counter() - start)
+    return best, kept
+
+
+def backend(name):
+    """Switch ingress between orjson and the stdlib parser"""
+    ingress.orjson = ORJSON if name == "orjson" else None
+
+
+def webhook_rate(bodies, signatures, events):
+    os.environ.update(INSTAGRAM_USER_ID=IG_ID, LOG_LEVEL="WARNING", INSTAGRAM_APP_SECRET=SECRET.decode(),
+                      SEND_RATE_PER_SECOND="100000", SEND_RATE_BURST="100000", SEND_QUEUE_SIZE="1000000")
+    server, base = start_stub()
+    os.environ["GRAPH_API_BASE"] = base
+    import app
+    client = app.app.test_client()
+    start = time.perf_counter()
+    for body, signature in zip(bodies, signatures):
+        client.post("/webhook", data=body, headers={"X-Hub-Signature-256": signature,
+                                                    "Content-Type": "application/json"})
+    elapsed = time.perf_counter() - start
+    app.send_queue.shutdown()
+    server.shutdown()
+    return events / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--non-text-rate", type=float, default=0.35)
+    parser.add_argument("--echo-rate", type=float, default=0.3)
+    parser.add_argument("--rounds", type=int, default=7, help="best of N passes per variant")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    payloads = list(generate(args.posts, ig_id=IG_ID, non_text_rate=args.non_text_rate, echo_rate=args.echo_rate,
+                             seed=args.seed))
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+    signatures = ["sha256=" + hmac.new(SECRET, body, hashlib.sha256).hexdigest() for body in bodies]
+    events = sum(len(entry["messaging"]) for payload in payloads for entry in payload["entry"])
+    no_text = sum(1 for body in bodies if b'"text"' not in body)
+    print(f"{len(bodies)} POSTs, {events} events, {sum(map(len, bodies)) / len(bodies):.0f} B/POST, "
+          f"{no_text} POSTs without text; JSON backends: json"
+          f"{', orjson' if ORJSON is not None else ' (orjson not installed)'}\n")
+
+    variants = [("before", "json", before, False), ("json", "json", after, False),
+                ("json + signature", "json", after_signed, True)]
+    if ORJSON is not None:
+        variants += [("orjson", "orjson", after, False), ("orjson + signature", "orjson", after_signed, True)]
+
+    print(f"{'variant':<20}{'events/s':>12}{'us/POST':>10}{'kept':>8}")
+    for name, json_backend, fn, signed in variants:
+        backend(json_backend)
+        seconds, kept = run(fn, bodies, signatures if signed else None, args.rounds)
+        print(f"{name:<20}{events / seconds:>12,.0f}{seconds / len(bodies) * 1e6:>10.1f}{kept:>8}")
+
+    print(f"\n{'webhook()':<20}{'events/s':>12}")
+    for json_backend in (("json", "orjson") if ORJSON is not None else ("json",)):
+        backend(json_backend)
+        sys.modules.pop("app", None)
+        print(f"{json_backend:<20}{webhook_rate(bodies, signatures, events):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Semantic intent classifier vs keyword matcher: accuracy, per-message
+latency and batch throughput on CPU.
+
+Usage:
+    python benchmarks/bench_intent_classifier.py [--model sentence-transformers/all-MiniLM-L6-v2]
+                                                [--threshold 0.55] [--repeat 20]
+
+Needs numpy + sentence-transformers. The index is built into a temp dir,
+so the first run also reports the build time. "semantic" means
+classifier-with-keyword-fallback, i.e. what generate_reply does with
+INTENT_MODEL set.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app  # noqa: E402
+from intent_classifier import IntentClassifier  # noqa: E402
+
+# (message, expected category); several trip the substring keyword rules
+LABELLED = [
+    ("this is great", "quality"),
+    ("ship it to Canada?", "shipping"),
+    ("the quality is amazing", "quality"),
+    ("hi, how much for the tote?", "price"),
+    ("hello!", "greeting"),
+    ("what does shipping to the UK cost", "shipping"),
+    ("is the medium back in stock", "stock"),
+    ("I need to send this back", "returns"),
+    ("got any promo codes", "discounts"),
+    ("does it run small", "product"),
+    ("where's my package, I ordered last week", "order"),
+    ("thanks a lot!", "thanks"),
+    ("can I use apple pay", "payment"),
+    ("the zipper broke on day two", "complaint"),
+    ("how do I reach a human", "support"),
+    ("yeah", "yes"),
+    ("nope", "no"),
+    ("which color is that", "product"),
+    ("is it worth it", "quality"),
+    ("anything cheaper?", "price"),
+]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def min_time(fn, runs=50):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--threshold", type=float, default=0.55)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        classifier = IntentClassifier(args.model, app.INTENT_EXAMPLES, os.path.join(tmp, "intents.npy"), args.threshold)
+        print(f"model load + index build: {time.perf_counter() - start:.2f} s "
+              f"({len(classifier.index.labels)} example vectors)")
+
+        texts = [text for text, _ in LABELLED]
+        matcher = app.rule_store.snapshot.matcher
+        keyword = [category for category, _ in matcher.match_many(texts)]
+        semantic = [
+            category if category is not None else matcher.match(text)[0]
+            for text, (category, _) in zip(texts, classifier.classify_many(texts))
+        ]
+        print(f"\n{'message':<42}{'expected':<11}{'keyword':<11}{'semantic':<11}")
+        for (text, expected), kw, sem in zip(LABELLED, keyword, semantic):
+            print(f"{text:<42}{expected:<11}{kw:<11}{sem:<11}")
+        for name, predicted in (("keyword", keyword), ("semantic", semantic)):
+            correct = sum(p == expected for p, (_, expected) in zip(predicted, LABELLED))
+            print(f"{name} accuracy: {correct}/{len(LABELLED)}")
+
+        latencies = []
+        for _ in range(args.repeat):
+            for text in texts:
+                start = time.perf_counter()
+                classifier.classify(text)
+                latencies.append((time.perf_counter() - start) * 1000)
+        print(f"\nper message: p50 {statistics.median(latencies):.2f} ms, "
+              f"p99 {percentile(latencies, 0.99):.2f} ms (keyword: "
+              f"{min_time(lambda: matcher.match(texts[0])) * 1e6:.1f} us)")
+
+        print(f"\n{'batch':>6}{'msgs/s':>10}")
+        for size in (1, 8, 32, 128):
+            batch = (texts * (size // len(texts) + 1))[:size]
+            seconds = min_time(lambda: classifier.classify_many(batch), runs=max(3, args.repeat // 4))
+            print(f"{size:>6}{size / seconds:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
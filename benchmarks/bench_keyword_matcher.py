@@ -0,0 +1,125 @@
+"""
+Micro-benchmark: compiled KeywordMatcher vs the original if/any() cascade.
+
+Usage:
+    python benchmarks/bench_keyword_matcher.py [--messages 1000000] [--seed 7]
+
+Every synthetic DM is checked against both implementations first, so the
+timing numbers are only printed if the replies are identical.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import BRAND_NAME, REPLY_RULES_PATH  # noqa: E402
+from reply_rules import RuleStore  # noqa: E402
+
+# app.py's store leaves "{brand}" for each tenant to fill; the baseline has
+# the brand baked in, so compare against a table compiled with it
+snapshot = RuleStore(REPLY_RULES_PATH, brand=BRAND_NAME).snapshot
+matcher = snapshot.matcher
+
+
+def generate_reply(text):
+    return matcher.match(text)[1]
+
+
+def cascade_reply(text):
+    """The original generate_reply from app.py, kept verbatim as the baseline"""
+    t = text.lower().strip()
+    if any(word in t for word in ["hi", "hello", "hey", "hola", "good morning", "good evening", "sup", "yo"]):
+        return f"Hi there!  Welcome to {BRAND_NAME}! How can I help you today?"
+    if any(word in t for word in ["price", "cost", "how much", "$", "expensive", "cheap", "pricing"]):
+        return "Great question!  All our prices are shown on each post. Looking for something specific?"
+    if any(word in t for word in ["ship", "delivery", "deliver", "arrive", "tracking", "when will", "how long"]):
+        return " We ship fast! Most orders arrive in 3-5 business days. Need tracking info?"
+    if any(word in t for word in ["stock", "available", "in stock", "out of stock", "restock", "sold out"]):
+        return "We restock regularly!  Follow us to stay updated. Want me to check a specific item?"
+    if any(word in t for word in ["return", "refund", "exchange", "money back", "cancel"]):
+        return "No worries!  We have a hassle-free return policy. Share your order number and I'll help!"
+    if any(word in t for word in ["discount", "coupon", "promo", "code", "deal", "sale", "offer"]):
+        return "Love a good deal!  Keep an eye on our feed — we drop exclusive promos regularly!"
+    if any(word in t for word in ["size", "color", "material", "spec", "detail", "dimension"]):
+        return "Good question!  Check the product post for full specs. Which item are you asking about?"
+    if any(word in t for word in ["order", "purchase", "buy", "bought", "ordered"]):
+        return "Thanks for your order!  Check your email for confirmation. Questions about your order?"
+    if any(word in t for word in ["thank", "thanks", "thx", "ty", "appreciate", "thank you"]):
+        return "You're welcome!  Anything else I can help with? I'm here!"
+    if any(word in t for word in ["quality", "good", "worth", "recommend", "review", "rating"]):
+        return "All our products are carefully selected!  Check the ratings on each post. Interested in something specific?"
+    if any(word in t for word in ["payment", "pay", "credit card", "paypal", "cash", "venmo"]):
+        return "We accept all major payment methods! 💳 Secure checkout. Link in bio!"
+    if any(word in t for word in ["problem", "issue", "broken", "damaged", "wrong", "complaint"]):
+        return "I'm sorry to hear that! 😟 Let me help fix this. Can you share your order number or more details?"
+    if any(word in t for word in ["contact", "call", "email", "support", "help", "customer service"]):
+        return "You've reached the right place! 💬 I'm here to help. What do you need assistance with?"
+    if t in ["yes", "yeah", "yep", "yup", "ok", "okay", "sure", "k"]:
+        return "Great! How can I assist you further? 😊"
+    if t in ["no", "nope", "nah", "not really"]:
+        return "No problem! Let me know if you change your mind or need anything else. 👍"
+    return f"Hey! 👋 Thanks for reaching out to {BRAND_NAME}. How can I help you today?"
+
+
+FILLER = [
+    "the", "red", "one", "please", "lol", "can", "i", "get", "this", "in", "blue", "is", "there",
+    "for", "my", "sister", "what", "about", "that", "bag", "dress", "shoes", "omg", "love", "it",
+    "❤️", "🔥", "😍", "??", "!!", "...", "u", "guys", "still", "have", "pls", "asap", "tmrw",
+]
+
+
+def synthetic_dms(count, seed):
+    """Mix of keyword hits, near misses, exact replies and pure noise"""
+    rng = random.Random(seed)
+    keywords = [kw for _, kws, _ in snapshot.rules for kw in kws]
+    exact = [phrase for _, phrases, _ in snapshot.exact_rules for phrase in phrases]
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        words = rng.choices(FILLER, k=rng.randint(1, 12))
+        if roll < 0.6:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        elif roll < 0.7:
+            words = [rng.choice(exact)]
+        text = " ".join(words)
+        if rng.random() < 0.3:
+            text = text.upper() if rng.random() < 0.5 else text.capitalize()
+        messages.append(text)
+    return messages
+
+
+def bench(fn, messages):
+    start = time.perf_counter()
+    for text in messages:
+        fn(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    messages = synthetic_dms(args.messages, args.seed)
+
+    for text in messages:
+        expected, got = cascade_reply(text), generate_reply(text)
+        if expected != got:
+            raise SystemExit(f"Mismatch for {text!r}:\n  cascade: {expected!r}\n  matcher: {got!r}")
+    print(f"Verified {len(messages):,} messages: replies identical")
+
+    cascade_s = bench(cascade_reply, messages)
+    matcher_s = bench(generate_reply, messages)
+
+    print(f"{'engine':<10}{'total (s)':>12}{'per msg (µs)':>16}{'msgs/s':>14}")
+    for name, seconds in (("cascade", cascade_s), ("matcher", matcher_s)):
+        print(f"{name:<10}{seconds:>12.3f}{seconds / len(messages) * 1e6:>16.2f}{len(messages) / seconds:>14,.0f}")
+    print(f"speedup: {cascade_s / matcher_s:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Durable outbox: write throughput, put() latency and the cost of fsync.
+
+Usage:
+    python benchmarks/bench_outbox.py [--jobs 4000] [--threads 1 8 32] [--dir /path/on/real/disk]
+
+For each OUTBOX_SYNC mode and thread count, `jobs` reply jobs are put()
+(each durable on return) and then done(). Concurrent put()s share commits
+(group commit), so "rows/commit" shows how many jobs each fsync covered.
+A raw write+fsync loop on the same directory gives the floor for "full".
+
+Run it on the disk the app will use: tmpfs or a VM's write-back cache makes
+fsync look free.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outbox import SYNC_MODES, Outbox  # noqa: E402
+
+REPLY = "Great question! All our prices are shown on each post. Looking for something specific?"
+
+
+def raw_fsync(directory, runs=200):
+    """Median cost of appending 200 bytes and fsyncing"""
+    path = os.path.join(directory, "fsync_probe")
+    samples = []
+    with open(path, "ab") as f:
+        for _ in range(runs):
+            start = time.perf_counter()
+            f.write(b"x" * 200)
+            f.flush()
+            os.fsync(f.fileno())
+            samples.append(time.perf_counter() - start)
+    os.remove(path)
+    return statistics.median(samples)
+
+
+def run(outbox, jobs, threads):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = jobs // threads
+
+    def worker(t):
+        mine = []
+        for i in range(per_thread):
+            key = f"t{t}_{i}"
+            start = time.perf_counter()
+            outbox.put(key, f"user_{i}", "how much?", "price", REPLY)
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    put_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for t in range(threads):
+        for i in range(per_thread):
+            outbox.done(f"t{t}_{i}")
+    done_s = time.perf_counter() - start
+    return per_thread * threads, put_s, done_s, sorted(latencies)
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=4000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--dir", default=None, help="directory for the database (default: a temp dir)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f"raw write+fsync: {raw_fsync(tmp) * 1000:.3f} ms median\n")
+        print(f"{'sync':<8}{'threads':>8}{'puts/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'commits':>9}"
+              f"{'rows/commit':>13}{'done/s':>10}")
+        for sync in SYNC_MODES:
+            for threads in args.threads:
+                path = os.path.join(tmp, f"outbox_{sync}_{threads}.db")
+                outbox = Outbox(path, sync=sync)
+                jobs, put_s, done_s, latencies = run(outbox, args.jobs, threads)
+                stats = outbox.stats()
+                assert stats["pending"] == 0 and stats["written"] == jobs
+                print(f"{sync:<8}{threads:>8}{jobs / put_s:>10,.0f}{pct(latencies, 50):>9.3f}{pct(latencies, 99):>9.3f}"
+                      f"{stats['commits']:>9}{stats['rows_per_commit']:>13.1f}{jobs / done_s:>10,.0f}")
+                outbox.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Category rollups: cost per recorded reply, and /stats/timeseries read time
+against counting the same per-minute numbers from a history scan.
+
+Usage:
+    python benchmarks/bench_rollups.py [--history 100000 1000000] [--categories 14] [--reads 200]
+
+Variants:
+    update        CategoryRollups.classified() + outcome() for one reply
+                  (both windows), as the send path does
+    timeseries    rollups.timeseries() for all windows, all categories
+    + JSON        the same, serialized: what the endpoint returns
+    scan          the old way: walk N history records (timestamp, category,
+                  sent) and bucket the last hour per minute and category
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rollups import CategoryRollups  # noqa: E402
+
+
+def best_of(fn, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[100_000, 1_000_000],
+                        help="history sizes for the scan baseline")
+    parser.add_argument("--categories", type=int, default=14)
+    parser.add_argument("--updates", type=int, default=200_000)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cats = [f"category_{i}" for i in range(args.categories)]
+    now = time.time()
+
+    # Replies spread over the last two days, fed through a fake clock
+    clock = [now - 2 * 86400]
+    rollups = CategoryRollups(clock=lambda: clock[0])
+    step = 2 * 86400 / args.updates
+    picks = [rng.choice(cats) for _ in range(args.updates)]
+    sent = [rng.random() > 0.03 for _ in range(args.updates)]
+    start = time.perf_counter()
+    for i in range(args.updates):
+        clock[0] += step
+        rollups.classified((picks[i],))
+        rollups.outcome(picks[i], sent[i], 0.05)
+    update_ns = (time.perf_counter() - start) / args.updates * 1e9
+
+    read_s = best_of(rollups.timeseries, args.reads)
+    json_s = best_of(lambda: json.dumps(rollups.timeseries()), args.reads)
+    series = rollups.timeseries()
+    payload = len(json.dumps(series))
+
+    print(f"{args.categories} categories, {args.updates:,} replies over 2 days\n")
+    print(f"{'variant':<26}{'time':>14}")
+    print(f"{'update (per reply)':<26}{update_ns:>11,.0f} ns")
+    print(f"{'timeseries':<26}{read_s * 1e6:>11,.0f} us")
+    print(f"{'timeseries + JSON':<26}{json_s * 1e6:>11,.0f} us   ({payload / 1024:.1f} KB)")
+
+    for size in args.history:
+        history = [(now - 2 * 86400 + i * 2 * 86400 / size, rng.choice(cats), rng.random() > 0.03)
+                   for i in range(size)]
+
+        def scan():
+            cutoff = now - 3600
+            buckets = {}
+            for ts, category, ok in history:
+                if ts >= cutoff:
+                    counts = buckets.setdefault(category, [0] * 60)
+                    counts[min(59, int((ts - cutoff) // 60))] += 1
+            return buckets
+
+        scan_s = best_of(scan, max(3, args.reads // 50))
+        print(f"{f'scan ({size:,} records)':<26}{scan_s * 1e6:>11,.0f} us")
+        del history
+
+
+if __name__ == "__main__":
+    main()
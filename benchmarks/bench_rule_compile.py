@@ -0,0 +1,99 @@
+"""
+Rule table compile time: how long a (re)load takes for large reply_rules files.
+
+Usage:
+    python benchmarks/bench_rule_compile.py [--keywords 1000 10000 50000] [--categories 15]
+
+For each size a synthetic rule file is written to a temp dir, then timed:
+parse (JSON load), compile (RuleSnapshot: trie regex, priority folding,
+normaliser) and the median per-message match latency of the result. The
+compile time is how long a reload runs in the background before the swap.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reply_rules import RuleSnapshot, RuleStore, read_rules_file  # noqa: E402
+
+
+def synthetic_rules(keywords, categories, rng):
+    """Mostly single words, some two-word phrases, shared prefixes on purpose"""
+    stems = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 5))) for _ in range(max(50, keywords // 20))]
+    words = set()
+    while len(words) < keywords:
+        word = rng.choice(stems) + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(0, 6)))
+        if rng.random() < 0.15:
+            word += " " + rng.choice(stems)
+        words.add(word)
+    words = list(words)
+    rng.shuffle(words)
+    per = -(-len(words) // categories)
+    return {
+        "version": 1,
+        "rules": [
+            {"category": f"cat{i}", "keywords": words[i * per:(i + 1) * per], "reply": f"reply {i} from {{brand}}"}
+            for i in range(categories)
+        ],
+        "exact_rules": [{"category": "yes", "phrases": ["yes", "ok"], "reply": "great"}],
+        "default": {"category": "default", "reply": "hello from {brand}"}
+    }, words
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--categories", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'keywords':>9}{'file KB':>9}{'parse ms':>10}{'compile ms':>12}{'match us':>10}{'reload ms':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.keywords:
+            doc, words = synthetic_rules(count, args.categories, rng)
+            path = os.path.join(tmp, f"rules_{count}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(doc, f)
+
+            parsed, parse_s = timed(lambda: read_rules_file(path))
+            snapshot, compile_s = timed(lambda: RuleSnapshot(parsed, path, "Bench"))
+
+            messages = [
+                " ".join(rng.choices(words, k=2) + ["please", "thanks", "lol"]) if i % 2 else "nothing to see here at all"
+                for i in range(2000)
+            ]
+            match = snapshot.matcher.match
+            samples = []
+            for text in messages:
+                start = time.perf_counter()
+                match(text)
+                samples.append(time.perf_counter() - start)
+
+            # Full hot-reload path: stat, read, compile, swap
+            store = RuleStore(path, "Bench")
+            doc["rules"][0]["reply"] = "changed"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(doc, f)
+            changed, reload_s = timed(store.check)
+            assert changed and store.snapshot.rules[0][2] == "changed"
+
+            print(f"{count:>9,}{os.path.getsize(path) / 1024:>9.0f}{parse_s * 1000:>10.1f}{compile_s * 1000:>12.1f}"
+                  f"{statistics.median(samples) * 1e6:>10.2f}{reload_s * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Send latency: per-call requests.post (old send_dm) vs the pooled GraphClient.
+
+Usage:
+    python benchmarks/bench_send_latency.py [--sends 2000] [--latency-ms 0]
+
+Both variants hit the same local Graph API stub. The stub speaks plain HTTP,
+so the gap shown here is TCP setup plus per-call session construction; against
+graph.instagram.com every avoided handshake also saves a TLS round trip.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from graph_client import GraphClient  # noqa: E402
+from graph_stub import start_stub  # noqa: E402
+
+TOKEN = "IGAA-bench-token"
+
+
+def unpooled_send(endpoint):
+    def send(recipient_id, text):
+        payload = {"recipient": {"id": recipient_id}, "message": {"text": text[:1000]}}
+        headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
+        return requests.post(endpoint, headers=headers, json=payload, timeout=10)
+    return send
+
+
+def pooled_send(endpoint):
+    return GraphClient(TOKEN, endpoint).send_message
+
+
+def run(send, sends):
+    samples = []
+    for i in range(sends):
+        start = time.perf_counter()
+        response = send(f"user_{i}", "Hi there! Welcome! How can I help you today?")
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    samples.sort()
+    return samples
+
+
+def pct(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sends", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="server-side latency added by the stub")
+    args = parser.parse_args()
+
+    server, base = start_stub(latency_ms=args.latency_ms)
+    endpoint = f"{base}/17841400000000000/messages"
+
+    print(f"{'variant':<12}{'p50 (ms)':>10}{'p99 (ms)':>10}{'mean (ms)':>11}{'connections':>13}")
+    for name, factory in (("before", unpooled_send), ("after", pooled_send)):
+        opened = server.connections
+        samples = run(factory(endpoint), args.sends)
+        print(f"{name:<12}{pct(samples, 50):>10.3f}{pct(samples, 99):>10.3f}"
+              f"{statistics.mean(samples) * 1000:>11.3f}{server.connections - opened:>13}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
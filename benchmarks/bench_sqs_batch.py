@@ -0,0 +1,239 @@
+"""
+Lambda queue mode end to end, locally: webhook POSTs enqueue to an in-process
+stand-in for SQS, then the same handler consumes SQS-shaped batches against
+the Graph stub, with failed records redriven until the queue is empty.
+
+Usage:
+    python benchmarks/bench_sqs_batch.py [--posts 1000] [--batch-size 10] [--error-rate 0.05]
+                                         [--latency-ms 20] [--sqs-duplicate-rate 0.02] [--max-receives 5]
+
+Two modes, each in a fresh interpreter with in-memory state:
+    inline   lambda_handler as before: the webhook invocation sends the replies
+             (WEBHOOK_BATCH_MODE and friends pass through from the environment)
+    queue    SQS_QUEUE_URL set: the webhook only enqueues; handler() is then
+             called with {"Records": [...]} batches of --batch-size. Records
+             in batchItemFailures go back on the queue, and to the dead-letter
+             list after --max-receives; --sqs-duplicate-rate delivers some
+             records twice (SQS standard queues are at-least-once)
+
+Reported per mode:
+    p50/p99 ms       webhook response time
+    calls, busy s    handler invocations and the time spent in them
+    replies          messages the stub accepted, of `expected` unique text mids
+    lost             expected - replies: in inline mode, every failed send
+    failed, redriven records reported in batchItemFailures / delivered again
+    dlq              records dead-lettered
+    send err         sends the stub answered with a 500
+
+SEND_MAX_RETRIES defaults to 0 here, so each stub 500 is one failed reply.
+Queue mode exits non-zero unless every unique message was answered exactly
+once (dead-lettered ones aside) and every 500 came back as a failed record.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, deque
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from graph_stub import start_stub  # noqa: E402
+from webhook_payloads import generate  # noqa: E402
+
+IG_ID = "17841400000000000"
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/000000000000/autodm-bench"
+MODES = ("inline", "queue")
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float("nan")
+
+
+def text_mids(payloads):
+    return {event["message"]["mid"] for payload in payloads for entry in payload["entry"]
+            for event in entry["messaging"] if event.get("message", {}).get("text")
+            and not event["message"].get("is_echo")}
+
+
+class LocalQueue:
+    """
+    Just enough SQS: send_message_batch() for the webhook side, receive() /
+    settle() for the event source mapping in front of the consumer.
+    """
+
+    def __init__(self, url, duplicate_rate=0.0, max_receives=5, seed=7):
+        self.url = url
+        self.duplicate_rate = duplicate_rate
+        self.max_receives = max_receives
+        self.rng = random.Random(seed)
+        self.visible = deque()
+        self.in_flight = {}
+        self.receives = Counter()
+        self.dead = []
+        self.sent = 0
+        self.duplicated = 0
+        self.redriven = 0
+
+    def send_message_batch(self, QueueUrl, Entries):
+        assert QueueUrl == self.url and 0 < len(Entries) <= 10, "SendMessageBatch takes 1-10 entries"
+        for entry in Entries:
+            self.sent += 1
+            self.visible.append({"messageId": f"00000000-0000-4000-8000-{self.sent:012d}",
+                                 "body": entry["MessageBody"]})
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    def receive(self, batch_size):
+        """The next SQS event, or None once the queue is empty"""
+        records = []
+        while self.visible and len(records) < batch_size:
+            message = self.visible.popleft()
+            self.receives[message["messageId"]] += 1
+            self.in_flight[message["messageId"]] = message
+            records.append(self.record(message))
+            if self.rng.random() < self.duplicate_rate:
+                # Same message handed out again, maybe in the same batch
+                self.duplicated += 1
+                self.receives[message["messageId"]] += 1
+                records.append(self.record(message))
+        return {"Records": records} if records else None
+
+    def record(self, message):
+        return {
+            "messageId": message["messageId"],
+            "receiptHandle": f"rh-{message['messageId']}-{self.receives[message['messageId']]}",
+            "body": message["body"],
+            "attributes": {"ApproximateReceiveCount": str(self.receives[message["messageId"]]),
+                           "SentTimestamp": str(int(time.time() * 1000))},
+            "messageAttributes": {},
+            "eventSource": "aws:sqs",
+            "eventSourceARN": "arn:aws:sqs:us-east-1:000000000000:autodm-bench",
+            "awsRegion": "us-east-1"
+        }
+
+    def settle(self, event, response):
+        """Delete what succeeded; failed records become visible again (or go to the DLQ)"""
+        failed = {item["itemIdentifier"] for item in response["batchItemFailures"]}
+        unknown = failed - {record["messageId"] for record in event["Records"]}
+        assert not unknown, f"batchItemFailures names records not in the batch: {unknown}"
+        for message_id in dict.fromkeys(record["messageId"] for record in event["Records"]):
+            message = self.in_flight.pop(message_id)
+            if message_id not in failed:
+                continue
+            if self.receives[message_id] >= self.max_receives:
+                self.dead.append(message)
+            else:
+                self.redriven += 1
+                self.visible.append(message)
+        return len(failed)
+
+
+# ─── child: one mode ───
+
+def child(args):
+    payloads = list(generate(args.posts, ig_id=IG_ID, seed=args.seed))
+    bodies = [json.dumps(payload) for payload in payloads]
+    expected = text_mids(payloads)
+
+    server, base = start_stub(latency_ms=args.latency_ms, error_rate=args.error_rate, record=True)
+    os.environ.update(GRAPH_API_BASE=base, INSTAGRAM_USER_ID=IG_ID, STATE_BACKEND="memory",
+                      SQS_QUEUE_URL=QUEUE_URL if args.child == "queue" else "")
+    for name, value in (("LOG_LEVEL", "WARNING"), ("SEND_RATE_PER_SECOND", "100000"), ("SEND_RATE_BURST", "100000"),
+                        ("RECIPIENT_RATE_PER_SECOND", "1000"), ("RECIPIENT_RATE_BURST", "1000"),
+                        ("SENDER_REPLY_WINDOW", "0"), ("SEND_MAX_RETRIES", "0")):
+        os.environ.setdefault(name, value)
+
+    import lambda_handler
+    queue = LocalQueue(QUEUE_URL, args.sqs_duplicate_rate, args.max_receives, args.seed)
+    lambda_handler.sqs = queue
+
+    latencies, busy, calls, errors = [], 0.0, 0, 0
+    for body in bodies:
+        event = {"version": "2.0", "rawPath": "/webhook", "body": body,
+                 "requestContext": {"http": {"method": "POST", "path": "/webhook"}}}
+        start = time.perf_counter()
+        errors += lambda_handler.handler(event, None)["statusCode"] != 200
+        latencies.append(time.perf_counter() - start)
+    busy += sum(latencies)
+    calls += len(bodies)
+
+    failed = 0
+    while True:
+        event = queue.receive(args.batch_size)
+        if event is None:
+            break
+        start = time.perf_counter()
+        response = lambda_handler.handler(event, None)
+        busy += time.perf_counter() - start
+        calls += 1
+        failed += queue.settle(event, response)
+
+    latencies.sort()
+    replies = len(server.deliveries)
+    send_errors = server.requests - replies - server.throttled
+    dead_mids = {json.loads(message["body"])["message_id"] for message in queue.dead}
+    ok = (args.child == "inline"
+          or (len(expected) - len(dead_mids) <= replies <= len(expected) and failed >= send_errors))
+    print(json.dumps({
+        "mode": args.child,
+        "p50_ms": pct(latencies, 50),
+        "p99_ms": pct(latencies, 99),
+        "errors": errors,
+        "calls": calls,
+        "busy_s": busy,
+        "expected": len(expected),
+        "replies": replies,
+        "enqueued": queue.sent,
+        "duplicated": queue.duplicated,
+        "failed": failed,
+        "redriven": queue.redriven,
+        "dlq": len(queue.dead),
+        "send_errors": send_errors,
+        "ok": ok
+    }))
+    server.shutdown()
+
+
+# ─── parent ───
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=10, help="records per consumer invocation")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Graph stub latency per send")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="fraction of sends the stub fails with a 500")
+    parser.add_argument("--sqs-duplicate-rate", type=float, default=0.02, help="records SQS hands out twice")
+    parser.add_argument("--max-receives", type=int, default=5, help="redrive policy maxReceiveCount")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    print(f"{'mode':<8}{'p50 ms':>8}{'p99 ms':>8}{'calls':>7}{'busy s':>8}{'expected':>10}{'replies':>9}{'lost':>6}"
+          f"{'failed':>8}{'redriven':>10}{'dlq':>5}{'send err':>10}")
+    broken = []
+    for mode in args.modes:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", mode],
+                                cwd=ROOT, capture_output=True, text=True)
+        lines = [line for line in output.stdout.splitlines() if line.startswith("{")]
+        if output.returncode or not lines:
+            sys.exit(f"{mode} run failed:\n{output.stderr[-3000:]}")
+        r = json.loads(lines[-1])
+        print(f"{mode:<8}{r['p50_ms']:>8.2f}{r['p99_ms']:>8.2f}{r['calls']:>7}{r['busy_s']:>8.2f}{r['expected']:>10}"
+              f"{r['replies']:>9}{r['expected'] - r['replies']:>6}{r['failed']:>8}{r['redriven']:>10}{r['dlq']:>5}"
+              f"{r['send_errors']:>10}")
+        if not r["ok"]:
+            broken.append(mode)
+    if broken:
+        sys.exit(f"replies don't add up in: {', '.join(broken)}")
+
+
+if __name__ == "__main__":
+    main()
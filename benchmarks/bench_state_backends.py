@@ -0,0 +1,93 @@
+"""
+Throughput of each state backend: dedup insert-if-absent and counter increments.
+
+Usage:
+    python benchmarks/bench_state_backends.py [--ops 20000] [--threads 4] [--redis-url URL]
+
+Without --redis-url the Redis backend runs against the local RESP stand-in
+(benchmarks/resp_stub.py), which measures protocol + round-trip cost rather
+than a real server.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from resp_stub import start_resp_stub  # noqa: E402
+from state_backend import MemoryBackend, RedisBackend, SQLiteBackend  # noqa: E402
+
+
+def run_threads(threads, fn):
+    workers = [threading.Thread(target=fn, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - start
+
+
+def bench(backend, ops, threads, dup_rate):
+    per_thread = ops // threads
+    new_keys = [0] * threads
+
+    def dedup(i):
+        rng = random.Random(i)
+        seen = []
+        for n in range(per_thread):
+            if seen and rng.random() < dup_rate:
+                key = rng.choice(seen)
+            else:
+                key = f"mid.{i}.{n}"
+                seen.append(key)
+            if backend.add_if_absent(key):
+                new_keys[i] += 1
+
+    def counters(i):
+        for _ in range(per_thread):
+            backend.incr("total_received")
+
+    dedup_s = run_threads(threads, dedup)
+    incr_s = run_threads(threads, counters)
+    total = backend.counters().get("total_received")
+    assert total == per_thread * threads, f"lost increments: {total}"
+    return per_thread * threads / dedup_s, per_thread * threads / incr_s, sum(new_keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--dup-rate", type=float, default=0.1)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    stub = None
+    redis_url = args.redis_url
+    if redis_url is None:
+        stub, redis_url = start_resp_stub()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [
+            MemoryBackend(),
+            SQLiteBackend(os.path.join(tmp, "state.db")),
+            RedisBackend(redis_url, prefix=f"bench:{time.time_ns()}:"),
+        ]
+        print(f"{'backend':<10}{'dedup ops/s':>14}{'incr ops/s':>14}{'unique':>10}")
+        for backend in backends:
+            dedup_rate, incr_rate, unique = bench(backend, args.ops, args.threads, args.dup_rate)
+            print(f"{backend.name:<10}{dedup_rate:>14,.0f}{incr_rate:>14,.0f}{unique:>10,}")
+            backend.close()
+
+    if stub is not None:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
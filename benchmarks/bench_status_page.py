@@ -0,0 +1,72 @@
+"""
+Status page throughput: requests/second for /, /stats/live and /test.
+
+Usage:
+    python benchmarks/bench_status_page.py [--seconds 2] [--threads 1]
+
+Requests go through Flask's test client, so this measures the app's own
+per-request cost (routing + rendering), not the network. The "render"
+rows compare filling the pre-rendered home shell against formatting the
+whole template per request, which is what home() used to do.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("INSTAGRAM_USER_ID", "1784")
+
+import app as server  # noqa: E402
+
+
+def rate(fn, seconds, threads):
+    """Calls per second of fn() across threads for about `seconds`"""
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def loop(i):
+        n = 0
+        while time.perf_counter() < deadline:
+            fn()
+            n += 1
+        counts[i] = n
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    client = server.app.test_client()
+    etag = client.get("/test").headers["ETag"]
+    live = server.live_stats()
+    static = {"brand": server.BRAND_NAME, "ig_id": server.IG_ID, "verify_token": server.WEBHOOK_VERIFY_TOKEN}
+
+    cases = [
+        ("GET /", lambda: client.get("/")),
+        ("GET /stats/live", lambda: client.get("/stats/live")),
+        ("GET /stats", lambda: client.get("/stats")),
+        ("GET /test (200)", lambda: client.get("/test")),
+        ("GET /test (304)", lambda: client.get("/test", headers={"If-None-Match": etag})),
+        ("render: full format", lambda: server.HOME_TEMPLATE.format(**static, **live)),
+        ("render: shell", lambda: server.home_page.render(**live)),
+    ]
+    print(f"{'case':<22}{'req/s':>12}")
+    for name, fn in cases:
+        print(f"{name:<22}{rate(fn, args.seconds, args.threads):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Multi-tenant registry: memory per tenant and routing overhead with 1,000+
+Instagram accounts loaded in one process.
+
+Usage:
+    python benchmarks/bench_tenants.py [--tenants 1000 5000] [--posts 3000] [--rounds 5]
+
+Three parts:
+    memory     tracemalloc bytes per tenant once the TENANTS_PATH file is
+               loaded (idle), and once each has had a message (its Graph
+               client on the shared pool, scheduler and rule table set up);
+               next to the RSS of one more app.py process, the cost of a
+               deployment per brand
+    routing    ns per event for ingress (parse_webhook against the registry's
+               accounts) plus TenantRegistry.get(), against the single-account
+               parse_webhook(body, IG_ID) it replaces
+    webhook()  POSTs through app.py's Flask test client with state in memory
+               and sends to a local stub, events spread over every tenant;
+               each tenant count runs in a fresh interpreter
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from webhook_payloads import generate  # noqa: E402
+
+IG_ID = "17841400000000000"
+ENV = {"LOG_LEVEL": "WARNING", "STATE_BACKEND": "memory", "SENDER_REPLY_WINDOW": "0",
+       "SEND_RATE_PER_SECOND": "100000", "SEND_RATE_BURST": "100000",
+       "RECIPIENT_RATE_PER_SECOND": "1000", "RECIPIENT_RATE_BURST": "1000"}
+
+
+def tenant_ids(count):
+    return [f"1784150{i:010d}" for i in range(count)]
+
+
+def write_tenants(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"tenants": [
+            {"ig_id": ig_id, "access_token": f"IGAA-bench-token-{i:06d}", "brand": f"Brand {i}"}
+            for i, ig_id in enumerate(tenant_ids(count))
+        ]}, f)
+
+
+def spread(payloads, ig_ids, seed):
+    """Send each entry of the generated bodies to a random tenant"""
+    rng = random.Random(seed)
+    for payload in payloads:
+        for entry in payload["entry"]:
+            entry["id"] = rng.choice(ig_ids)
+            for event in entry["messaging"]:
+                event["recipient"]["id"] = entry["id"]
+    return payloads
+
+
+def rss_kb(env):
+    """Peak RSS of a fresh interpreter that imports app.py"""
+    code = "import resource, app; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    return int(output.stdout.strip().splitlines()[-1])
+
+
+# ─── memory ───
+
+def memory(counts, tmp):
+    os.environ.update(ENV, INSTAGRAM_USER_ID=IG_ID, GRAPH_API_BASE="http://127.0.0.1:9/v24.0")
+    import app
+    from tenants import TenantRegistry
+
+    process_kb = rss_kb({**os.environ, **ENV})
+    print(f"one more app.py process (a deployment per brand): {process_kb / 1024:.1f} MB RSS\n")
+    print(f"{'tenants':>8}{'load ms':>10}{'idle B/tenant':>15}{'setup ms':>10}{'active B/tenant':>17}")
+    for count in counts:
+        path = os.path.join(tmp, f"tenants_{count}.json")
+        write_tenants(path, count)
+        ig_ids = tenant_ids(count)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        registry = TenantRegistry(app.setup_tenant)
+        registry.load(path)
+        load_s = time.perf_counter() - start
+        idle = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        for ig_id in ig_ids:
+            registry.get(ig_id)
+        setup_s = time.perf_counter() - start
+        active = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert registry.stats()["active"] == count
+
+        print(f"{count:>8}{load_s * 1000:>10.1f}{idle / count:>15,.0f}{setup_s * 1000:>10.1f}"
+              f"{active / count:>17,.0f}")
+        del registry
+
+
+# ─── routing ───
+
+def routing(counts, posts, rounds, seed):
+    import ingress
+    from tenants import Tenant, TenantRegistry
+
+    def setup(tenant):
+        return None, None, object()
+
+    single = [json.dumps(p).encode() for p in generate(posts, ig_id=IG_ID, seed=seed)]
+    events = sum(len(entry["messaging"]) for body in single for entry in json.loads(body)["entry"])
+
+    def best(fn, bodies):
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for body in bodies:
+                fn(body)
+            times.append(time.perf_counter() - start)
+        return min(times) / events * 1e9
+
+    def before(body):
+        return ingress.parse_webhook(body, IG_ID).messages
+
+    print(f"\n{'routing':<22}{'ns/event':>10}")
+    print(f"{'before (one IG_ID)':<22}{best(before, single):>10.0f}")
+    for count in [1] + list(counts):
+        ig_ids = tenant_ids(count)
+        registry = TenantRegistry(setup)
+        for ig_id in ig_ids:
+            registry.add(Tenant(ig_id, "token", "Brand"))
+        bodies = [json.dumps(p).encode() for p in spread(list(generate(posts, ig_id=IG_ID, seed=seed)),
+                                                         ig_ids, seed)]
+
+        def routed(body):
+            for sender_id, message_id, text, recipient_id in ingress.parse_webhook(body, registry.accounts).messages:
+                registry.get(recipient_id)
+
+        print(f"{f'{count} tenant(s)':<22}{best(routed, bodies):>10.0f}")
+
+
+# ─── webhook() ───
+
+def child(args):
+    from graph_stub import start_stub
+
+    server, base = start_stub(record=True)
+    count = args.child
+    ig_ids = tenant_ids(count)
+    path = os.path.join(tempfile.mkdtemp(), "tenants.json")
+    write_tenants(path, count)
+    os.environ.update(ENV, GRAPH_API_BASE=base, TENANTS_PATH=path, INSTAGRAM_USER_ID="")
+    bodies = [json.dumps(p) for p in spread(list(generate(args.posts, ig_id=IG_ID, seed=args.seed)), ig_ids,
+                                            args.seed)]
+
+    import app
+    client = app.app.test_client()
+    start = time.perf_counter()
+    for body in bodies:
+        client.post("/webhook", data=body, content_type="application/json")
+    elapsed = time.perf_counter() - start
+    app.send_queue.shutdown(timeout=300)
+    print(json.dumps({
+        "tenants": count,
+        "posts_per_s": len(bodies) / elapsed,
+        "messages": app.state.counters().get("messages_processed", 0),
+        "messages_per_s": app.state.counters().get("messages_processed", 0) / elapsed,
+        "active": app.tenants.stats()["active"],
+        "replies": len(server.deliveries),
+        "accounts": len({account for account, _ in server.accounts})
+    }))
+    server.shutdown()
+
+
+def webhook(counts, args):
+    print(f"\n{'webhook()':<10}{'posts/s':>9}{'msgs/s':>9}{'active':>8}{'replies':>9}{'accounts':>10}")
+    for count in [1] + list(counts):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", str(count)],
+                                cwd=ROOT, capture_output=True, text=True)
+        lines = [line for line in output.stdout.splitlines() if line.startswith("{")]
+        if output.returncode or not lines:
+            sys.exit(f"{count} tenants run failed:\n{output.stderr[-3000:]}")
+        r = json.loads(lines[-1])
+        print(f"{r['tenants']:<10}{r['posts_per_s']:>9,.0f}{r['messages_per_s']:>9,.0f}{r['active']:>8}"
+              f"{r['replies']:>9}{r['accounts']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--posts", type=int, default=3000)
+    parser.add_argument("--rounds", type=int, default=5, help="best of N passes for routing")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        return child(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory(args.tenants, tmp)
+    routing(args.tenants, args.posts, args.rounds, args.seed)
+    webhook(args.tenants, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Webhook load test: app.py's webhook() and lambda_handler.handler under
+concurrent POSTs, with synthetic or replayed traffic.
+
+Usage:
+    python benchmarks/bench_webhook_load.py [--entry-points flask lambda] [--posts 1000]
+                                            [--concurrency 8] [--latency-ms 20] [--error-rate 0.0]
+                                            [--duplicate-rate 0.05] [--burst-rate 0.15] [--seed 7]
+    python benchmarks/bench_webhook_load.py --replay captured.jsonl
+
+Payloads come from webhook_payloads.generate() (multi-entry POSTs, bursts,
+duplicate mids, redelivered POSTs, non-text events) or, with --replay, from
+a JSONL capture (see webhook_payloads.load_jsonl for the accepted shapes).
+Bodies are serialized up front, so JSON encoding isn't measured.
+
+Each entry point runs in a fresh interpreter with its own Graph stub and
+in-memory state, called in-process (Flask test client / handler(event,
+None)) from --concurrency threads. Reported per entry point:
+    posts/s, msgs/s    webhook POSTs and text messages handled per second
+    p50/p95/p99        webhook response time; Lambda includes the sends,
+                       app.py only queues them
+    errors             non-200 responses (503 = send queue full)
+    dups in / caught   repeated text mids in the input / dedup hits
+    replies, send err  messages the stub accepted / answered with a 500
+    drain s            app.py only: time for the send queue to empty
+                       after the last POST
+
+Environment variables (SEND_WORKERS, WEBHOOK_BATCH_MODE, SENDER_REPLY_WINDOW,
+...) pass through to both entry points. The Graph API rate limits are lifted
+unless set, so the stub's latency is the only send cost.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from graph_stub import start_stub  # noqa: E402
+from webhook_payloads import account_id, generate, load_jsonl  # noqa: E402
+
+IG_ID = "17841400000000000"
+ENTRY_POINTS = ("flask", "lambda")
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float("nan")
+
+
+def duplicates_in(payloads):
+    """Text messages whose mid was already seen earlier in the run"""
+    seen, dups = set(), 0
+    for payload in payloads:
+        for entry in payload.get("entry", []):
+            for event in entry.get("messaging", []):
+                message = event.get("message", {})
+                if message.get("text"):
+                    dups += message.get("mid") in seen
+                    seen.add(message.get("mid"))
+    return dups, len(seen) + dups
+
+
+# ─── child: one entry point ───
+
+def flask_caller():
+    import app
+    client = app.app.test_client()
+
+    def call(body):
+        return client.post("/webhook", data=body, content_type="application/json").status_code
+
+    def drain():
+        # Retries wait in the scheduler's heap, outside the queue, until due
+        while app.scheduler.metrics()["retry_queue"] or app.send_queue.metrics()["depth"]:
+            time.sleep(0.05)
+        app.send_queue.shutdown(timeout=300)
+
+    return app, call, drain
+
+
+def lambda_caller():
+    import lambda_handler
+
+    def call(body):
+        event = {"version": "2.0", "rawPath": "/webhook", "body": body,
+                 "requestContext": {"http": {"method": "POST", "path": "/webhook"}}}
+        return lambda_handler.handler(event, None)["statusCode"]
+
+    return lambda_handler, call, None
+
+
+def child(args):
+    if args.replay:
+        payloads, _ = load_jsonl(args.replay)
+        payloads = (payloads * (args.posts // max(1, len(payloads)) + 1))[:args.posts] if args.loop else payloads
+    else:
+        payloads = list(generate(args.posts, ig_id=IG_ID, duplicate_rate=args.duplicate_rate,
+                                 burst_rate=args.burst_rate, seed=args.seed))
+
+    server, base = start_stub(latency_ms=args.latency_ms, error_rate=args.error_rate, record=True)
+    os.environ.update(GRAPH_API_BASE=base, INSTAGRAM_USER_ID=account_id(payloads) or IG_ID, STATE_BACKEND="memory")
+    for name, value in (("LOG_LEVEL", "WARNING"), ("SEND_RATE_PER_SECOND", "100000"), ("SEND_RATE_BURST", "100000"),
+                        ("RECIPIENT_RATE_PER_SECOND", "1000"), ("RECIPIENT_RATE_BURST", "1000")):
+        os.environ.setdefault(name, value)
+    bodies = [json.dumps(payload) for payload in payloads]
+    dups, messages = duplicates_in(payloads)
+
+    module, call, drain = flask_caller() if args.child == "flask" else lambda_caller()
+    hits_before = module.state.dedup_stats().get("hits", 0)
+
+    def timed(body):
+        start = time.perf_counter()
+        status = call(body)
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(timed, bodies))
+    elapsed = time.perf_counter() - start
+    drain_s = None
+    if drain is not None:
+        drain_start = time.perf_counter()
+        drain()
+        drain_s = time.perf_counter() - drain_start
+
+    latencies = sorted(seconds for _, seconds in results)
+    replies = len(server.deliveries)
+    print(json.dumps({
+        "entry_point": args.child,
+        "posts": len(bodies),
+        "messages": messages,
+        "posts_per_s": len(bodies) / elapsed,
+        "messages_per_s": messages / elapsed,
+        "p50_ms": pct(latencies, 50),
+        "p95_ms": pct(latencies, 95),
+        "p99_ms": pct(latencies, 99),
+        "errors": sum(1 for status, _ in results if status != 200),
+        "duplicates_in": dups,
+        "duplicates_caught": module.state.dedup_stats().get("hits", 0) - hits_before,
+        "replies": replies,
+        "send_errors": server.requests - replies - server.throttled,
+        "drain_s": drain_s
+    }))
+    server.shutdown()
+
+
+# ─── parent ───
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry-points", nargs="+", choices=ENTRY_POINTS, default=list(ENTRY_POINTS))
+    parser.add_argument("--posts", type=int, default=1000, help="POSTs to generate (or, with --loop, to replay)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent webhook calls")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Graph stub latency per send")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of sends the stub fails with a 500")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="fraction of events that repeat a mid")
+    parser.add_argument("--burst-rate", type=float, default=0.15, help="fraction of events that start a burst")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--replay", metavar="JSONL", help="replay captured webhook bodies instead of generating")
+    parser.add_argument("--loop", action="store_true", help="with --replay, repeat the capture up to --posts")
+    parser.add_argument("--child", choices=ENTRY_POINTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    if args.replay:
+        payloads, skipped = load_jsonl(args.replay)
+        if not payloads:
+            sys.exit(f"{args.replay}: no webhook payloads found ({skipped} lines skipped)")
+        print(f"replaying {len(payloads)} payloads from {args.replay} ({skipped} lines skipped)\n")
+
+    print(f"{'entry':<8}{'posts/s':>9}{'msgs/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          f"{'dups in':>9}{'caught':>8}{'replies':>9}{'send err':>10}{'drain s':>9}")
+    for name in args.entry_points:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", name],
+                                cwd=ROOT, capture_output=True, text=True)
+        lines = [line for line in output.stdout.splitlines() if line.startswith("{")]
+        if output.returncode or not lines:
+            sys.exit(f"{name} run failed:\n{output.stderr[-3000:]}")
+        r = json.loads(lines[-1])
+        drain = f"{r['drain_s']:.2f}" if r["drain_s"] is not None else "-"
+        print(f"{name:<8}{r['posts_per_s']:>9,.0f}{r['messages_per_s']:>9,.0f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['errors'] / r['posts']:>8.1%}{r['duplicates_in']:>9}{r['duplicates_caught']:>8}"
+              f"{r['replies']:>9}{r['send_errors']:>10}{drain:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Local stand-in for POST graph.instagram.com/v24.0/{ig-id}/messages.
+
+Run standalone:
+    python benchmarks/graph_stub.py --port 8765 --latency-ms 50
+    python benchmarks/graph_stub.py --quota-rps 20 --throttle-rate 0.05
+
+Throttled requests get HTTP 400 with Graph error code 4 ("Application request
+limit reached"), like the real API; --retry-after adds a Retry-After header.
+
+or start in-process from a benchmark with start_stub().
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class GraphStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real Graph API
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle plus
+        # delayed ACK adds ~40 ms to every keep-alive response
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        server = self.server
+
+        if server.latency:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        now = time.monotonic()
+        with server.lock:
+            server.requests += 1
+            throttled = random.random() < server.throttle_rate
+            if server.quota_rps:
+                # Token bucket with one second of burst
+                server.quota_tokens = min(server.quota_rps, server.quota_tokens + (now - server.quota_updated) * server.quota_rps)
+                server.quota_updated = now
+                if server.quota_tokens >= 1:
+                    server.quota_tokens -= 1
+                else:
+                    throttled = True
+            failing = not throttled and random.random() < server.error_rate
+            server.throttled += throttled
+
+        headers = {}
+        if throttled:
+            status, payload = 400, {"error": {"message": "Application request limit reached", "code": 4, "type": "OAuthException"}}
+            if server.retry_after is not None:
+                headers["Retry-After"] = str(server.retry_after)
+        elif failing:
+            status, payload = 500, {"error": {"message": "An unknown error occurred", "code": 1, "type": "OAuthException"}}
+        else:
+            try:
+                recipient = json.loads(body)["recipient"]["id"]
+            except (ValueError, KeyError, TypeError):
+                recipient = None
+            status, payload = 200, {"recipient_id": recipient, "message_id": f"stub.{time.time_ns()}"}
+            if server.deliveries is not None:
+                with server.lock:
+                    server.deliveries.append((time.monotonic(), recipient))
+                    # /v24.0/{ig-id}/messages, and whose token it came with
+                    account = (self.path.rstrip("/").split("/")[-2:-1] or [None])[0]
+                    server.accounts[account, self.headers.get("Authorization", "")[len("Bearer "):]] += 1
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GraphStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops SYNs when a client opens a large pool at
+    # once, and each retry costs a second
+    request_queue_size = 1024
+
+
+def start_stub(host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+               throttle_rate=0.0, quota_rps=0.0, retry_after=None, record=False):
+    """
+    Start the stub on a daemon thread; returns (server, base_url).
+
+    With record=True, server.deliveries collects (monotonic time, recipient)
+    for every accepted message, and server.accounts counts them by
+    (IG account in the URL, access token).
+    """
+    server = GraphStubServer((host, port), GraphStubHandler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.connections = 0
+    server.latency = latency_ms / 1000
+    server.jitter = jitter_ms / 1000
+    server.error_rate = error_rate
+    server.throttle_rate = throttle_rate
+    server.quota_rps = quota_rps
+    server.quota_tokens = quota_rps
+    server.quota_updated = time.monotonic()
+    server.retry_after = retry_after
+    server.throttled = 0
+    server.deliveries = [] if record else None
+    server.accounts = Counter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v24.0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests throttled at random")
+    parser.add_argument("--quota-rps", type=float, default=0.0, help="throttle anything above this rate (0 = no quota)")
+    parser.add_argument("--retry-after", type=float, default=None)
+    args = parser.parse_args()
+
+    server, base = start_stub(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate,
+                              args.throttle_rate, args.quota_rps, args.retry_after)
+    print(f"Graph API stub listening on {base} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
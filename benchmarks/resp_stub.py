@@ -0,0 +1,120 @@
+"""
+Local Redis-protocol stand-in covering the commands RedisBackend uses
+(PING, AUTH, SELECT, SET [NX] [PX], GET, DEL, HINCRBY, HGETALL).
+
+Run standalone:
+    python benchmarks/resp_stub.py --port 6390
+
+or start in-process from a benchmark with start_resp_stub().
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class RespStubHandler(socketserver.StreamRequestHandler):
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode().split()  # inline command (e.g. redis-cli / telnet)
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            self.wfile.write(self.server.execute(args))
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    data = str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RespStubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RespStubHandler)
+        self.lock = threading.Lock()
+        self.strings = {}  # key -> (value, expires_at or None)
+        self.hashes = {}
+        self.commands = 0
+
+    def _live(self, key, now):
+        item = self.strings.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self.strings[key]
+            return None
+        return item
+
+    def execute(self, args):
+        cmd = args[0].upper()
+        now = time.monotonic()
+        with self.lock:
+            self.commands += 1
+            if cmd in ("PING", "AUTH", "SELECT"):
+                return b"+PONG\r\n" if cmd == "PING" else b"+OK\r\n"
+            if cmd == "SET":
+                key, value, opts = args[1], args[2], [a.upper() for a in args[3:]]
+                expires_at = None
+                if "PX" in opts:
+                    expires_at = now + int(args[3 + opts.index("PX") + 1]) / 1000
+                if "NX" in opts and self._live(key, now) is not None:
+                    return b"$-1\r\n"
+                self.strings[key] = (value, expires_at)
+                return b"+OK\r\n"
+            if cmd == "GET":
+                item = self._live(args[1], now)
+                return _bulk(item[0] if item else None)
+            if cmd == "DEL":
+                removed = sum(1 for key in args[1:] if self.strings.pop(key, None) is not None)
+                return b":%d\r\n" % removed
+            if cmd == "HINCRBY":
+                table = self.hashes.setdefault(args[1], {})
+                table[args[2]] = table.get(args[2], 0) + int(args[3])
+                return b":%d\r\n" % table[args[2]]
+            if cmd == "HGETALL":
+                table = self.hashes.get(args[1], {})
+                return b"*%d\r\n" % (len(table) * 2) + b"".join(_bulk(k) + _bulk(v) for k, v in table.items())
+        return b"-ERR unknown command '%s'\r\n" % cmd.encode()
+
+
+def start_resp_stub(host="127.0.0.1", port=0):
+    """Start the stand-in on a daemon thread; returns (server, url)"""
+    server = RespStubServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://{host}:{server.server_address[1]}/0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    server, url = start_resp_stub(args.host, args.port)
+    print(f"RESP stand-in listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Synthetic and captured Instagram webhook payloads for the load benchmarks.
+
+    payloads = list(generate(1000, ig_id="1784"))
+    payloads, skipped = load_jsonl("captured.jsonl")
+
+generate() mimics what Meta delivers: several entries per POST, several
+messaging events per entry, senders who send a burst of short DMs in a row,
+non-text events (attachments, reactions, read receipts), echoes of the
+account's own replies, and redeliveries, i.e. a message (or the whole POST)
+arriving again with the same mid.
+
+load_jsonl() reads captured traffic, one JSON object per line, in any of
+the shapes this repo produces:
+    - a webhook body            {"object": "instagram", "entry": [...]}
+    - an API Gateway event      {"body": "<webhook body as a string>", ...}
+    - an app.py log line        {"event": "webhook_payload", "payload": "<body>"}
+    - a lambda_handler log line {"event": "lambda_event", "request": {...}}
+so LOG_PAYLOAD_SAMPLE_RATE=1 on either entry point records replayable
+traffic. Anything else (blank lines, other log events) is skipped and
+counted.
+"""
+import json
+import random
+import time
+
+TEXTS = [
+    "hi", "hey!", "hello", "good morning",
+    "how much is this?", "price?", "what's the cost of the blue one",
+    "do you ship to canada?", "when will my order arrive", "tracking number pls",
+    "is the medium in stock", "is this still available?", "restock when?",
+    "can I return it", "i want a refund", "exchange for a larger size?",
+    "any discount code?", "is there a sale this weekend",
+    "what size should I get", "what material is it", "dimensions?",
+    "I ordered last week", "how do I buy this", "order 48213",
+    "thanks!", "thank you so much", "ty",
+    "is it good quality?", "would you recommend it",
+    "do you take paypal", "can I pay cash",
+    "my package arrived damaged", "wrong item sent", "problem with my order",
+    "how can I contact support", "need help",
+    "love this 😍", "🔥🔥🔥", "ok", "lol",
+]
+REPLY = "Great question! All our prices are shown on each post. Looking for something specific?"
+BURST = [["hey", "how much", "for the red one"], ["hi", "do you ship to canada?"],
+         ["hello!", "is the medium in stock", "the black one", "thanks"]]
+
+
+def message_event(ig_id, sender_id, mid, text=None, timestamp=None):
+    """One messaging[] item; without text it carries an image attachment instead"""
+    message = {"mid": mid}
+    if text is None:
+        message["attachments"] = [{"type": "image", "payload": {"url": f"https://lookaside.example/{mid}"}}]
+    else:
+        message["text"] = text
+    return {"sender": {"id": sender_id}, "recipient": {"id": ig_id},
+            "timestamp": timestamp or int(time.time() * 1000), "message": message}
+
+
+def generate(posts, ig_id="17841400000000000", senders=500, max_entries=3, max_events=3,
+             burst_rate=0.15, duplicate_rate=0.05, redelivery_rate=0.02, non_text_rate=0.05, echo_rate=0.0,
+             seed=7):
+    """
+    Yield `posts` webhook bodies (dicts). Rates are per event (burst,
+    duplicate, non-text, echo) or per POST (redelivery of an earlier body).
+    """
+    rng = random.Random(seed)
+    seen_mids = []
+    sent = []
+    counter = 0
+    now = int(time.time() * 1000)
+
+    def new_mid():
+        nonlocal counter
+        counter += 1
+        return f"aWdfZAG1faXRlbToxOklH{seed}_{counter}"
+
+    for _ in range(posts):
+        if sent and rng.random() < redelivery_rate:
+            # Meta retries a POST it got no 200 for, unchanged
+            yield rng.choice(sent)
+            continue
+
+        entries = []
+        for _ in range(rng.randint(1, max_entries)):
+            now += rng.randint(1, 400)
+            events = []
+            for _ in range(rng.randint(1, max_events)):
+                sender_id = f"{rng.randint(1, senders):016d}"
+                roll = rng.random()
+                if seen_mids and roll < duplicate_rate:
+                    sender_id, mid, text = rng.choice(seen_mids)
+                    events.append(message_event(ig_id, sender_id, mid, text, now))
+                elif roll < duplicate_rate + non_text_rate:
+                    kind = rng.choice(("attachment", "reaction", "read"))
+                    if kind == "attachment":
+                        events.append(message_event(ig_id, sender_id, new_mid(), None, now))
+                    elif seen_mids:
+                        target = rng.choice(seen_mids)[1]
+                        other = {"reaction": {"mid": target, "action": "react", "reaction": "love"}} \
+                            if kind == "reaction" else {"read": {"mid": target}}
+                        events.append({"sender": {"id": sender_id}, "recipient": {"id": ig_id},
+                                       "timestamp": now, **other})
+                elif roll < duplicate_rate + non_text_rate + echo_rate:
+                    # Our own reply, delivered back to us
+                    event = message_event(sender_id, ig_id, new_mid(), REPLY, now)
+                    event["message"]["is_echo"] = True
+                    events.append(event)
+                elif roll < duplicate_rate + non_text_rate + echo_rate + burst_rate:
+                    for text in rng.choice(BURST):
+                        mid = new_mid()
+                        now += rng.randint(300, 3000)
+                        seen_mids.append((sender_id, mid, text))
+                        events.append(message_event(ig_id, sender_id, mid, text, now))
+                else:
+                    mid, text = new_mid(), rng.choice(TEXTS)
+                    seen_mids.append((sender_id, mid, text))
+                    events.append(message_event(ig_id, sender_id, mid, text, now))
+            entries.append({"id": ig_id, "time": now, "messaging": events})
+
+        body = {"object": "instagram", "entry": entries}
+        sent.append(body)
+        del seen_mids[:-1000]
+        del sent[:-100]
+        yield body
+
+
+def from_record(record):
+    """The webhook body inside one captured line, or None"""
+    if not isinstance(record, dict):
+        return None
+    if "entry" in record:
+        return record
+    if "payload" in record:
+        record = {"body": record["payload"]}  # app.py logs the raw body as a string
+    elif isinstance(record.get("request"), dict):
+        record = record["request"]
+    body = record.get("body")
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return None
+    if isinstance(body, dict) and "entry" in body:
+        return body
+    return None
+
+
+def load_jsonl(path):
+    """Returns (webhook bodies, lines skipped)"""
+    payloads, skipped = [], 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                payload = from_record(json.loads(line)) if line.strip() else None
+            except ValueError:
+                payload = None
+            if payload is None:
+                skipped += 1
+            else:
+                payloads.append(payload)
+    return payloads, skipped
+
+
+def message_count(payload):
+    """Text messages in a body (what the app can reply to)"""
+    return sum(1 for entry in payload.get("entry", []) for event in entry.get("messaging", [])
+               if event.get("message", {}).get("text"))
+
+
+def account_id(payloads):
+    """The IG account a capture was sent to (app.py skips other recipients)"""
+    for payload in payloads:
+        for entry in payload.get("entry", []):
+            for event in entry.get("messaging", []):
+                if event.get("recipient", {}).get("id"):
+                    return event["recipient"]["id"]
+    return None
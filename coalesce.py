@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# INBOUND MESSAGE COALESCING
+# ══════════════════════════════════════════════════════════
+#
+# People split one question over several DMs ("hey" / "how much" / "for the
+# red one"). Instead of answering each, a sender's messages are buffered
+# until they go quiet for `window` seconds, then handed over as one burst.
+#
+#   - every new message pushes the sender's deadline out by `window`
+#   - a burst is flushed at `max_wait` after its first message regardless,
+#     or as soon as it holds `max_messages`
+#
+# Deadlines live in a heap drained by one timer thread (the same pattern as
+# the scheduler's retry queue). Entries are not removed when a deadline
+# moves: each move pushes a new one, and stale entries are skipped on pop.
+
+
+class Burst:
+    __slots__ = ("sender_id", "account", "messages", "first_at", "due")
+
+    def __init__(self, sender_id, account, now):
+        self.sender_id = sender_id
+        self.account = account  # the IG account the sender wrote to
+        self.messages = []  # [(message_id, text), ...] in arrival order
+        self.first_at = now
+        self.due = now
+
+
+class MessageCoalescer:
+    """Buffers each sender's messages and calls flush(sender_id, messages, account) once per burst"""
+
+    def __init__(self, window, flush, max_wait=None, max_messages=10, name="coalesce"):
+        self.window = window
+        self.flush = flush
+        self.max_wait = max(window, max_wait if max_wait is not None else window * 3)
+        self.max_messages = max(1, max_messages)
+        self.name = name
+
+        self._bursts = {}  # sender_id -> open Burst
+        self._heap = []    # (due, seq, burst)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._timer = None
+        self._closed = False
+
+        self.messages_in = 0
+        self.bursts_out = 0
+        self.largest_burst = 0
+
+    def add(self, sender_id, message_id, text, account=None):
+        """Buffer a message; returns False once closed (caller handles it directly)"""
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                return False
+            burst = self._bursts.get(sender_id)
+            if burst is None:
+                burst = self._bursts[sender_id] = Burst(sender_id, account, now)
+            burst.messages.append((message_id, text))
+            if len(burst.messages) >= self.max_messages:
+                burst.due = now
+            else:
+                burst.due = min(now + self.window, burst.first_at + self.max_wait)
+            heapq.heappush(self._heap, (burst.due, next(self._seq), burst))
+            self.messages_in += 1
+            if self._timer is None:
+                # Started lazily, like the send workers, so it runs in the serving process
+                self._timer = threading.Thread(target=self._run, name=f"{self.name}-timer", daemon=True)
+                self._timer.start()
+            self._cond.notify()
+        return True
+
+    def _take_due(self):
+        # Caller holds the lock; blocks until at least one burst is due
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, burst = heapq.heappop(self._heap)
+                if self._bursts.get(burst.sender_id) is not burst:
+                    continue  # already flushed
+                if burst.due > due:
+                    continue  # a later heap entry covers the new deadline
+                del self._bursts[burst.sender_id]
+                return burst
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                burst = self._take_due()
+            self._emit(burst)
+
+    def _emit(self, burst):
+        self.bursts_out += 1
+        self.largest_burst = max(self.largest_burst, len(burst.messages))
+        try:
+            self.flush(burst.sender_id, burst.messages, burst.account)
+        except Exception:
+            logger.exception("coalesce_flush_error")
+
+    def close(self):
+        """Stop buffering and flush every open burst now (on the calling thread)"""
+        with self._cond:
+            self._closed = True
+            bursts = list(self._bursts.values())
+            self._bursts.clear()
+            self._heap.clear()
+        for burst in bursts:
+            self._emit(burst)
+
+    def __len__(self):
+        return len(self._bursts)
+
+    def stats(self):
+        with self._cond:
+            buffered = sum(len(b.messages) for b in self._bursts.values())
+            return {
+                "window_ms": round(self.window * 1000, 3),
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "max_messages": self.max_messages,
+                "buffered_senders": len(self._bursts),
+                "buffered_messages": buffered,
+                "messages_in": self.messages_in,
+                "bursts_out": self.bursts_out,
+                "merged": self.messages_in - buffered - self.bursts_out,  # replies saved
+                "largest_burst": self.largest_burst
+            }
@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from structured_log import log_event
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# CONVERSATION LOG
+# ══════════════════════════════════════════════════════════
+#
+# Fixed-capacity ring of recent conversations. When a slot is overwritten the
+# old record is handed to a background writer that appends it, in batches, to
+# a rotating JSONL file. Memory stays flat however long the server runs.
+
+
+class ConversationRecord:
+    __slots__ = ("timestamp", "sender_id", "inbound", "reply", "sent")
+
+    def __init__(self, timestamp, sender_id, inbound, reply, sent):
+        self.timestamp = timestamp
+        self.sender_id = sender_id
+        self.inbound = inbound
+        self.reply = reply
+        self.sent = sent
+
+    def as_dict(self):
+        return {
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
+            "sender_id": self.sender_id,
+            "inbound": self.inbound,
+            "reply": self.reply,
+            "sent": self.sent
+        }
+
+
+class ConversationLog:
+    """Ring buffer of recent conversations with optional async spill to disk"""
+
+    def __init__(self, capacity=1000, spill_path=None, batch_size=256, flush_interval=1.0,
+                 max_bytes=50 * 1024 * 1024, backups=5):
+        self.capacity = max(1, capacity)
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+        self._ring = [None] * self.capacity
+        self._next = 0       # slot the next record goes into
+        self._total = 0      # records ever appended
+        self._lock = threading.Lock()
+
+        self.spilled = 0
+        self.dropped = 0
+        self._spill_queue = None
+        self._writer = None
+        if spill_path:
+            self._spill_queue = queue.Queue(maxsize=self.capacity * 4)
+            self._writer = threading.Thread(target=self._write_loop, name="conversation-spill", daemon=True)
+            self._writer.start()
+
+    def append(self, sender_id, inbound, reply, sent):
+        record = ConversationRecord(time.time(), sender_id, inbound, reply, sent)
+        with self._lock:
+            evicted = self._ring[self._next]
+            self._ring[self._next] = record
+            self._next = (self._next + 1) % self.capacity
+            self._total += 1
+        if evicted is not None:
+            self._spill(evicted)
+
+    def _spill(self, record):
+        if self._spill_queue is None:
+            return
+        try:
+            self._spill_queue.put_nowait(record)
+        except queue.Full:
+            # Writer can't keep up; losing a log line beats unbounded memory
+            self.dropped += 1
+
+    def recent(self, n=5):
+        """Last n conversations, oldest first (like history[-n:])"""
+        with self._lock:
+            n = min(n, self._total, self.capacity)
+            slots = [(self._next - n + i) % self.capacity for i in range(n)]
+            return [self._ring[i].as_dict() for i in slots]
+
+    def __len__(self):
+        return self._total
+
+    # ─── background writer ───
+
+    def _write_loop(self):
+        while True:
+            batch = []
+            try:
+                item = self._spill_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._spill_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError as e:
+                    log_event(logger, "conversation_spill_failed", logging.ERROR, error=str(e), dropped=len(batch))
+                    self.dropped += len(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        lines = "".join(json.dumps(r.as_dict(), ensure_ascii=False) + "\n" for r in batch)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            size = f.tell()
+        self.spilled += len(batch)
+        if self.max_bytes and size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """conversations.jsonl -> .1 -> .2 ... keeping `backups` files"""
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.spill_path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.spill_path}.{i + 1}")
+        if self.backups:
+            os.replace(self.spill_path, f"{self.spill_path}.1")
+        else:
+            os.remove(self.spill_path)
+
+    def close(self, timeout=10):
+        """Spill what is still in the ring and stop the writer"""
+        if self._writer is None:
+            return
+        with self._lock:
+            remaining = [self._ring[(self._next + i) % self.capacity] for i in range(self.capacity)]
+        for record in remaining:
+            if record is not None:
+                self._spill_queue.put(record)
+        self._spill_queue.put(None)
+        self._writer.join(timeout)
+        self._writer = None
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "buffered": min(self._total, self.capacity),
+            "total": self._total,
+            "spill_path": self.spill_path,
+            "spilled": self.spilled,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,297 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# CONVERSATION STORE
+# ══════════════════════════════════════════════════════════
+#
+# Every reply outcome, kept in SQLite and queryable by sender, time range
+# and category (the ring in conversation_log.py only holds the latest few).
+#
+#   - add() never blocks the send path: rows go to a bounded queue and a
+#     background writer inserts them in batches, one transaction each
+#   - one index per way in: (sender_id, ts), (sender_id, category, ts),
+#     (account, ts), (account, category, ts), (category, ts) and (ts). A
+#     query walks the one matching its filters, newest first, and stops
+#     after `limit` rows, so its cost doesn't grow with the table
+#   - pages are keyset, not OFFSET: the cursor is the (ts, id) of the last
+#     row returned, and the next page starts just below it
+#   - readers get their own connection per thread (WAL: they don't wait
+#     for the writer)
+
+MAX_PAGE = 500
+PRUNE_BATCH = 10000
+COLUMNS = "id, ts, account, sender_id, message_id, category, inbound, reply, sent"
+
+
+def parse_time(value):
+    """Unix seconds or an ISO 8601 timestamp -> seconds; None passes through"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        raise ValueError(f"not a timestamp: {value!r}") from None
+
+
+def parse_cursor(cursor):
+    """The `next` value of a previous page -> (ts, id)"""
+    try:
+        ts, row_id = cursor.split(",")
+        return float(ts), int(row_id)
+    except (AttributeError, ValueError):
+        raise ValueError(f"bad cursor: {cursor!r}") from None
+
+
+class ConversationStore:
+    """SQLite conversation history with write-behind inserts and indexed, paginated queries"""
+
+    def __init__(self, path, batch_size=500, flush_interval=0.5, queue_size=100000, retention_days=0.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+
+        self._conn = None
+        self._pid = None
+        self._local = threading.local()  # reader connections
+        self._lock = threading.Lock()  # writer start-up
+        self._queue_size = queue_size
+        self._queue = None
+        self._writer = None
+        self._writer_pid = None
+        self._pruned_at = 0.0
+
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._connection()
+        self._start_writer()
+
+    def _connection(self):
+        # The writer's connection; reopened after a fork
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " id INTEGER PRIMARY KEY, ts REAL NOT NULL, account TEXT, sender_id TEXT NOT NULL,"
+                " message_id TEXT, category TEXT, inbound TEXT, reply TEXT, sent INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_sender ON conversations (sender_id, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_sender_category"
+                         " ON conversations (sender_id, category, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_account ON conversations (account, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_account_category"
+                         " ON conversations (account, category, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_category ON conversations (category, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_ts ON conversations (ts)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # ─── write path ───
+
+    def _start_writer(self):
+        # Threads don't survive a fork: a worker forked from a preloading
+        # master starts its own writer (and queue) on its first add()
+        self._queue = queue.Queue(maxsize=self._queue_size)
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-store", daemon=True)
+        self._writer_pid = os.getpid()
+        self._writer.start()
+
+    def add(self, sender_id, message_id, inbound, category, reply, sent, account=None, timestamp=None):
+        """Queue one reply outcome for the writer; dropped (and counted) if it is far behind"""
+        row = (timestamp or time.time(), account, sender_id, message_id, category, inbound, reply, int(bool(sent)))
+        if self._writer_pid != os.getpid():
+            with self._lock:
+                if self._writer_pid != os.getpid():
+                    self._start_writer()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._prune()
+                continue
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            if rows:
+                try:
+                    self._write(rows)
+                except Exception:
+                    logger.exception("conversation_store_write_error")
+                    self.dropped += len(rows)
+            for _ in batch:
+                self._queue.task_done()
+            if len(rows) < len(batch):
+                return
+            self._prune()
+
+    def _write(self, rows):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO conversations (ts, account, sender_id, message_id, category, inbound, reply, sent)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.written += len(rows)
+        self.batches += 1
+
+    def _prune(self):
+        """
+        Delete rows older than retention_days, at most once a minute and
+        PRUNE_BATCH rows at a time so inserts aren't held up behind it
+        """
+        now = time.time()
+        if not self.retention_days or now - self._pruned_at < 60:
+            return
+        try:
+            deleted = self._connection().execute(
+                "DELETE FROM conversations WHERE id IN (SELECT id FROM conversations INDEXED BY conversations_ts"
+                " WHERE ts < ? LIMIT ?)", (now - self.retention_days * 86400, PRUNE_BATCH)
+            ).rowcount
+        except Exception:
+            logger.exception("conversation_store_prune_error")
+            deleted = 0
+        self.pruned += deleted
+        # A full batch means there is more: go again on the next pass
+        self._pruned_at = 0.0 if deleted >= PRUNE_BATCH else now
+
+    def flush(self, timeout=None):
+        """Wait until everything added so far is written"""
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # ─── queries ───
+
+    def query(self, sender=None, category=None, since=None, until=None, account=None, limit=50, cursor=None):
+        """
+        Conversations matching every given filter, newest first. since /
+        until are unix seconds (until is exclusive); cursor is the `next` of
+        the previous page. Returns (records, next cursor or None).
+        """
+        limit = max(1, min(int(limit), MAX_PAGE))
+        clauses, params = [], []
+        if sender is not None:
+            clauses.append("sender_id = ?")
+            params.append(sender)
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        if account is not None:
+            clauses.append("account = ?")
+            params.append(account)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if cursor is not None:
+            ts, row_id = parse_cursor(cursor)
+            # ts <= ? bounds the index range; rows sharing that ts continue below its id
+            clauses.append("ts <= ? AND (ts < ? OR id < ?)")
+            params += [ts, ts, row_id]
+        # Walk the index that matches the filters. A sender is narrower than an
+        # account, so with both the account is checked per row
+        if sender is not None:
+            index = "conversations_sender_category" if category is not None else "conversations_sender"
+        elif account is not None:
+            index = "conversations_account_category" if category is not None else "conversations_account"
+        else:
+            index = "conversations_category" if category is not None else "conversations_ts"
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT {COLUMNS} FROM conversations INDEXED BY {index} {where} ORDER BY ts DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1][1]!r},{rows[-1][0]}" if more else None
+        return [self._as_dict(row) for row in rows], next_cursor
+
+    @staticmethod
+    def _as_dict(row):
+        row_id, ts, account, sender_id, message_id, category, inbound, reply, sent = row
+        return {
+            "id": row_id,
+            "timestamp": datetime.fromtimestamp(ts).isoformat(),
+            "account": account,
+            "sender_id": sender_id,
+            "message_id": message_id,
+            "category": category,
+            "inbound": inbound,
+            "reply": reply,
+            "sent": bool(sent)
+        }
+
+    # ─── stats ───
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "written": self.written,
+            "batches": self.batches,
+            "rows_per_batch": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "pruned": self.pruned,
+            "retention_days": self.retention_days
+        }
+
+    def close(self, timeout=10):
+        """Write what is queued and stop the writer"""
+        if self._writer is None or self._writer_pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._writer.join(timeout)
+        self._writer = None
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
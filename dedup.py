@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# ══════════════════════════════════════════════════════════
+# DEDUP STORE
+# ══════════════════════════════════════════════════════════
+#
+# Bounded, time-expiring replacement for the old processed_messages set.
+# Keys are kept in insertion order with a fixed TTL, so the oldest entry is
+# always the next to expire: expiry and size eviction both pop from the front.
+
+
+class DedupStore:
+    """Insertion-ordered TTL ring with O(1) insert-if-absent"""
+
+    def __init__(self, max_size=100_000, ttl=86_400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> expires_at (monotonic)
+        self._lock = threading.Lock()
+        self._key_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self, now):
+        entries = self._entries
+        while entries:
+            key, expires_at = next(iter(entries.items()))
+            if expires_at > now and len(entries) <= self.max_size:
+                break
+            entries.popitem(last=False)
+            self._key_bytes -= sys.getsizeof(key)
+            self.evictions += 1
+
+    def add_if_absent(self, key):
+        """Record key; True if it was new, False if it is a duplicate"""
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is not None and expires_at > now:
+                self.hits += 1
+                return False
+            if expires_at is not None:
+                del self._entries[key]
+                self._key_bytes -= sys.getsizeof(key)
+            self._entries[key] = now + self.ttl
+            self._key_bytes += sys.getsizeof(key)
+            self.misses += 1
+            self._evict(now)
+            return True
+
+    def discard(self, key):
+        """Forget key so a redelivery is processed again"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._key_bytes -= sys.getsizeof(key)
+
+    def __contains__(self, key):
+        expires_at = self._entries.get(key)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory_bytes(self):
+        """Approximate footprint: table + keys + expiry floats"""
+        with self._lock:
+            return sys.getsizeof(self._entries) + self._key_bytes + len(self._entries) * sys.getsizeof(0.0)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_bytes": self.memory_bytes()
+        }
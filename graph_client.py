@@ -0,0 +1,229 @@
+import json
+import threading
+
+# ══════════════════════════════════════════════════════════
+# GRAPH API TRANSPORT
+# ══════════════════════════════════════════════════════════
+#
+# One pooled keep-alive session per process. Reusing it skips the TCP+TLS
+# handshake to graph.instagram.com on every reply; in Lambda the module-level
+# client survives across warm invocations.
+#
+# `requests` is imported when the first message is sent, not at module
+# load, so Lambda cold starts that only verify the webhook or answer
+# /health never pay for it.
+#
+# Serving several accounts (tenants.py), for_account() gives each its own
+# token and endpoint on the same pool: every account talks to the same
+# host, so one set of keep-alive connections serves them all.
+
+
+class GraphClient:
+    """Pooled HTTP client for the Instagram messages endpoint"""
+
+    def __init__(self, access_token, endpoint, pool_size=10, connect_timeout=3.05, read_timeout=10):
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+
+        # Built once, merged into every request by the session
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        self._session = None
+        self._lock = threading.Lock()
+        self._pool_owner = None  # the client whose session this one borrows
+        self._request_headers = None
+
+    def for_account(self, access_token, endpoint):
+        """A client for another account's token and endpoint, sharing this one's pool"""
+        client = GraphClient(access_token, endpoint, self.pool_size, *self.timeout)
+        client._pool_owner = self
+        client._request_headers = {"Authorization": client.headers["Authorization"]}
+        return client
+
+    @property
+    def session(self):
+        if self._pool_owner is not None:
+            return self._pool_owner.session
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def send_message(self, recipient_id, text):
+        """POST a text DM and return the raw response"""
+        payload = {
+            "recipient": {"id": recipient_id},
+            "message": {"text": text[:1000]}  # Instagram 1000 char limit
+        }
+        return self.session.post(self.endpoint, json=payload, headers=self._request_headers, timeout=self.timeout)
+
+    def close(self):
+        # A borrowed pool is closed by its owner
+        if self._session is not None:
+            self._session.close()
+
+
+class AsyncGraphClient:
+    """
+    GraphClient for asyncio (asgi_app.py): pooled httpx.AsyncClients.
+
+    Connections are capped at pool_size; sends beyond that wait for a free
+    connection without holding a thread. The pool is split across clients of
+    SHARD_CONNECTIONS each, used round-robin: httpcore rescans every
+    connection of a pool on each request and response, which with ~100
+    connections costs more than the sends. httpx is imported on first send.
+    """
+
+    SHARD_CONNECTIONS = 10
+
+    def __init__(self, access_token, endpoint, pool_size=100, connect_timeout=3.05, read_timeout=10):
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        self._clients = []
+        self._next = 0
+        self._pool_owner = None
+        self._request_headers = None
+
+    def for_account(self, access_token, endpoint):
+        """A client for another account's token and endpoint, sharing this one's pool"""
+        client = AsyncGraphClient(access_token, endpoint, self.pool_size, self.connect_timeout, self.read_timeout)
+        client._pool_owner = self
+        client._request_headers = {"Authorization": client.headers["Authorization"]}
+        return client
+
+    @property
+    def client(self):
+        if self._pool_owner is not None:
+            return self._pool_owner.client
+        # Only touched from the event loop thread, so no lock
+        if not self._clients:
+            import httpx
+
+            shards = max(1, -(-self.pool_size // self.SHARD_CONNECTIONS))
+            per_shard = -(-self.pool_size // shards)
+            self._clients = [
+                httpx.AsyncClient(
+                    headers=self.headers,
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=None),
+                    limits=httpx.Limits(max_connections=per_shard, max_keepalive_connections=per_shard)
+                )
+                for _ in range(shards)
+            ]
+        self._next = (self._next + 1) % len(self._clients)
+        return self._clients[self._next]
+
+    async def send_message(self, recipient_id, text):
+        """POST a text DM and return the raw httpx response"""
+        payload = {
+            "recipient": {"id": recipient_id},
+            "message": {"text": text[:1000]}  # Instagram 1000 char limit
+        }
+        return await self.client.post(self.endpoint, json=payload, headers=self._request_headers)
+
+    async def close(self):
+        clients, self._clients = self._clients, []
+        for client in clients:
+            await client.aclose()
+
+
+# ══════════════════════════════════════════════════════════
+# SEND RESULTS
+# ══════════════════════════════════════════════════════════
+
+# Graph API error codes that mean "slow down" rather than "this message is bad"
+THROTTLE_CODES = {4, 17, 32, 613, 80002}
+# Temporary server-side failures worth retrying
+TRANSIENT_CODES = {1, 2}
+
+
+def _usage_wait(headers):
+    """Seconds until quota returns, from the X-Business-Use-Case-Usage header"""
+    raw = headers.get("X-Business-Use-Case-Usage")
+    if raw:
+        try:
+            usages = [u for entries in json.loads(raw).values() for u in entries]
+            minutes = max((u.get("estimated_time_to_regain_access", 0) for u in usages), default=0)
+            if minutes:
+                return minutes * 60.0
+        except (ValueError, AttributeError, TypeError):
+            pass
+    return None
+
+
+class SendResult:
+    """Outcome of one send attempt, parsed from the Graph API response"""
+
+    __slots__ = ("ok", "status", "error_code", "error_message", "message_id", "retry_after")
+
+    def __init__(self, ok, status=None, error_code=None, error_message=None, message_id=None, retry_after=None):
+        self.ok = ok
+        self.status = status
+        self.error_code = error_code
+        self.error_message = error_message
+        self.message_id = message_id
+        self.retry_after = retry_after
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def throttled(self):
+        return self.status == 429 or self.error_code in THROTTLE_CODES
+
+    @property
+    def retryable(self):
+        return (self.throttled or self.status is None or self.status >= 500
+                or self.error_code in TRANSIENT_CODES)
+
+    @classmethod
+    def from_response(cls, response):
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code == 200:
+            return cls(True, 200, message_id=body.get("message_id", "unknown"))
+
+        error = body.get("error", {}) if isinstance(body, dict) else {}
+        retry_after = None
+        header = response.headers.get("Retry-After")
+        if header:
+            try:
+                retry_after = float(header)
+            except ValueError:
+                pass
+        if retry_after is None:
+            retry_after = _usage_wait(response.headers)
+        return cls(
+            False,
+            response.status_code,
+            error_code=error.get("code"),
+            error_message=error.get("message", response.text),
+            retry_after=retry_after
+        )
+
+    @classmethod
+    def from_exception(cls, exc):
+        # Timeouts / connection errors: no status, always retryable
+        return cls(False, None, error_message=str(exc))
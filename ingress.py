@@ -0,0 +1,124 @@
+import hashlib
+import hmac
+import json
+
+# ══════════════════════════════════════════════════════════
+# WEBHOOK INGRESS
+# ══════════════════════════════════════════════════════════
+#
+# The first step for a webhook POST, shared by app.py, asgi_app.py and
+# lambda_handler.py, working from the raw request bytes:
+#   1. verify X-Hub-Signature-256 (HMAC-SHA256 of the body with the app
+#      secret) before anything is parsed
+#   2. skip the parse when the body holds no "text" key at all (a payload
+#      of read receipts / reactions / attachments only)
+#   3. parse once, with orjson when it is installed
+#   4. keep only text DMs to the accounts served here (one, or a tenant
+#      registry's): echoes of our own replies, read receipts, reactions,
+#      attachments and other-account events are counted by reason and never
+#      reach dedup or the reply pipeline
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib parser is ~2-3x slower
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+SIGNATURE_PREFIX = "sha256="
+DROP_REASONS = ("no_text", "echo", "other_account")
+
+
+def loads(body):
+    """Parse a JSON body (bytes or str) with the fastest available backend"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def verify_signature(body, header, secret):
+    """
+    Whether `header` ("sha256=<hex>") is the HMAC-SHA256 of the raw body
+    under the app secret. An empty secret disables the check.
+    """
+    if not secret:
+        return True
+    if not header or not header.startswith(SIGNATURE_PREFIX):
+        return False
+    if isinstance(secret, str):
+        secret = secret.encode("utf-8")
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header[len(SIGNATURE_PREFIX):].strip().lower())
+
+
+class WebhookEvents:
+    """
+    A payload reduced to the messages worth replying to.
+
+    messages is [(sender_id, message_id, text, recipient_id), ...] in
+    arrival order; events counts every messaging[] item and dropped counts
+    the rest by reason. prefiltered means the body was skipped unparsed
+    (events unknown).
+    """
+
+    __slots__ = ("messages", "events", "dropped", "prefiltered")
+
+    def __init__(self, messages=None, events=0, dropped=None, prefiltered=False):
+        self.messages = messages if messages is not None else []
+        self.events = events
+        self.dropped = dropped if dropped is not None else dict.fromkeys(DROP_REASONS, 0)
+        self.prefiltered = prefiltered
+
+    @property
+    def skipped(self):
+        return sum(self.dropped.values())
+
+    def by_account(self):
+        """{recipient_id: [(sender_id, message_id, text), ...]}, each in arrival order"""
+        accounts = {}
+        for sender_id, message_id, text, recipient_id in self.messages:
+            accounts.setdefault(recipient_id, []).append((sender_id, message_id, text))
+        return accounts
+
+
+def parse_webhook(body, accounts=None):
+    """
+    Raw webhook body -> WebhookEvents for `accounts`: one IG account ID, a
+    collection of them (anything supporting `in`), or None for any account.
+    """
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if b'"text"' not in body:
+        return WebhookEvents(prefiltered=True)
+    return filter_events(loads(body), accounts)
+
+
+def filter_events(data, accounts=None):
+    """Already-parsed payload -> WebhookEvents; anything that isn't an object yields none"""
+    if isinstance(accounts, str):
+        accounts = (accounts,)
+    result = WebhookEvents()
+    if not isinstance(data, dict):
+        return result
+    messages, dropped = result.messages, result.dropped
+    for entry in data.get("entry") or ():
+        if not isinstance(entry, dict):
+            continue
+        for event in entry.get("messaging") or ():
+            if not isinstance(event, dict):
+                continue
+            result.events += 1
+            message = event.get("message")
+            text = message.get("text") if isinstance(message, dict) else None
+            if not text:
+                dropped["no_text"] += 1
+                continue
+            sender_id = (event.get("sender") or {}).get("id")
+            if message.get("is_echo") or (accounts is not None and sender_id in accounts):
+                dropped["echo"] += 1
+                continue
+            recipient_id = (event.get("recipient") or {}).get("id")
+            if accounts is not None and recipient_id not in accounts:
+                dropped["other_account"] += 1
+                continue
+            messages.append((sender_id, message.get("mid"), text, recipient_id))
+    return result
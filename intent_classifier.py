@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+
+from structured_log import log_event
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# SEMANTIC INTENT CLASSIFIER (optional)
+# ══════════════════════════════════════════════════════════
+#
+# Embeds a handful of example messages per category once, stores the
+# normalised vectors as a .npy file and memory-maps it, so every gunicorn
+# worker shares the same pages. Incoming DMs are embedded in one batch and
+# scored against every example with one matrix product; the best example's
+# category wins if its cosine similarity clears the threshold, otherwise the
+# caller falls back to keyword matching.
+#
+# Needs numpy + sentence-transformers (see requirements.txt); both are
+# imported only when a classifier is created. Runs on CPU.
+
+
+def examples_fingerprint(model_name, examples):
+    """Changes whenever the model or any example does, invalidating the index"""
+    blob = json.dumps([model_name, examples], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+class IntentIndex:
+    """Example embeddings (rows, L2-normalised) and the category of each row"""
+
+    def __init__(self, vectors, labels, categories):
+        self.vectors = vectors
+        self.labels = labels
+        self.categories = categories
+
+    @staticmethod
+    def meta_path(path):
+        return os.path.splitext(path)[0] + ".json"
+
+    @classmethod
+    def build(cls, encode, examples, path, fingerprint):
+        """Embed {category: [example, ...]} and write the index to path"""
+        import numpy as np
+
+        categories = list(examples)
+        texts, labels = [], []
+        for index, category in enumerate(categories):
+            for text in examples[category]:
+                texts.append(text)
+                labels.append(index)
+        vectors = np.asarray(encode(texts), dtype=np.float32)
+
+        # Write-then-rename so a worker never maps a half-written file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, vectors)
+        os.replace(tmp, path)
+        meta = {"fingerprint": fingerprint, "categories": categories, "labels": labels}
+        tmp = f"{cls.meta_path(path)}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, cls.meta_path(path))
+        return cls.load(path, fingerprint)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Memory-map an index from disk; None if missing or built from other examples"""
+        import numpy as np
+
+        try:
+            with open(cls.meta_path(path), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") != fingerprint:
+                return None
+            vectors = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return cls(vectors, np.asarray(meta["labels"], dtype=np.intp), meta["categories"])
+
+
+class IntentClassifier:
+    """Top-1 cosine match of message embeddings against the example index"""
+
+    def __init__(self, model_name, examples, index_path, threshold=0.55, batch_size=64, device="cpu"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+
+        fingerprint = examples_fingerprint(model_name, examples)
+        self.index = IntentIndex.load(index_path, fingerprint)
+        if self.index is None:
+            self.index = IntentIndex.build(self._encode, examples, index_path, fingerprint)
+            log_event(logger, "intent_index_built", path=index_path, model=model_name,
+                      categories=len(examples), vectors=len(self.index.labels))
+
+    def _encode(self, texts):
+        return self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True,
+            convert_to_numpy=True, show_progress_bar=False
+        )
+
+    def classify_many(self, texts):
+        """
+        [(category, score), ...] for a batch of messages.
+
+        category is None when the best score is below the threshold.
+        """
+        if not texts:
+            return []
+        import numpy as np
+
+        scores = self._encode([text.strip() for text in texts]) @ self.index.vectors.T
+        rows = np.arange(len(texts))
+        best = scores.argmax(axis=1)
+        confidence = scores[rows, best]
+        categories = self.index.categories
+        labels = self.index.labels[best]
+        return [
+            (categories[label] if score >= self.threshold else None, float(score))
+            for label, score in zip(labels.tolist(), confidence.tolist())
+        ]
+
+    def classify(self, text):
+        return self.classify_many([text])[0]
+
+
+def create_intent_classifier(model_name, examples, index_path, threshold=0.55):
+    """Build the classifier, or return None (keyword matching only) if it can't be"""
+    if not model_name:
+        return None
+    try:
+        return IntentClassifier(model_name, examples, index_path, threshold)
+    except ImportError as e:
+        log_event(logger, "intent_classifier_disabled", logging.WARNING, model=model_name, error=str(e))
+    except Exception:
+        logger.exception("intent_classifier_error")
+    return None
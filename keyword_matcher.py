@@ -0,0 +1,112 @@
+import hashlib
+import re
+
+# ══════════════════════════════════════════════════════════
+# KEYWORD MATCHER
+# ══════════════════════════════════════════════════════════
+#
+# Compiles a prioritised category table into a single regex so a message is
+# classified in one scan instead of one `in` check per keyword.
+#
+# Matching rules are identical to the old if/any() cascade:
+#   1. keyword rules: first category (in table order) with any keyword that is
+#      a substring of the lowercased, stripped text
+#   2. exact rules:   whole text equals one of the phrases
+#   3. default reply
+
+def _trie_pattern(words):
+    """Build a regex alternation from a trie so the longest keyword wins"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Single-pass matcher over a prioritised (category, keywords, reply) table"""
+
+    def __init__(self, rules, exact_rules=(), default=("default", "")):
+        self.categories = [category for category, _, _ in rules]
+        self.replies = [reply for _, _, reply in rules]
+        self.default = default
+
+        # Changes whenever the table does (cache keys, hot reload)
+        self.version = hashlib.sha1(repr((rules, exact_rules, default)).encode("utf-8")).hexdigest()[:16]
+        # Every character used by a keyword or phrase (text normalisers must keep these)
+        self.alphabet = frozenset(
+            ch for _, words, _ in list(rules) + list(exact_rules) for word in words for ch in word.lower()
+        )
+
+        # Keyword -> highest-priority (lowest index) category that owns it
+        priority = {}
+        for index, (_, keywords, _) in enumerate(rules):
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword and keyword not in priority:
+                    priority[keyword] = index
+
+        # The trie regex reports the longest keyword at each position. Every
+        # shorter keyword matching at that position is one of its prefixes, so
+        # fold the best prefix priority into each keyword up front.
+        self._best = {
+            keyword: min(priority[keyword[:n]] for n in range(1, len(keyword) + 1) if keyword[:n] in priority)
+            for keyword in priority
+        }
+        self._search = re.compile(_trie_pattern(priority)).search if priority else None
+
+        self._exact = {}
+        for category, phrases, reply in exact_rules:
+            for phrase in phrases:
+                self._exact.setdefault(phrase.lower(), (category, reply))
+
+        # Category -> reply, for callers that classify messages some other way
+        self.by_category = {default[0]: default[1]}
+        for category, _, reply in list(exact_rules) + list(rules):
+            self.by_category[category] = reply
+
+    def match(self, text):
+        """Return (category, reply) for a message"""
+        t = text.lower().strip()
+
+        best = len(self.categories)
+        if self._search is not None:
+            search = self._search
+            m = search(t)
+            while m is not None:
+                index = self._best[m.group()]
+                if index < best:
+                    best = index
+                    if best == 0:
+                        break
+                # Restart one char later so overlapping keywords are still seen
+                m = search(t, m.start() + 1)
+
+        if best < len(self.categories):
+            return self.categories[best], self.replies[best]
+
+        exact = self._exact.get(t)
+        if exact is not None:
+            return exact
+
+        return self.default
+
+    def match_many(self, texts):
+        """Match a batch; identical texts are only matched once"""
+        results = {}
+        for text in texts:
+            if text not in results:
+                results[text] = self.match(text)
+        return [results[text] for text in texts]
@@ -1,25 +1,144 @@
+import hashlib
 import json
 import os
 import logging
 from datetime import datetime
-import requests
+from functools import partial
+from graph_client import GraphClient, SendResult
+from ingress import WebhookEvents, parse_webhook, verify_signature
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from rate_limit import SendScheduler
+from reply_cache import ReplyCache
+from reply_rules import DEFAULT_RULES_PATH, RuleStore
+from sender_state import SenderIndex
+from state_backend import create_backend
+from structured_log import PayloadSampler, log_event, setup_logging
+from tenants import Tenant, TenantRegistry
+from webhook_batch import BatchReport, plan_batch
 
+# JSON lines on the runtime's own handler (no queue thread: Lambda freezes it)
+setup_logging(os.getenv('LOG_LEVEL', 'INFO').upper(), json_format=os.getenv('LOG_FORMAT', 'json') == 'json', use_queue=False)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+payload_sampler = PayloadSampler(float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0')))
 ACCESS_TOKEN = os.getenv('INSTAGRAM_ACCESS_TOKEN')
 IG_ID = os.getenv('INSTAGRAM_USER_ID')
 WEBHOOK_VERIFY_TOKEN = os.getenv('WEBHOOK_VERIFY_TOKEN', 'your_verify_token')
+APP_SECRET = os.getenv('INSTAGRAM_APP_SECRET', '')
 BRAND_NAME = os.getenv('BRAND_NAME', 'YourBrand')
 
-GRAPH_API_BASE = "https://graph.instagram.com/v24.0"
+GRAPH_API_BASE = os.getenv('GRAPH_API_BASE', "https://graph.instagram.com/v24.0")
 MESSAGES_ENDPOINT = f"{GRAPH_API_BASE}/{IG_ID}/messages"
 
-stats = {"total_received": 0, "total_sent": 0, "total_errors": 0}
-processed_messages = set()
+# One function for many accounts: a JSON / YAML tenant list (see tenants.py);
+# the account above, if set, is served too and is the default
+TENANTS_PATH = os.getenv('TENANTS_PATH', '')
+
+# Cold start: everything below is built once per container at init time.
+# Heavy imports (requests, sqlite3, concurrent.futures) are deferred until
+# the code path that needs them runs.
+JSON_HEADERS = {'Content-Type': 'application/json'}
+HTML_HEADERS = {'Content-Type': 'text/html'}
+HOME_BODY = f'<h1>Instagram Auto-DM Active</h1><p>Brand: {BRAND_NAME}</p><p>Endpoints: /webhook, /health, /stats, /metrics</p>'
+OK_BODY = json.dumps({'status': 'ok'})
+
+# Batch mode: bulk dedup per payload, then send to different senders in parallel
+WEBHOOK_BATCH_MODE = os.getenv('WEBHOOK_BATCH_MODE', 'false').lower() in ('1', 'true', 'yes')
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', '4'))
+
+# Queue mode: with SQS_QUEUE_URL set, the webhook only verifies, filters and
+# enqueues (one SQS message per DM). The same function, with that queue as an
+# event source (ReportBatchItemFailures on), replies to a batch of records per
+# invocation and hands back only the failed ones for SQS to redeliver.
+SQS_QUEUE_URL = os.getenv('SQS_QUEUE_URL', '')
+SQS_SEND_BATCH = 10  # SendMessageBatch limit
+
+# Created once per container and reused by warm invocations
+graph_client = GraphClient(
+    ACCESS_TOKEN,
+    MESSAGES_ENDPOINT,
+    pool_size=int(os.getenv('GRAPH_POOL_SIZE', str(SEND_WORKERS))),
+    connect_timeout=float(os.getenv('GRAPH_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.getenv('GRAPH_READ_TIMEOUT', '10'))
+)
+
+# Per-container counters and stage latencies, served on /metrics
+metrics = MetricsRegistry()
+events_total = metrics.counter('autodm_events_total', 'Webhook and delivery events handled by this container', ('event',))
+stage_seconds = metrics.histogram('autodm_stage_seconds', 'Time spent in each stage of the reply pipeline', ('stage',))
+
+# Use STATE_BACKEND=redis to share dedup + stats across containers
+state = create_backend(
+    os.getenv('STATE_BACKEND', 'memory'),
+    int(os.getenv('DEDUP_MAX_SIZE', '100000')),
+    float(os.getenv('DEDUP_TTL_SECONDS', '86400')),
+    os.getenv('STATE_SQLITE_PATH', '/tmp/autodm_state.db'),
+    os.getenv('STATE_REDIS_URL', 'redis://localhost:6379/0')
+)
+
+# Warm containers remember each sender's last reply and skip repeats of the
+# same category within SENDER_REPLY_WINDOW seconds (0, the default, disables it)
+sender_index = SenderIndex(
+    float(os.getenv('SENDER_REPLY_WINDOW', '0')),
+    int(os.getenv('SENDER_INDEX_SIZE', '100000')),
+    float(os.getenv('SENDER_IDLE_TTL', '3600'))
+)
+
+# Per-container pacing; throttled sends are retried inline only when the
+# backoff is short, otherwise they fail fast instead of burning Lambda time
+SEND_RATE_PER_SECOND = float(os.getenv('SEND_RATE_PER_SECOND', '20'))
+SEND_RATE_BURST = int(os.getenv('SEND_RATE_BURST', '40'))
+
+def create_scheduler(client, account_rate, account_burst):
+    return SendScheduler(
+        lambda recipient_id, text: send_dm_result(recipient_id, text, client),
+        account_rate=account_rate,
+        account_burst=account_burst,
+        recipient_rate=float(os.getenv('RECIPIENT_RATE_PER_SECOND', '1')),
+        recipient_burst=int(os.getenv('RECIPIENT_RATE_BURST', '3')),
+        max_retries=int(os.getenv('SEND_MAX_RETRIES', '2')),
+        base_delay=float(os.getenv('SEND_RETRY_BASE_DELAY', '0.5')),
+        inline_retry_max=float(os.getenv('SEND_INLINE_RETRY_MAX', '2'))
+    )
+
+scheduler = create_scheduler(graph_client, SEND_RATE_PER_SECOND, SEND_RATE_BURST)
+
+# Warm containers reuse the pool; every batch waits for its sends before returning.
+# Only batch and queue modes need it, so it is created on first use.
+send_pool = None
+
+def count(name, amount=1):
+    state.incr(name, amount)
+    events_total.labels(name).inc(amount)
+
+def get_send_pool():
+    global send_pool
+    if send_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        send_pool = ThreadPoolExecutor(max_workers=SEND_WORKERS)
+    return send_pool
+
+# boto3 comes with the Lambda runtime; only queue mode's webhook side needs it
+sqs = None
+
+def get_sqs():
+    global sqs
+    if sqs is None:
+        import boto3
+        sqs = boto3.client('sqs')
+    return sqs
+
+def check_rules():
+    for store, _ in list(rule_books.values()):
+        store.check(REPLY_RULES_RELOAD_INTERVAL)
 
 def handler(event, context):
+    if is_queue_event(event):
+        return handle_queue_batch(event)
     try:
-        logger.info(f"Event: {json.dumps(event)}")
+        check_rules()
+        
+        if payload_sampler.sample():
+            log_event(logger, "lambda_event", request=event)
         
         http_method = event.get('requestContext', {}).get('http', {}).get('method') or event.get('httpMethod', 'GET')
         path = event.get('rawPath') or event.get('path', '/')
@@ -32,28 +151,44 @@ def handler(event, context):
         elif 'health' in path:
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json'},
+                'headers': JSON_HEADERS,
                 'body': json.dumps({
                     'status': 'healthy',
                     'service': 'instagram-autodm',
                     'timestamp': datetime.now().isoformat()
                 })
             }
+        elif path.endswith('/metrics'):
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': METRICS_CONTENT_TYPE},
+                'body': metrics.render()
+            }
         elif 'stats' in path:
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json'},
-                'body': json.dumps({'stats': stats, 'timestamp': datetime.now().isoformat()})
+                'headers': JSON_HEADERS,
+                'body': json.dumps({
+                    'stats': state.counters(),
+                    'dedup': state.dedup_stats(),
+                    'scheduler': scheduler.metrics(),
+                    'tenants': tenants.stats(),
+                    'metrics': metrics.summary(),
+                    'reply_cache': reply_cache.stats(),
+                    'reply_rules': rule_store.stats(),
+                    'sender_state': sender_index.stats(),
+                    'timestamp': datetime.now().isoformat()
+                })
             }
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'text/html'},
-            'body': f'<h1>Instagram Auto-DM Active</h1><p>Brand: {BRAND_NAME}</p><p>Endpoints: /webhook, /health, /stats</p>'
+            'headers': HTML_HEADERS,
+            'body': HOME_BODY
         }
     
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.exception("handler_error")
         return {'statusCode': 500, 'body': json.dumps({'error': str(e)})}
 
 def handle_verification(event):
@@ -63,94 +198,311 @@ def handle_verification(event):
         token = params.get('hub.verify_token')
         challenge = params.get('hub.challenge')
         
-        logger.info(f"Verification: mode={mode}")
-        
         if mode == 'subscribe' and token == WEBHOOK_VERIFY_TOKEN:
-            logger.info("Verification success")
+            log_event(logger, "webhook_verification", mode=mode, success=True)
             return {'statusCode': 200, 'body': challenge}
         
+        log_event(logger, "webhook_verification", logging.WARNING, mode=mode, success=False)
         return {'statusCode': 403, 'body': 'Forbidden'}
     except Exception as e:
-        logger.error(f"Verification error: {e}")
+        logger.exception("verification_error")
         return {'statusCode': 500, 'body': str(e)}
 
+@stage_seconds.labels('webhook').timed
 def handle_webhook(event):
     try:
-        body = event.get('body', '{}')
-        data = json.loads(body) if isinstance(body, str) else body
+        body = request_body(event)
+        if not verify_signature(body, request_header(event, 'x-hub-signature-256'), APP_SECRET):
+            log_event(logger, "webhook_signature_invalid", logging.WARNING, bytes=len(body))
+            events_total.labels('signature_invalid').inc()
+            return {'statusCode': 403, 'body': json.dumps({'error': 'invalid signature'})}
         
-        logger.info("Webhook received")
-        stats['total_received'] += 1
+        count('total_received')
+        webhook_events = parse_webhook(body, tenants.accounts)
+        note_ingress(webhook_events)
+
+        if SQS_QUEUE_URL:
+            if not enqueue_messages(webhook_events.messages):
+                # Meta redelivers the POST; what did get queued is deduped by the consumer
+                state.flush()
+                return {'statusCode': 503, 'body': json.dumps({'error': 'enqueue failed'})}
+        elif WEBHOOK_BATCH_MODE:
+            process_batch(webhook_events)
+        else:
+            for sender_id, message_id, text, recipient_id in webhook_events.messages:
+                process_message(sender_id, message_id, text, recipient_id)
         
-        if 'entry' in data:
-            for entry in data['entry']:
-                if 'messaging' in entry:
-                    for msg_event in entry['messaging']:
-                        process_message(msg_event)
+        # Don't leave counter increments buffered in a container that may be frozen
+        state.flush()
         
-        return {'statusCode': 200, 'body': json.dumps({'status': 'ok'})}
+        return {'statusCode': 200, 'body': OK_BODY}
     except Exception as e:
-        logger.error(f"Webhook error: {e}")
-        stats['total_errors'] += 1
+        logger.exception("webhook_error")
+        count('total_errors')
         return {'statusCode': 500, 'body': str(e)}
 
-def process_message(event):
+def request_body(event):
+    """The POST body as the bytes Meta signed"""
+    body = event.get('body') or b''
+    if isinstance(body, dict):  # direct invocation with a parsed body (never signed)
+        return json.dumps(body).encode('utf-8')
+    if event.get('isBase64Encoded'):
+        import base64
+        return base64.b64decode(body)
+    return body.encode('utf-8') if isinstance(body, str) else body
+
+def request_header(event, name):
+    """API Gateway v2 lowercases header names; v1 keeps the client's case"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def note_ingress(webhook_events):
+    if webhook_events.prefiltered:
+        events_total.labels('ingress_prefiltered').inc()
+    for reason, dropped in webhook_events.dropped.items():
+        if dropped:
+            events_total.labels(f'ingress_{reason}').inc(dropped)
+
+@stage_seconds.labels('enqueue').timed
+def enqueue_messages(messages):
+    """Queue mode: one SQS message per DM; False if any of them could not be queued"""
+    fifo = SQS_QUEUE_URL.endswith('.fifo')
+    entries = []
+    for position, (sender_id, message_id, text, recipient_id) in enumerate(messages):
+        entry = {
+            'Id': str(position),
+            'MessageBody': json.dumps({'sender_id': sender_id, 'message_id': message_id, 'text': text,
+                                       'recipient_id': recipient_id})
+        }
+        if fifo:
+            # One group per conversation keeps a sender's DMs in order
+            entry['MessageGroupId'] = f'{recipient_id or ""}:{sender_id}'
+            # Required unless the queue has content-based dedup; a DM without a mid falls back to its body
+            dedup_key = message_id if message_id else entry['MessageBody']
+            entry['MessageDeduplicationId'] = hashlib.sha1(str(dedup_key).encode('utf-8')).hexdigest()
+        entries.append(entry)
+
+    failed = 0
+    for start in range(0, len(entries), SQS_SEND_BATCH):
+        response = get_sqs().send_message_batch(QueueUrl=SQS_QUEUE_URL, Entries=entries[start:start + SQS_SEND_BATCH])
+        failed += len(response.get('Failed') or ())
+    if entries:
+        count('messages_enqueued', len(entries) - failed)
+    if failed:
+        log_event(logger, "enqueue_failed", logging.ERROR, messages=len(entries), failed=failed)
+    return not failed
+
+def is_queue_event(event):
+    records = event.get('Records')
+    return bool(records) and isinstance(records, list) and records[0].get('eventSource') == 'aws:sqs'
+
+@stage_seconds.labels('queue_batch').timed
+def handle_queue_batch(event):
+    """
+    SQS consumer: each record is one DM enqueued by handle_webhook. Replies go
+    out like batch mode; the records whose reply failed are returned as
+    batchItemFailures so only those are redelivered.
+    """
+    records = event['Records']
+    record_ids = {}  # message_id -> every record carrying it (SQS is at-least-once)
+    messages = []
+    for record in records:
+        try:
+            body = json.loads(record['body'])
+            message = (body['sender_id'], body['message_id'], body['text'], body.get('recipient_id'))
+        except (KeyError, TypeError, ValueError):
+            # Would fail the same way on every redelivery
+            log_event(logger, "queue_record_invalid", logging.ERROR, record_id=record.get('messageId'))
+            events_total.labels('queue_record_invalid').inc()
+            continue
+        ids = record_ids.setdefault(message[1], [])
+        if not ids:
+            messages.append(message)
+        ids.append(record['messageId'])
+
+    claimed, sent, failed = [], [], []
     try:
-        sender_id = event.get('sender', {}).get('id')
-        message = event.get('message', {})
-        message_id = message.get('mid')
-        message_text = message.get('text', '')
-        
-        if not message_text or message_id in processed_messages:
+        check_rules()
+        count('queue_records', len(records))
+        process_batch(WebhookEvents(messages, events=len(records)), failed, claimed, sent)
+        state.flush()
+    except Exception:
+        logger.exception("queue_batch_error")
+        count('total_errors')
+        # Have SQS redeliver everything not confirmed sent, and un-mark what
+        # this batch marked as seen so the redelivery isn't taken for a duplicate
+        confirmed = set(sent)
+        for message_id in claimed:
+            if message_id not in confirmed:
+                state.discard(message_id)
+        return {'batchItemFailures': [{'itemIdentifier': record_id} for message_id, ids in record_ids.items()
+                                      if message_id not in confirmed for record_id in ids]}
+
+    for message_id in failed:
+        # Let the redelivery through dedup
+        state.discard(message_id)
+    failures = [{'itemIdentifier': record_id} for message_id in failed for record_id in record_ids[message_id]]
+    if failures:
+        count('queue_records_failed', len(failures))
+    return {'batchItemFailures': failures}
+
+@stage_seconds.labels('process_batch').timed
+def process_batch(webhook_events, failed=None, claimed=None, sent=None):
+    """
+    Queue mode passes lists to collect message IDs in:
+      failed    left unsent: a failed reply and every later one to the same
+                sender, so a redelivery keeps their order
+      claimed   newly marked as seen by this call
+      sent      replies the Graph API accepted
+    """
+    report = BatchReport(webhook_events.events, webhook_events.skipped)
+    groups = []
+    # Each account's messages are planned with its own rules
+    for recipient_id, messages in webhook_events.by_account().items():
+        tenant = tenants.get(recipient_id)
+        if tenant is None:
+            continue
+        mark = state.add_many_if_absent if claimed is None else partial(claim_many, claimed)
+        planned, duplicates, suppressed = plan_batch(
+            messages, mark, partial(classify_replies, tenant=tenant), sender_index.should_reply
+        )
+        report.duplicates += duplicates
+        report.suppressed += suppressed
+        groups += [(tenant, sender_id, items) for sender_id, items in planned.items()]
+    if report.suppressed:
+        count('replies_suppressed', report.suppressed)
+    
+    report.expect(len(groups), sum(len(items) for _, _, items in groups))
+    from concurrent.futures import wait
+    pool = get_send_pool()
+    wait([pool.submit(send_group, tenant, sender_id, items, report, failed, sent)
+          for tenant, sender_id, items in groups])
+    
+    log_event(logger, "batch", **report.as_dict())
+    return report
+
+def claim_many(claimed, message_ids):
+    """state.add_many_if_absent, also collecting the IDs it newly marked"""
+    added = state.add_many_if_absent(message_ids)
+    claimed.extend(message_id for message_id, new in zip(message_ids, added) if new)
+    return added
+
+def send_group(tenant, sender_id, items, report, failed=None, sent_ids=None):
+    # One sender's replies go out sequentially to keep their order
+    sent = 0
+    try:
+        for message_id, text, category, reply in items:
+            success = tenant.scheduler.deliver(sender_id, reply)
+            if success:
+                sent += 1
+                if sent_ids is not None:
+                    sent_ids.append(message_id)
+            else:
+                sender_index.release(sender_id, category)
+            log_event(logger, "message", sender_id=sender_id, message_id=message_id, text=text,
+                      category=category, reply=reply, sent=success)
+            if not success and failed is not None:
+                break
+    finally:
+        if failed is not None and sent < len(items):
+            # The reply that failed (or raised) and every later one
+            for _, _, category, _ in items[sent:]:
+                sender_index.release(sender_id, category)
+            failed.extend(message_id for message_id, _, _, _ in items[sent:])
+        report.group_done(sent, len(items) - sent)
+
+@stage_seconds.labels('process_message').timed
+def process_message(sender_id, message_id, message_text, recipient_id=None):
+    try:
+        tenant = tenants.get(recipient_id)
+        if tenant is None or not state.add_if_absent(message_id):
             return
         
-        processed_messages.add(message_id)
-        logger.info(f"Message from {sender_id}: {message_text}")
-        
-        reply = generate_reply(message_text)
-        send_dm(sender_id, reply)
-    except Exception as e:
-        logger.error(f"Process error: {e}")
+        category, reply = classify_reply(message_text, tenant)
+        if not sender_index.should_reply(sender_id, category):
+            count('replies_suppressed')
+            return
+        success = tenant.scheduler.deliver(sender_id, reply)
+        if not success:
+            sender_index.release(sender_id, category)
+        log_event(logger, "message", sender_id=sender_id, message_id=message_id, text=message_text,
+                  category=category, reply=reply, sent=success)
+    except Exception:
+        logger.exception("process_error")
+
+# Same reply_rules.json as app.py. No watcher thread (Lambda freezes it):
+# invocations re-stat the file at most every REPLY_RULES_RELOAD_INTERVAL
+# seconds, which matters when REPLY_RULES_PATH points at EFS. "{brand}" is
+# filled per tenant, so tenants on the same file share its table and cache
+REPLY_RULES_PATH = os.getenv('REPLY_RULES_PATH') or DEFAULT_RULES_PATH
+rule_store = RuleStore(REPLY_RULES_PATH, brand=None)
+REPLY_RULES_RELOAD_INTERVAL = float(os.getenv('REPLY_RULES_RELOAD_INTERVAL', '60'))
+REPLY_CACHE_SIZE = int(os.getenv('REPLY_CACHE_SIZE', '10000'))
+# Warm containers keep replies for near-identical DMs ("hi", "Hi!!")
+reply_cache = ReplyCache(REPLY_CACHE_SIZE)
+rule_books = {REPLY_RULES_PATH: (rule_store, reply_cache)}
+
+def rule_book(path):
+    if path not in rule_books:
+        rule_books[path] = (RuleStore(path, brand=None), ReplyCache(REPLY_CACHE_SIZE))
+    return rule_books[path]
+
+def setup_tenant(tenant):
+    # First message for an account in this container: client on the shared pool, rules, pacing
+    client = graph_client.for_account(tenant.access_token, f"{GRAPH_API_BASE}/{tenant.ig_id}/messages")
+    scheduler = create_scheduler(
+        client,
+        SEND_RATE_PER_SECOND if tenant.send_rate is None else tenant.send_rate,
+        SEND_RATE_BURST if tenant.send_burst is None else tenant.send_burst
+    )
+    return client, rule_book(tenant.rules_path or REPLY_RULES_PATH), scheduler
+
+default_tenant = Tenant(IG_ID, ACCESS_TOKEN, BRAND_NAME)
+default_tenant.client, default_tenant.rules, default_tenant.scheduler = graph_client, (rule_store, reply_cache), scheduler
+tenants = TenantRegistry(setup_tenant, default=default_tenant if IG_ID or not TENANTS_PATH else None)
+if TENANTS_PATH:
+    tenants.load(TENANTS_PATH)
+
+def classify_messages(texts, tenant=None):
+    tenant = tenant or default_tenant
+    store, cache = tenant.rules
+    snapshot = store.snapshot
+    results = cache.get_many(texts, snapshot.matcher.match_many, snapshot.version, snapshot.normalize)
+    return [(category, tenant.fill(reply)) for category, reply in results]
+
+@stage_seconds.labels('generate_reply').timed
+def classify_reply(text, tenant=None):
+    return classify_messages([text], tenant)[0]
+
+@stage_seconds.labels('generate_replies').timed
+def classify_replies(texts, tenant=None):
+    return classify_messages(texts, tenant)
 
 def generate_reply(text):
-    t = text.lower().strip()
-    
-    if any(w in t for w in ["hi", "hello", "hey"]):
-        return f"Hi! 👋 Welcome to {BRAND_NAME}! How can I help?"
-    if any(w in t for w in ["price", "cost", "how much"]):
-        return "All prices are on our posts! 💰 Looking for something specific?"
-    if any(w in t for w in ["ship", "delivery"]):
-        return "📦 We ship fast! 3-5 business days."
-    if any(w in t for w in ["return", "refund"]):
-        return "We have hassle-free returns! 😊 Share your order number."
-    if any(w in t for w in ["discount", "coupon"]):
-        return "🏷️ Follow us for exclusive deals!"
-    
-    return f"Thanks for contacting {BRAND_NAME}! How can I help?"
+    return classify_reply(text)[1]
+
+def generate_replies(texts):
+    return [reply for _, reply in classify_replies(texts)]
 
 def send_dm(recipient_id, text):
+    return send_dm_result(recipient_id, text).ok
+
+@stage_seconds.labels('send_dm').timed
+def send_dm_result(recipient_id, text, client=None):
     try:
-        payload = {
-            "recipient": {"id": recipient_id},
-            "message": {"text": text[:1000]}
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {ACCESS_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(MESSAGES_ENDPOINT, headers=headers, json=payload, timeout=10)
-        
-        if response.status_code == 200:
-            logger.info("Reply sent")
-            stats['total_sent'] += 1
-            return True
-        
-        logger.error(f"Send failed: {response.status_code}")
-        stats['total_errors'] += 1
-        return False
+        result = SendResult.from_response((client or graph_client).send_message(recipient_id, text))
     except Exception as e:
-        logger.error(f"Send error: {e}")
-        stats['total_errors'] += 1
-        return False
\ No newline at end of file
+        logger.exception("dm_error")
+        count('total_errors')
+        return SendResult.from_exception(e)
+    
+    if result.ok:
+        count('total_sent')
+        return result
+    
+    log_event(logger, "dm_failed", logging.WARNING if result.throttled else logging.ERROR,
+              recipient_id=recipient_id, status=result.status, error_code=result.error_code, throttled=result.throttled)
+    count('total_throttled' if result.throttled else 'total_errors')
+    return result
\ No newline at end of file
@@ -0,0 +1,290 @@
+import functools
+import math
+import threading
+import time
+
+# ══════════════════════════════════════════════════════════
+# IN-PROCESS METRICS
+# ══════════════════════════════════════════════════════════
+#
+# Counters and latency histograms for the request pipeline, exported as
+# Prometheus text on /metrics.
+#
+# Every metric keeps one shard per thread. A thread only ever writes its own
+# shard, so updates take no lock; readers merge all shards. Shards of threads
+# that have exited are folded into a base shard on the next read, so servers
+# that start a thread per request don't accumulate them.
+#
+# Histograms are HDR-style: values are recorded in microseconds into
+# log-linear buckets (16 per power of two, so at most ~6% relative error)
+# from 1 us up to about 19 hours, in a few KB per shard.
+
+
+class _Sharded:
+    """Per-thread shards of a dict, merged on read"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []  # [(thread, dict)]
+        self._base = {}
+        self._lock = threading.Lock()  # only for shard registration / folding
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _merge(self, into, shard):
+        for key, value in shard.items():
+            into[key] = into.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._base, shard)
+            self._shards = live
+            total = dict(self._base)
+        for _, shard in live:
+            self._merge(total, dict(shard))  # dict() copy is atomic under the GIL
+        return total
+
+
+class Counter(_Sharded):
+    """Monotonic counter"""
+
+    def inc(self, amount=1):
+        shard = self._shard()
+        shard[None] = shard.get(None, 0) + amount
+
+    def value(self):
+        return self.snapshot().get(None, 0)
+
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_MICROS = 1 << 36
+
+
+def bucket_index(micros):
+    """Log-linear bucket for a non-negative integer number of microseconds"""
+    if micros < SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (micros >> shift) - SUB_BUCKETS
+
+
+def bucket_upper(index):
+    """Largest microsecond value that lands in bucket `index`"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return ((index % SUB_BUCKETS + SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram(_Sharded):
+    """Latency histogram; observe() takes seconds"""
+
+    def observe(self, seconds):
+        micros = min(int(seconds * 1_000_000), MAX_MICROS) if seconds > 0 else 0
+        shard = self._shard()
+        index = bucket_index(micros)
+        shard[index] = shard.get(index, 0) + 1
+        shard["sum"] = shard.get("sum", 0) + seconds
+
+    def time(self):
+        """Context manager that observes the duration of its block"""
+        return _Timer(self)
+
+    def timed(self, fn):
+        """Decorator that observes every call of fn, including ones that raise"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - start)
+        return wrapper
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        """count, sum and quantiles (seconds) from one consistent snapshot"""
+        data = self.snapshot()
+        total = data.pop("sum", 0.0)
+        buckets = sorted(data.items())
+        count = sum(n for _, n in buckets)
+        result = {"count": count, "sum": round(total, 6)}
+        for q in quantiles:
+            result[f"p{round(q * 100, 1):g}"] = self._quantile(buckets, count, q)
+        return result
+
+    @staticmethod
+    def _quantile(buckets, count, q):
+        if not count:
+            return 0.0
+        rank = max(1, math.ceil(q * count))
+        seen = 0
+        for index, n in buckets:
+            seen += n
+            if seen >= rank:
+                return bucket_upper(index) / 1_000_000
+        return bucket_upper(buckets[-1][0]) / 1_000_000
+
+    def cumulative(self, bounds):
+        """(sum, count, [count <= bound for bound in bounds]) for Prometheus buckets"""
+        data = self.snapshot()
+        total = data.pop("sum", 0.0)
+        buckets = sorted(data.items())
+        counts = []
+        seen = 0
+        position = 0
+        for bound in bounds:
+            limit = bound * 1_000_000
+            while position < len(buckets) and bucket_upper(buckets[position][0]) <= limit:
+                seen += buckets[position][1]
+                position += 1
+            counts.append(seen)
+        return total, sum(n for _, n in buckets), counts
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+# ─── registry ───
+
+DEFAULT_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Family:
+    """A metric name with one child per label-value tuple"""
+
+    def __init__(self, kind, name, help_text, labelnames, factory):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def children(self):
+        with self._lock:
+            return list(self._children.items())
+
+    # Unlabelled families act as their single child
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def observe(self, seconds):
+        self.labels().observe(seconds)
+
+    def time(self):
+        return self.labels().time()
+
+
+class MetricsRegistry:
+    """Holds the metrics of one process and renders them for /metrics"""
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self._families = []
+        self._gauges = []
+
+    def counter(self, name, help_text, labelnames=()):
+        """Counter family; by convention the name ends in _total"""
+        family = _Family("counter", name, help_text, labelnames, Counter)
+        self._families.append(family)
+        return family
+
+    def histogram(self, name, help_text, labelnames=()):
+        family = _Family("histogram", name, help_text, labelnames, Histogram)
+        self._families.append(family)
+        return family
+
+    def gauge(self, name, help_text, read):
+        """A gauge whose value is read from read() at scrape time"""
+        self._gauges.append((name, help_text, read))
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for family in self._families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in family.children():
+                labels = _labels(family.labelnames, values)
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_braces(labels)} {_number(child.value())}")
+                    continue
+                total, count, cumulative = child.cumulative(self.bounds)
+                for bound, n in zip(self.bounds, cumulative):
+                    lines.append(f"{family.name}_bucket{_braces(labels + [_le(bound)])} {n}")
+                lines.append(f"{family.name}_bucket{_braces(labels + [_le('+Inf')])} {count}")
+                lines.append(f"{family.name}_sum{_braces(labels)} {_number(total)}")
+                lines.append(f"{family.name}_count{_braces(labels)} {count}")
+        for name, help_text, read in self._gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(read())}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """JSON-friendly view: counters and per-child latency quantiles"""
+        result = {}
+        for family in self._families:
+            for values, child in family.children():
+                key = family.name + (f"[{','.join(values)}]" if values else "")
+                if family.kind == "counter":
+                    result[key] = child.value()
+                else:
+                    result[key] = child.summary()
+        return result
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names, values):
+    return [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+
+
+def _braces(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _le(bound):
+    return f'le="{_number(bound)}"'
+
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
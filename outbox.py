@@ -0,0 +1,395 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from structured_log import log_event
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# DURABLE OUTBOX
+# ══════════════════════════════════════════════════════════
+#
+# A message is marked processed (dedup) before its reply is sent, so a crash
+# or a failed send used to lose the reply for good: Instagram's redelivery
+# is skipped as a duplicate. The outbox closes that gap:
+#
+#   1. put()    the reply job is committed before the webhook returns 200
+#   2. done()   deletes it once the Graph API accepted the send
+#   3. fail()   reschedules it with exponential backoff, or moves it to the
+#               dead-letter file after max_attempts
+#   4. replay   a poller re-sends jobs that are due: retries, and jobs left
+#               behind by a process that died mid-send
+#
+# Every row's due_at doubles as a lease: a job being sent is pushed out by
+# `lease` seconds, and a claim is a conditional UPDATE, so several workers
+# can share one file without sending a job twice.
+#
+# Messages a coalescing window is still holding have no reply job yet. They
+# are committed to a `held` table before the webhook returns 200, under the
+# same kind of lease, and deleted in the transaction that commits their
+# burst's job (or when the burst needs no reply). Held rows whose lease ran
+# out belong to a process that died with the burst open; the poller claims
+# them and hands them back as bursts.
+#
+# Commits are grouped: threads that write while a commit is running queue
+# up, and the next commit writes all of them with one fsync.
+
+SYNC_MODES = ("off", "normal", "full")
+REPLAY_BATCH = 100
+
+
+class Outbox:
+    """SQLite-backed reply jobs with group commit, retry backoff and dead-lettering"""
+
+    def __init__(self, path, dead_letter_path=None, sync="full", max_attempts=5, retry_base=30.0,
+                 retry_max=3600.0, lease=300.0):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync must be one of {SYNC_MODES}, got {sync!r}")
+        self.path = path
+        self.dead_letter_path = dead_letter_path or f"{os.path.splitext(path)[0]}.dead.jsonl"
+        self.sync = sync
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()  # the connection
+        self._dead_lock = threading.Lock()
+        self._poller = None
+
+        # Group commit: rows wait in _pending (jobs, held, released) for the next batch number
+        self._cond = threading.Condition()
+        self._pending = ([], [], [])
+        self._batch = 1       # batch that new rows join
+        self._durable = 0     # last batch committed
+        self._writing = False
+        self._failures = {}   # batch -> exception, for its waiters
+
+        self.counts = {"written": 0, "commits": 0, "done": 0, "retried": 0, "replayed": 0, "dead_lettered": 0,
+                       "held": 0, "resumed": 0}
+        self._connection()
+
+    def _connection(self):
+        # One connection per process: reopen after a fork
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.sync.upper()}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " key TEXT PRIMARY KEY, sender_id TEXT, message_text TEXT, category TEXT, reply TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL, due_at REAL NOT NULL, created_at REAL NOT NULL, last_error TEXT,"
+                " recipient_id TEXT)"
+            )
+            # Files from before multi-tenant support: their rows belong to the default account
+            if "recipient_id" not in {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}:
+                conn.execute("ALTER TABLE outbox ADD COLUMN recipient_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (due_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS held ("
+                " key TEXT PRIMARY KEY, sender_id TEXT NOT NULL, message_text TEXT, recipient_id TEXT,"
+                " due_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS held_due ON held (due_at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        """Run one statement; returns its rowcount"""
+        with self._lock:
+            return self._connection().execute(sql, params).rowcount
+
+    def _fetchone(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchone()
+
+    # ─── write path ───
+
+    def put(self, key, sender_id, message_text, category, reply, recipient_id=None):
+        """Durably record a reply job that is about to be sent (attempt 1)"""
+        self.put_many([(key, sender_id, message_text, category, reply, recipient_id)])
+
+    def put_many(self, jobs, release=()):
+        """
+        Record several (key, sender_id, text, category, reply, recipient_id)
+        jobs and delete the held messages in `release`, in one transaction;
+        returns once committed.
+        """
+        now = time.time()
+        rows = [(key, sender_id, text, category, reply, recipient_id, 1, now + self.lease, now)
+                for key, sender_id, text, category, reply, recipient_id in jobs]
+        self._commit(rows, (), release)
+
+    def hold_many(self, messages):
+        """Record (key, sender_id, text, recipient_id) messages a coalescing window is holding"""
+        now = time.time()
+        rows = [(key, sender_id, text, recipient_id, now + self.lease, now)
+                for key, sender_id, text, recipient_id in messages]
+        self._commit((), rows, ())
+
+    def release(self, keys):
+        """Held messages whose burst needs no reply job"""
+        self._commit((), (), keys)
+
+    def _commit(self, jobs, held, released):
+        if not jobs and not held and not released:
+            return
+        with self._cond:
+            self._pending[0].extend(jobs)
+            self._pending[1].extend(held)
+            self._pending[2].extend((key,) for key in released)
+            mine = self._batch
+            while self._durable < mine:
+                if self._writing:
+                    self._cond.wait()
+                    continue
+                # Nobody is committing: take every queued row, ours included
+                batch, pending, self._pending = self._batch, self._pending, ([], [], [])
+                self._batch += 1
+                self._writing = True
+                self._cond.release()
+                error = None
+                try:
+                    self._write(*pending)
+                except Exception as e:
+                    error = e
+                finally:
+                    self._cond.acquire()
+                    self._writing = False
+                    self._durable = batch
+                    if error is not None:
+                        self._failures[batch] = error
+                    self._cond.notify_all()
+            error = self._failures.get(mine)
+            if len(self._failures) > 100:
+                self._failures = {b: e for b, e in self._failures.items() if b > self._durable - 100}
+        if error is not None:
+            raise error
+
+    def _write(self, rows, held, released):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if rows:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO outbox (key, sender_id, message_text, category, reply, recipient_id,"
+                        " attempts, due_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+                if held:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO held (key, sender_id, message_text, recipient_id, due_at, created_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)", held
+                    )
+                if released:
+                    conn.executemany("DELETE FROM held WHERE key = ?", released)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self.counts["written"] += len(rows)
+            self.counts["held"] += len(held)
+            self.counts["commits"] += 1
+
+    def remove(self, key):
+        """Drop a job that was never handed to a sender (e.g. queue full)"""
+        self._execute("DELETE FROM outbox WHERE key = ?", (key,))
+
+    # ─── outcomes ───
+
+    def done(self, key):
+        """The Graph API accepted the send"""
+        if self._execute("DELETE FROM outbox WHERE key = ?", (key,)):
+            self.counts["done"] += 1
+
+    def fail(self, key, error=None):
+        """The send failed for good this attempt: back off, or dead-letter it"""
+        row = self._fetchone(
+            "SELECT key, sender_id, message_text, category, reply, recipient_id, attempts, created_at FROM outbox"
+            " WHERE key = ?", (key,)
+        )
+        if row is None:
+            return
+        attempts = row[6]
+        if attempts >= self.max_attempts:
+            self._dead_letter(row, error)
+            return
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1))) * random.uniform(0.8, 1.2)
+        self._execute("UPDATE outbox SET due_at = ?, last_error = ? WHERE key = ?", (time.time() + delay, error, key))
+        self.counts["retried"] += 1
+        log_event(logger, "outbox_retry_scheduled", logging.WARNING, key=key, attempts=attempts,
+                  delay_s=round(delay, 1), error=error)
+
+    def _dead_letter(self, row, error):
+        key, sender_id, message_text, category, reply, recipient_id, attempts, created_at = row
+        record = {
+            "key": key,
+            "sender_id": sender_id,
+            "recipient_id": recipient_id,
+            "message_text": message_text,
+            "category": category,
+            "reply": reply,
+            "attempts": attempts,
+            "error": error,
+            "created_at": datetime.fromtimestamp(created_at).isoformat(),
+            "dead_at": datetime.now().isoformat()
+        }
+        with self._dead_lock:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._execute("DELETE FROM outbox WHERE key = ?", (key,))
+        self.counts["dead_lettered"] += 1
+        log_event(logger, "outbox_dead_letter", logging.ERROR, key=key, sender_id=sender_id,
+                  attempts=attempts, error=error)
+
+    # ─── replay ───
+
+    def claim_due(self, limit=REPLAY_BATCH):
+        """
+        Jobs whose due_at has passed (retries, or orphans of a dead process),
+        each claimed for one more attempt. Returns [(key, sender_id,
+        message_text, category, reply, recipient_id), ...].
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT key, sender_id, message_text, category, reply, recipient_id FROM outbox WHERE due_at <= ? "
+                    "ORDER BY due_at LIMIT ?", (now, limit)
+                ).fetchall()
+                claimed = [
+                    row for row in rows
+                    if conn.execute(
+                        "UPDATE outbox SET due_at = ?, attempts = attempts + 1 WHERE key = ? AND due_at <= ?",
+                        (now + self.lease, row[0], now)
+                    ).rowcount
+                ]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def replay(self, submit, limit=REPLAY_BATCH):
+        """
+        Hand due jobs to submit(key, sender_id, message_text, category, reply,
+        recipient_id), which returns False when it can't take more. Returns how many went out.
+        """
+        jobs = self.claim_due(limit)
+        submitted = 0
+        for job in jobs:
+            if not submit(*job):
+                break
+            submitted += 1
+        for key, *_ in jobs[submitted:]:
+            # Executor full: hand the claim back for the next poll
+            self._execute("UPDATE outbox SET due_at = ?, attempts = attempts - 1 WHERE key = ?", (time.time(), key))
+        self.counts["replayed"] += submitted
+        if jobs:
+            log_event(logger, "outbox_replay", jobs=submitted, deferred=len(jobs) - submitted)
+        return submitted
+
+    def claim_held(self, limit=REPLAY_BATCH):
+        """
+        Held messages whose lease ran out (their process died mid-window),
+        each claimed for another lease. Returns [(key, sender_id,
+        message_text, recipient_id), ...] oldest first.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT key, sender_id, message_text, recipient_id FROM held WHERE due_at <= ? "
+                    "ORDER BY created_at LIMIT ?", (now, limit)
+                ).fetchall()
+                claimed = [
+                    row for row in rows
+                    if conn.execute("UPDATE held SET due_at = ? WHERE key = ? AND due_at <= ?",
+                                    (now + self.lease, row[0], now)).rowcount
+                ]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def resume_held(self, resume, limit=REPLAY_BATCH):
+        """
+        Hand expired held messages to resume(sender_id, [(key, text), ...],
+        recipient_id), one call per sender in arrival order. Their rows stay
+        until the burst commits its job (or is released). Returns how many
+        messages were resumed.
+        """
+        rows = self.claim_held(limit)
+        bursts = {}
+        for key, sender_id, text, recipient_id in rows:
+            bursts.setdefault((recipient_id, sender_id), []).append((key, text))
+        for (recipient_id, sender_id), messages in bursts.items():
+            resume(sender_id, messages, recipient_id)
+        self.counts["resumed"] += len(rows)
+        if rows:
+            log_event(logger, "outbox_held_resumed", messages=len(rows), bursts=len(bursts))
+        return len(rows)
+
+    def watch(self, submit, interval=5.0, resume=None):
+        """
+        Replay due jobs (and, with resume, expired held messages; see
+        resume_held) from a daemon thread every `interval` seconds; the first
+        pass picks up whatever a previous run left behind.
+        """
+        if interval <= 0 or self._poller is not None:
+            return
+
+        def loop():
+            while True:
+                # Sleep first, so the app has finished starting before a replay
+                time.sleep(interval)
+                try:
+                    if resume is not None:
+                        while self.resume_held(resume) >= REPLAY_BATCH:
+                            pass
+                    while self.replay(submit) >= REPLAY_BATCH:
+                        pass
+                except Exception:
+                    logger.exception("outbox_replay_error")
+
+        self._poller = threading.Thread(target=loop, name="outbox-replay", daemon=True)
+        self._poller.start()
+
+    # ─── stats ───
+
+    def stats(self):
+        now = time.time()
+        pending, due = self._fetchone("SELECT COUNT(*), COALESCE(SUM(due_at <= ?), 0) FROM outbox", (now,))
+        (holding,) = self._fetchone("SELECT COUNT(*) FROM held")
+        commits = self.counts["commits"]
+        return {
+            **self.counts,
+            "rows_per_commit": round(self.counts["written"] / commits, 2) if commits else 0.0,
+            "pending": pending,
+            "due": due,
+            "holding": holding,
+            "sync": self.sync,
+            "max_attempts": self.max_attempts,
+            "dead_letter_path": self.dead_letter_path
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
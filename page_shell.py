@@ -0,0 +1,64 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+# ══════════════════════════════════════════════════════════
+# PRE-RENDERED HTML PAGES
+# ══════════════════════════════════════════════════════════
+#
+# The status pages are large str.format templates whose CSS/JS never
+# changes. They are formatted once at startup; for a page with live values
+# only the slot values are joined back in on each request.
+
+_MARK = "\x00"
+
+
+class PageShell:
+    """A template formatted once, with named slots filled per request"""
+
+    def __init__(self, template, slots=(), **static):
+        # Each slot is rendered as \0name\0, so splitting on \0 gives
+        # [static, name, static, name, ..., static]
+        rendered = template.format(**static, **{name: f"{_MARK}{name}{_MARK}" for name in slots})
+        self.parts = rendered.split(_MARK)
+        self.slots = tuple(self.parts[1::2])
+
+    def render(self, **values):
+        parts = self.parts[:]
+        parts[1::2] = [str(values[name]) for name in self.slots]
+        return "".join(parts)
+
+
+class StaticPage:
+    """A page with no live values: encoded once, with validators for 304s"""
+
+    def __init__(self, template, content_type="text/html; charset=utf-8", **static):
+        self.body = template.format(**static).encode("utf-8")
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        validators = {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": "no-cache"  # always revalidate; cheap with the 304
+        }
+        self.headers = {**validators, "Content-Type": content_type}
+        self.not_modified_headers = validators
+
+    def is_fresh(self, if_none_match=None, if_modified_since=None):
+        """Whether the client's cached copy is current (RFC 9110 13.2.2)"""
+        if if_none_match is not None:
+            # If-None-Match wins over If-Modified-Since; weak comparison
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+        if if_modified_since is not None:
+            try:
+                return parsedate_to_datetime(if_modified_since) >= self.last_modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def respond(self, headers):
+        """(body, status, headers) for a request with the given headers"""
+        if self.is_fresh(headers.get("If-None-Match"), headers.get("If-Modified-Since")):
+            return b"", 304, self.not_modified_headers
+        return self.body, 200, self.headers
@@ -0,0 +1,215 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from structured_log import log_event
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# RATE-LIMITED SEND SCHEDULER
+# ══════════════════════════════════════════════════════════
+#
+# Wraps a send function that returns a graph_client.SendResult:
+#   - an account token bucket and one bucket per recipient pace every send
+#   - throttling errors pause the whole account (Retry-After / usage header,
+#     else exponential backoff) and halve the account rate, which then
+#     creeps back up on successes (AIMD)
+#   - retryable failures go into a delay heap with jittered backoff and are
+#     handed back to the caller's executor when due
+
+
+class TokenBucket:
+    """Classic token bucket; reserve() returns how long to wait for the token"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class SendScheduler:
+    """Paces, retries and backs off sends around a SendResult-returning send()"""
+
+    def __init__(self, send, resubmit=None, account_rate=20.0, account_burst=40,
+                 recipient_rate=1.0, recipient_burst=3, max_retries=5, base_delay=1.0,
+                 max_delay=300.0, inline_retry_max=2.0, max_recipients=10_000):
+        self.send = send
+        self.resubmit = resubmit  # executor hook, e.g. SendQueue.submit; None = retry inline
+        self.max_rate = account_rate
+        self.min_rate = max(account_rate / 32, 0.1)
+        self.account = TokenBucket(account_rate, account_burst)
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_recipients = max_recipients
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.inline_retry_max = inline_retry_max
+
+        self._recipients = OrderedDict()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self._retries = []  # heap of (due, seq, recipient_id, text, on_result, attempt)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._timer = None
+
+        self.counts = {"sent": 0, "throttled": 0, "retried": 0, "failed": 0, "waited_ms": 0.0}
+
+    # ─── pacing ───
+
+    def _reserve(self, recipient_id):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._recipients.get(recipient_id)
+            if bucket is None:
+                bucket = self._recipients[recipient_id] = TokenBucket(self.recipient_rate, self.recipient_burst)
+                if len(self._recipients) > self.max_recipients:
+                    self._recipients.popitem(last=False)
+            else:
+                self._recipients.move_to_end(recipient_id)
+            return max(self._paused_until - now, self.account.reserve(now), bucket.reserve(now))
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = retry_after if retry_after else self.base_delay * (2 ** attempt)
+        return min(self.max_delay, delay * random.uniform(0.8, 1.2))
+
+    def _on_throttle(self, result, attempt):
+        pause = self._backoff(attempt, result.retry_after)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self.account.rate = max(self.min_rate, self.account.rate / 2)
+            self.counts["throttled"] += 1
+        log_event(logger, "send_throttled", logging.WARNING, error_code=result.error_code,
+                  pause_s=round(pause, 3), rate=round(self.account.rate, 3))
+        return pause
+
+    def _on_success(self):
+        with self._lock:
+            self.account.rate = min(self.max_rate, self.account.rate + self.max_rate / 50)
+            self.counts["sent"] += 1
+
+    # ─── sending ───
+
+    def deliver(self, recipient_id, text, on_result=None, attempt=0):
+        """
+        Pace, send and (if needed) schedule a retry. Runs on a worker thread.
+
+        on_result(ok) is called once with the final outcome, which may be on
+        a later retry. Returns True/False when final, None if a retry is pending.
+        """
+        wait = self._reserve(recipient_id)
+        if wait > 0:
+            with self._lock:
+                self.counts["waited_ms"] += wait * 1000
+            time.sleep(wait)
+
+        result = self.send(recipient_id, text)
+        if result.ok:
+            self._on_success()
+            return self._finish(on_result, True)
+
+        if result.retryable and attempt < self.max_retries:
+            if result.throttled:
+                delay = self._on_throttle(result, attempt)
+            else:
+                delay = self._backoff(attempt, result.retry_after)
+            with self._lock:
+                self.counts["retried"] += 1
+            if self.resubmit is not None:
+                self._schedule_retry(delay, recipient_id, text, on_result, attempt + 1)
+                return None
+            if delay <= self.inline_retry_max:
+                time.sleep(delay)
+                return self.deliver(recipient_id, text, on_result, attempt + 1)
+
+        with self._lock:
+            self.counts["failed"] += 1
+        return self._finish(on_result, False)
+
+    async def deliver_async(self, recipient_id, text, send, on_result=None):
+        """
+        deliver() for asyncio: same pacing, backoff and counters, but waits
+        with asyncio.sleep and retries in place, since a waiting coroutine
+        holds no thread. send is an async SendResult-returning callable.
+        """
+        import asyncio
+
+        for attempt in range(self.max_retries + 1):
+            wait = self._reserve(recipient_id)
+            if wait > 0:
+                with self._lock:
+                    self.counts["waited_ms"] += wait * 1000
+                await asyncio.sleep(wait)
+
+            result = await send(recipient_id, text)
+            if result.ok:
+                self._on_success()
+                return self._finish(on_result, True)
+            if not result.retryable or attempt == self.max_retries:
+                break
+
+            if result.throttled:
+                delay = self._on_throttle(result, attempt)
+            else:
+                delay = self._backoff(attempt, result.retry_after)
+            with self._lock:
+                self.counts["retried"] += 1
+            await asyncio.sleep(delay)
+
+        with self._lock:
+            self.counts["failed"] += 1
+        return self._finish(on_result, False)
+
+    @staticmethod
+    def _finish(on_result, ok):
+        if on_result is not None:
+            on_result(ok)
+        return ok
+
+    # ─── retry queue ───
+
+    def _schedule_retry(self, delay, recipient_id, text, on_result, attempt):
+        with self._cond:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), recipient_id, text, on_result, attempt))
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._retry_loop, name="send-retry", daemon=True)
+                self._timer.start()
+            self._cond.notify()
+
+    def _retry_loop(self):
+        while True:
+            with self._cond:
+                while not self._retries or self._retries[0][0] > time.monotonic():
+                    timeout = self._retries[0][0] - time.monotonic() if self._retries else None
+                    self._cond.wait(timeout)
+                _, _, recipient_id, text, on_result, attempt = heapq.heappop(self._retries)
+            if not self.resubmit(self.deliver, recipient_id, text, on_result, attempt):
+                # Executor is full; try again shortly
+                self._schedule_retry(1.0, recipient_id, text, on_result, attempt)
+
+    # ─── metrics ───
+
+    def metrics(self):
+        with self._lock:
+            return {
+                **self.counts,
+                "waited_ms": round(self.counts["waited_ms"], 3),
+                "account_rate": round(self.account.rate, 3),
+                "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 3),
+                "retry_queue": len(self._retries),
+                "tracked_recipients": len(self._recipients)
+            }
@@ -0,0 +1,127 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# ══════════════════════════════════════════════════════════
+# REPLY CACHE
+# ══════════════════════════════════════════════════════════
+#
+# Most DMs are near-duplicates ("hi", "Hi!!", "price?", "how   much"), so
+# replies are cached by a normalised form of the text:
+#   - lowercased, whitespace collapsed
+#   - punctuation replaced by spaces (symbols such as $ and emoji are kept,
+#     as is any character that appears in a keyword)
+#   - runs of 3+ identical characters cut to 2 ("hiiiii" -> "hii")
+# Replies are computed from the normalised text too, so a cached entry is
+# exactly what a fresh lookup would return.
+#
+# Entries are tagged with the rule table version and the whole cache is
+# dropped when it changes.
+
+_REPEATS = re.compile(r"(.)\1{2,}")
+
+# Punctuation in the blocks DMs actually use; scanning all of Unicode at
+# import would cost ~0.5 s of cold start
+_PUNCTUATION_BLOCKS = [(0x0000, 0x3000), (0x3000, 0x3040), (0xFE10, 0xFE70), (0xFF00, 0xFF66)]
+_PUNCTUATION = frozenset(
+    cp for start, end in _PUNCTUATION_BLOCKS for cp in range(start, end)
+    if unicodedata.category(chr(cp)).startswith("P")
+)
+
+
+class TextNormalizer:
+    """Maps message text to its cache key"""
+
+    def __init__(self, keep=""):
+        chars = "".join(re.escape(chr(cp)) for cp in sorted(_PUNCTUATION) if chr(cp) not in keep)
+        self._punctuation = re.compile(f"[{chars}]+")
+
+    def __call__(self, text):
+        text = self._punctuation.sub(" ", text.lower())
+        if _REPEATS.search(text):
+            text = _REPEATS.sub(r"\1\1", text)
+        return " ".join(text.split())
+
+
+class ReplyCache:
+    """Bounded LRU of normalised text -> (category, reply)"""
+
+    def __init__(self, max_size=10_000, normalizer=None):
+        self.max_size = max_size
+        self.normalize = normalizer or TextNormalizer()
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        # Caller holds the lock
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def get_many(self, texts, compute, version=None, normalize=None):
+        """
+        [(category, reply), ...] for texts.
+
+        compute(normalised_texts) is called once with the distinct cache
+        misses and must return results in the same order. normalize
+        overrides the cache's normaliser (e.g. one per rule table).
+        """
+        keys = [(normalize or self.normalize)(text) for text in texts]
+        found = {}
+        with self._lock:
+            self._check_version(version)
+            for key in keys:
+                if key in found:
+                    continue
+                result = self._entries.get(key)
+                if result is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = result
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            computed = compute(missing)
+            found.update(zip(missing, computed))
+            if self.max_size > 0:
+                with self._lock:
+                    if version == self.version:  # don't store results of a replaced table
+                        for key, result in zip(missing, computed):
+                            self._entries[key] = result
+                        while len(self._entries) > self.max_size:
+                            self._entries.popitem(last=False)
+                            self.evictions += 1
+        return [found[key] for key in keys]
+
+    def get(self, text, compute, version=None, normalize=None):
+        return self.get_many([text], compute, version, normalize)[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
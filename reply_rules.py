@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+from keyword_matcher import KeywordMatcher
+from reply_cache import TextNormalizer
+from structured_log import log_event
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# REPLY RULE TABLE
+# ══════════════════════════════════════════════════════════
+#
+# The categories, keywords and replies live in reply_rules.json (or YAML if
+# PyYAML is installed), shared by app.py and lambda_handler.py. "{brand}" in
+# a reply is replaced with the brand given to the store, or, with brand=None,
+# left in for the caller to fill per reply (tenants.Tenant.fill), so several
+# brands can share one compiled table.
+#
+# A load compiles the whole table into an immutable RuleSnapshot. The store
+# swaps its `snapshot` attribute in one assignment once the new one is fully
+# built, so a request that reads it once always sees one consistent table.
+# A file that fails to parse or validate is logged and the old table stays.
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reply_rules.json")
+
+
+def read_rules_file(path):
+    """Parse a JSON (or, with PyYAML, YAML) file as-is"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # optional; JSON needs nothing extra
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _entries(doc, key, words_key):
+    entries = doc.get(key, [])
+    if not isinstance(entries, list):
+        raise ValueError(f"'{key}' must be a list")
+    table = []
+    for position, entry in enumerate(entries):
+        try:
+            category, words, reply = entry["category"], entry[words_key], entry["reply"]
+        except (KeyError, TypeError):
+            raise ValueError(f"{key}[{position}] needs 'category', '{words_key}' and 'reply'") from None
+        if not isinstance(words, list) or not all(isinstance(w, str) and w for w in words):
+            raise ValueError(f"{key}[{position}].{words_key} must be a list of non-empty strings")
+        table.append((str(category), words, str(reply)))
+    return table
+
+
+class RuleSnapshot:
+    """One compiled version of the rule table; never mutated after creation"""
+
+    __slots__ = ("version", "file_version", "path", "loaded_at", "rules", "exact_rules", "matcher",
+                 "normalize", "keywords")
+
+    def __init__(self, doc, path, brand):
+        if not isinstance(doc, dict):
+            raise ValueError("rule file must contain an object")
+        rules = _entries(doc, "rules", "keywords")
+        exact_rules = _entries(doc, "exact_rules", "phrases")
+        default = doc.get("default") or {}
+        default = (str(default.get("category", "default")), str(default.get("reply", "")))
+
+        def fill(reply):
+            return reply if brand is None else reply.replace("{brand}", brand)
+
+        self.rules = tuple((c, tuple(words), fill(reply)) for c, words, reply in rules)
+        self.exact_rules = tuple((c, tuple(words), fill(reply)) for c, words, reply in exact_rules)
+        self.matcher = KeywordMatcher(self.rules, self.exact_rules, (default[0], fill(default[1])))
+        self.normalize = TextNormalizer(keep=self.matcher.alphabet)
+        self.version = self.matcher.version
+        self.file_version = doc.get("version")
+        self.path = path
+        self.loaded_at = datetime.now().isoformat()
+        self.keywords = sum(len(words) for _, words, _ in rules)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "file_version": self.file_version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "categories": len(self.matcher.categories),
+            "keywords": self.keywords
+        }
+
+
+class RuleStore:
+    """Holds the current RuleSnapshot and reloads it when the file changes"""
+
+    def __init__(self, path=DEFAULT_RULES_PATH, brand=""):
+        self.path = path
+        self.brand = brand
+        self.reloads = 0
+        self.errors = 0
+        self._stamp = self._file_stamp()
+        self._lock = threading.Lock()  # one reload at a time
+        self._watcher = None
+        self._next_check = 0.0
+        # Unlike reloads, a bad file at startup is fatal
+        self.snapshot = RuleSnapshot(read_rules_file(path), path, brand)
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def reload(self):
+        """Compile the file and swap it in; returns True if the table changed"""
+        with self._lock:
+            self._stamp = self._file_stamp()
+            try:
+                snapshot = RuleSnapshot(read_rules_file(self.path), self.path, self.brand)
+            except Exception as e:
+                self.errors += 1
+                log_event(logger, "reply_rules_error", logging.ERROR, path=self.path, error=str(e))
+                return False
+            if snapshot.version == self.snapshot.version:
+                return False
+            self.snapshot = snapshot
+            self.reloads += 1
+        log_event(logger, "reply_rules_reloaded", **snapshot.info())
+        return True
+
+    def check(self, interval=0.0):
+        """Reload if the file changed; stats it at most once per `interval` seconds"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + interval
+        if self._file_stamp() == self._stamp:
+            return False
+        return self.reload()
+
+    def watch(self, interval=2.0):
+        """Poll the file from a daemon thread"""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.check()
+
+        self._watcher = threading.Thread(target=loop, name="reply-rules-watch", daemon=True)
+        self._watcher.start()
+
+    def reload_on_signal(self, signum=getattr(signal, "SIGHUP", None)):
+        """Reload on SIGHUP; only possible from the main thread"""
+        if signum is None:
+            return False
+        try:
+            # Compile off the signal handler so a slow load can't re-enter it
+            signal.signal(signum, lambda *_: threading.Thread(target=self.reload, daemon=True).start())
+        except ValueError:
+            return False
+        return True
+
+    def stats(self):
+        return {**self.snapshot.info(), "reloads": self.reloads, "errors": self.errors}
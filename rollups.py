@@ -0,0 +1,139 @@
+import threading
+import time
+
+# ══════════════════════════════════════════════════════════
+# CATEGORY ROLLUPS
+# ══════════════════════════════════════════════════════════
+#
+# "How many refund requests in the last hour?" without scanning history.
+# Each reply category gets fixed-size ring arrays, one slot per time bucket:
+#   messages   replies classified into the category (a coalesced burst is one)
+#   sent       replies the Graph API accepted
+#   failed     replies given up on
+#   latency    total and max seconds from the send worker picking a reply
+#              up to its outcome (pacing, retries and the Graph API call)
+#
+# A slot remembers which bucket it holds. Writing to a slot that still holds
+# an older bucket zeroes it first, and reads skip such stale slots, so
+# nothing ever sweeps the rings. Updates are O(1); a timeseries read is
+# O(buckets x categories), however much traffic the buckets saw.
+#
+# Rollups are per process, like /metrics.
+
+WINDOWS = {"minute": 60, "hour": 3600}
+
+
+class RollupWindow:
+    """Per-category counts and send latency over the last `buckets` buckets of `width` seconds"""
+
+    def __init__(self, width, buckets):
+        self.width = width
+        self.buckets = max(1, buckets)
+        self._epochs = [-1] * self.buckets  # bucket number each slot holds
+        self._series = {}                   # category -> {field: ring}
+
+    def _slot(self, now):
+        # Caller holds the lock
+        epoch = int(now // self.width)
+        slot = epoch % self.buckets
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            for rings in self._series.values():
+                for ring in rings.values():
+                    ring[slot] = 0
+        return slot
+
+    def _rings(self, category):
+        rings = self._series.get(category)
+        if rings is None:
+            n = self.buckets
+            rings = self._series[category] = {
+                "messages": [0] * n, "sent": [0] * n, "failed": [0] * n,
+                "timed": [0] * n, "latency_sum": [0.0] * n, "latency_max": [0.0] * n
+            }
+        return rings
+
+    def add(self, category, now, messages=0, sent=0, failed=0, latency=None):
+        slot = self._slot(now)
+        rings = self._rings(category)
+        rings["messages"][slot] += messages
+        rings["sent"][slot] += sent
+        rings["failed"][slot] += failed
+        if latency is not None:
+            rings["timed"][slot] += 1
+            rings["latency_sum"][slot] += latency
+            if latency > rings["latency_max"][slot]:
+                rings["latency_max"][slot] = latency
+
+    def series(self, now, last=None, categories=None):
+        """The newest `last` buckets, oldest first, as one array per field and category"""
+        n = self.buckets if not last else max(1, min(last, self.buckets))
+        current = int(now // self.width)
+        epochs = range(current - n + 1, current + 1)
+        slots = [epoch % self.buckets if self._epochs[epoch % self.buckets] == epoch else None for epoch in epochs]
+
+        by_category = {}
+        totals = {"messages": [0] * n, "sent": [0] * n, "failed": [0] * n}
+        for category, rings in self._series.items():
+            if categories is not None and category not in categories:
+                continue
+            out = {field: [rings[field][s] if s is not None else 0 for s in slots]
+                   for field in ("messages", "sent", "failed")}
+            if not any(out["messages"]) and not any(out["sent"]) and not any(out["failed"]):
+                continue
+            timed = [rings["timed"][s] if s is not None else 0 for s in slots]
+            out["latency_ms_avg"] = [
+                round(rings["latency_sum"][s] / count * 1000, 3) if count else None for s, count in zip(slots, timed)
+            ]
+            out["latency_ms_max"] = [
+                round(rings["latency_max"][s] * 1000, 3) if count else None for s, count in zip(slots, timed)
+            ]
+            for field in totals:
+                totals[field] = [a + b for a, b in zip(totals[field], out[field])]
+            by_category[category] = out
+
+        return {
+            "width_s": self.width,
+            "buckets": n,
+            "start": epochs[0] * self.width,  # unix seconds of the first bucket
+            "categories": by_category,
+            "totals": totals
+        }
+
+
+class CategoryRollups:
+    """Per-minute and per-hour rollups of reply categories"""
+
+    def __init__(self, minutes=60, hours=48, clock=time.time):
+        self.windows = {"minute": RollupWindow(WINDOWS["minute"], minutes),
+                        "hour": RollupWindow(WINDOWS["hour"], hours)}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def classified(self, categories):
+        """Replies were generated for these categories (one entry per reply)"""
+        now = self._clock()
+        with self._lock:
+            for category in categories:
+                for window in self.windows.values():
+                    window.add(category, now, messages=1)
+
+    def outcome(self, category, sent, latency=None):
+        """A reply of `category` was sent (or given up on) `latency` seconds after it was picked up"""
+        now = self._clock()
+        with self._lock:
+            for window in self.windows.values():
+                window.add(category, now, sent=int(bool(sent)), failed=int(not sent), latency=latency)
+
+    def timeseries(self, window=None, last=None, categories=None):
+        """{window name: series}, for one window or all of them"""
+        if window is not None and window not in self.windows:
+            raise ValueError(f"window must be one of {tuple(self.windows)}, got {window!r}")
+        now = self._clock()
+        names = [window] if window is not None else list(self.windows)
+        with self._lock:
+            return {name: self.windows[name].series(now, last, categories) for name in names}
+
+    def stats(self):
+        return {name: {"width_s": w.width, "buckets": w.buckets, "categories": len(w._series)}
+                for name, w in self.windows.items()}
@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+import time
+
+from structured_log import log_event
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# OUTBOUND SEND QUEUE
+# ══════════════════════════════════════════════════════════
+#
+# Bounded job queue drained by a pool of worker threads, so the webhook can
+# return 200 to Instagram before the Graph API call happens.
+
+_STOP = object()
+
+
+class SendQueue:
+    """Bounded queue + worker pool for reply delivery jobs"""
+
+    def __init__(self, workers=4, max_size=1000, put_timeout=0.5, name="send"):
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self.put_timeout = put_timeout
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._accepting = True
+
+        self._counts = {"enqueued": 0, "processed": 0, "rejected": 0, "failed": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # ─── lifecycle ───
+
+    def _ensure_started(self):
+        # Started lazily so threads are created in the serving process,
+        # not in a gunicorn master that forks afterwards
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def shutdown(self, timeout=30):
+        """Stop accepting jobs, drain what is queued, then stop the workers"""
+        self._accepting = False
+        if not self._threads:
+            return
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        pending = self._queue.qsize()
+        if pending:
+            log_event(logger, "send_queue_shutdown", logging.WARNING, undelivered=pending)
+        self._threads = []
+
+    # ─── producer ───
+
+    def submit(self, fn, *args):
+        """
+        Enqueue fn(*args). Blocks up to put_timeout when the queue is full,
+        then gives up and returns False so the caller can push back.
+        """
+        if not self._accepting:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put((time.monotonic(), fn, args), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._counts["rejected"] += 1
+            return False
+        with self._lock:
+            self._counts["enqueued"] += 1
+        return True
+
+    # ─── consumer ───
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                enqueued_at, fn, args = item
+                waited = time.monotonic() - enqueued_at
+                with self._lock:
+                    self._wait_total += waited
+                    self._wait_max = max(self._wait_max, waited)
+                try:
+                    fn(*args)
+                except Exception as e:
+                    log_event(logger, "send_job_failed", logging.ERROR, error=str(e))
+                    with self._lock:
+                        self._counts["failed"] += 1
+                with self._lock:
+                    self._counts["processed"] += 1
+            finally:
+                self._queue.task_done()
+
+    # ─── metrics ───
+
+    def metrics(self):
+        with self._lock:
+            processed = self._counts["processed"]
+            return {
+                "workers": self.workers,
+                "depth": self._queue.qsize(),
+                "max_size": self.max_size,
+                **self._counts,
+                "wait_ms_avg": round(self._wait_total / processed * 1000, 3) if processed else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 3),
+            }
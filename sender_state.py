@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ══════════════════════════════════════════════════════════
+# PER-SENDER STATE
+# ══════════════════════════════════════════════════════════
+#
+# Remembers, per sender_id, which reply category they last got and when.
+# A sender who fires off several messages that all map to the same reply
+# ("hi" / "hello?" / "hey!!") within the window gets it once; a message
+# with a different category still gets its reply.
+#
+# Bounded like DedupStore: an OrderedDict in last-seen order, so idle
+# senders are evicted from the front and the size cap drops the least
+# recently seen.
+
+
+class SenderState:
+    __slots__ = ("last_category", "last_reply_at", "last_seen", "replies", "suppressed")
+
+    def __init__(self, now):
+        self.last_category = None
+        self.last_reply_at = 0.0
+        self.last_seen = now
+        self.replies = 0
+        self.suppressed = 0
+
+
+class SenderIndex:
+    """Per-sender last reply, used to suppress repeats within `window` seconds"""
+
+    def __init__(self, window=60.0, max_senders=100_000, idle_ttl=3600.0):
+        self.window = window
+        self.max_senders = max_senders
+        self.idle_ttl = idle_ttl
+        self._senders = OrderedDict()
+        self._lock = threading.Lock()
+        self.suppressed = 0
+        self.evictions = 0
+
+    def _evict(self, now):
+        # Caller holds the lock
+        senders = self._senders
+        while senders:
+            oldest = next(iter(senders.values()))
+            if now - oldest.last_seen < self.idle_ttl and len(senders) <= self.max_senders:
+                break
+            senders.popitem(last=False)
+            self.evictions += 1
+
+    def should_reply(self, sender_id, category, now=None):
+        """
+        Record a reply decision: False if `category` was already sent to
+        this sender within the window (the reply is suppressed).
+        """
+        if self.window <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._senders.get(sender_id)
+            if state is None:
+                state = self._senders[sender_id] = SenderState(now)
+            else:
+                self._senders.move_to_end(sender_id)
+                state.last_seen = now
+            self._evict(now)
+
+            if state.last_category == category and now - state.last_reply_at < self.window:
+                state.suppressed += 1
+                self.suppressed += 1
+                return False
+            state.last_category = category
+            state.last_reply_at = now
+            state.replies += 1
+            return True
+
+    def release(self, sender_id, category):
+        """The reply for `category` never went out; let the next one through"""
+        with self._lock:
+            state = self._senders.get(sender_id)
+            if state is not None and state.last_category == category:
+                state.last_category = None
+                state.last_reply_at = 0.0
+
+    def get(self, sender_id):
+        with self._lock:
+            state = self._senders.get(sender_id)
+            if state is None:
+                return None
+            return {
+                "last_category": state.last_category,
+                "last_reply_age_s": round(time.monotonic() - state.last_reply_at, 3) if state.last_reply_at else None,
+                "replies": state.replies,
+                "suppressed": state.suppressed
+            }
+
+    def __len__(self):
+        return len(self._senders)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "senders": len(self._senders),
+                "max_senders": self.max_senders,
+                "window_s": self.window,
+                "idle_ttl_s": self.idle_ttl,
+                "sends_saved": self.suppressed,
+                "evictions": self.evictions
+            }
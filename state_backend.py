@@ -0,0 +1,425 @@
+import logging
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+from dedup import DedupStore
+
+logger = logging.getLogger(__name__)
+
+# ══════════════════════════════════════════════════════════
+# STATE BACKENDS
+# ══════════════════════════════════════════════════════════
+#
+# Dedup and counters behind one interface, so several gunicorn workers or
+# Lambda containers can share them:
+#
+#   memory  per-process (the default, same as before)
+#   sqlite  one WAL-mode file shared by every worker on the host
+#   redis   any Redis-protocol server shared by every host / container
+#
+# Dedup is always an atomic insert-if-absent. Counter increments are buffered
+# in-process and written in batches; a background thread writes whatever is
+# left after flush_interval, so an idle worker doesn't hold its deltas back.
+
+
+class _BatchedCounters(ABC):
+    """Buffers counter deltas and flushes them every N increments or T seconds"""
+
+    def _init_batching(self, flush_every, flush_interval):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._pending_ops = 0
+        self._last_flush = time.monotonic()
+        self._pending_lock = threading.Lock()
+        self._flusher_pid = None
+
+    def incr(self, name, amount=1):
+        with self._pending_lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+            self._pending_ops += 1
+            due = (self._pending_ops >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+            start = self._flusher_pid != os.getpid()
+            if start:
+                self._flusher_pid = os.getpid()
+        if start:
+            # Started on first use, and again in a forked worker (threads don't survive fork)
+            threading.Thread(target=self._flush_loop, name="state-counter-flush", daemon=True).start()
+        if due:
+            self.flush()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._pending_ops and time.monotonic() - self._last_flush >= self.flush_interval:
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("state_counter_flush_error")
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._pending_ops = 0
+            self._last_flush = time.monotonic()
+        if pending:
+            self._write_counters(pending)
+
+    @abstractmethod
+    def _write_counters(self, deltas):
+        """Add {name: delta} to the shared counters"""
+
+
+# ─── memory ───
+
+class MemoryBackend:
+    """Per-process state; nothing is shared between workers"""
+
+    name = "memory"
+
+    def __init__(self, dedup_max_size=100_000, dedup_ttl=86_400):
+        self.dedup = DedupStore(dedup_max_size, dedup_ttl)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add_if_absent(self, key):
+        return self.dedup.add_if_absent(key)
+
+    def add_many_if_absent(self, keys):
+        return [self.dedup.add_if_absent(key) for key in keys]
+
+    def discard(self, key):
+        self.dedup.discard(key)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def flush(self):
+        pass
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def dedup_stats(self):
+        return {"backend": self.name, **self.dedup.stats()}
+
+    def close(self):
+        pass
+
+
+# ─── sqlite ───
+
+class SQLiteBackend(_BatchedCounters):
+    """Shared SQLite file in WAL mode; safe for multiple processes on one host"""
+
+    name = "sqlite"
+
+    def __init__(self, path, dedup_ttl=86_400, flush_every=100, flush_interval=1.0, prune_every=1000):
+        self.path = path
+        self.dedup_ttl = dedup_ttl
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._init_batching(flush_every, flush_interval)
+        self._connection()
+
+    def _connection(self):
+        # One connection per process: reopen after a fork
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3  # only paid for when this backend is selected
+
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS dedup (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS dedup_expires ON dedup (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    # Inserts a new key or revives an expired one; a live key is left
+    # untouched and reports rowcount 0
+    _UPSERT_DEDUP = (
+        "INSERT INTO dedup (key, expires_at) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at "
+        "WHERE dedup.expires_at <= ?"
+    )
+
+    def _record(self, conn, added, now):
+        if added:
+            self.misses += 1
+            self._inserts += 1
+            if self._inserts % self.prune_every == 0:
+                self.evictions += conn.execute("DELETE FROM dedup WHERE expires_at <= ?", (now,)).rowcount
+        else:
+            self.hits += 1
+        return added
+
+    def add_if_absent(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            cur = conn.execute(self._UPSERT_DEDUP, (key, now + self.dedup_ttl, now))
+            return self._record(conn, cur.rowcount == 1, now)
+
+    def add_many_if_absent(self, keys):
+        """Bulk insert-if-absent in a single transaction"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = [
+                    self._record(conn, conn.execute(self._UPSERT_DEDUP, (key, now + self.dedup_ttl, now)).rowcount == 1, now)
+                    for key in keys
+                ]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return added
+
+    def discard(self, key):
+        with self._lock:
+            self._connection().execute("DELETE FROM dedup WHERE key = ?", (key,))
+
+    def _write_counters(self, deltas):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    deltas.items()
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def counters(self):
+        self.flush()
+        with self._lock:
+            return dict(self._connection().execute("SELECT name, value FROM counters"))
+
+    def dedup_stats(self):
+        with self._lock:
+            size = self._connection().execute("SELECT COUNT(*) FROM dedup").fetchone()[0]
+        return {
+            "backend": self.name,
+            "size": size,
+            "ttl_seconds": self.dedup_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ─── redis protocol ───
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RespClient:
+    """Minimal thread-safe RESP2 client (no external dependency)"""
+
+    def __init__(self, url="redis://localhost:6379/0", timeout=2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        self._pid = os.getpid()
+        if self.password:
+            self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            self._roundtrip([("SELECT", self.db)])
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._file = None
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._read() for _ in range(count)]
+        raise ConnectionError(f"unexpected reply: {line!r}")
+
+    def _roundtrip(self, commands):
+        self._sock.sendall(b"".join(self._encode(c) for c in commands))
+        return [self._read() for _ in commands]
+
+    def _stale(self):
+        # Between pipelines an idle connection has nothing to read: EOF, an
+        # error or stray bytes on a non-blocking peek mean it can't be used
+        self._sock.setblocking(False)
+        try:
+            self._sock.recv(1, socket.MSG_PEEK)
+            return True
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            self._sock.settimeout(self.timeout)
+
+    def pipeline(self, commands):
+        """
+        Send several commands in one write and return their replies.
+
+        Only a failure before anything reached the server is retried (on a
+        fresh connection). SET NX and HINCRBY aren't safe to repeat, so a
+        failure while reading the replies is raised: the server may already
+        have applied them.
+        """
+        data = b"".join(self._encode(c) for c in commands)
+        with self._lock:
+            if self._sock is None or self._pid != os.getpid():
+                self._connect()
+            elif self._stale():
+                self._close()
+                self._connect()
+            try:
+                self._sock.sendall(data)
+            except OSError:
+                self._close()
+                self._connect()
+                self._sock.sendall(data)
+            try:
+                replies = [self._read() for _ in commands]
+            except (OSError, ValueError):
+                self._close()
+                raise
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class RedisBackend(_BatchedCounters):
+    """State in a shared Redis-protocol server"""
+
+    name = "redis"
+
+    def __init__(self, url, dedup_ttl=86_400, prefix="autodm:", flush_every=100, flush_interval=1.0):
+        self.client = RespClient(url)
+        self.dedup_ttl = dedup_ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._init_batching(flush_every, flush_interval)
+
+    def add_if_absent(self, key):
+        return self.add_many_if_absent([key])[0]
+
+    def add_many_if_absent(self, keys):
+        """Pipelined SET NX PX; atomic per key and expiry is handled server-side"""
+        ttl_ms = int(self.dedup_ttl * 1000)
+        replies = self.client.pipeline([("SET", f"{self.prefix}dedup:{key}", 1, "NX", "PX", ttl_ms) for key in keys])
+        added = [reply == "OK" for reply in replies]
+        self.misses += sum(added)
+        self.hits += len(added) - sum(added)
+        return added
+
+    def discard(self, key):
+        self.client.execute("DEL", f"{self.prefix}dedup:{key}")
+
+    def _write_counters(self, deltas):
+        self.client.pipeline([("HINCRBY", f"{self.prefix}counters", name, amount) for name, amount in deltas.items()])
+
+    def counters(self):
+        self.flush()
+        flat = self.client.execute("HGETALL", f"{self.prefix}counters") or []
+        return {flat[i]: int(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+    def dedup_stats(self):
+        # Size and evictions live on the server (keys expire there)
+        return {
+            "backend": self.name,
+            "ttl_seconds": self.dedup_ttl,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def close(self):
+        self.flush()
+        self.client.close()
+
+
+# ─── factory ───
+
+def create_backend(kind="memory", dedup_max_size=100_000, dedup_ttl=86_400,
+                   sqlite_path="autodm_state.db", redis_url="redis://localhost:6379/0"):
+    """Build the backend named by STATE_BACKEND"""
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryBackend(dedup_max_size, dedup_ttl)
+    if kind == "sqlite":
+        return SQLiteBackend(sqlite_path, dedup_ttl)
+    if kind == "redis":
+        return RedisBackend(redis_url, dedup_ttl)
+    raise ValueError(f"Unknown STATE_BACKEND: {kind!r} (expected memory, sqlite or redis)")
@@ -0,0 +1,106 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from datetime import datetime, timezone
+
+# ══════════════════════════════════════════════════════════
+# STRUCTURED LOGGING
+# ══════════════════════════════════════════════════════════
+#
+# One JSON object per line. Events carry their data in `fields` and are only
+# serialized by the formatter, which (with use_queue=True) runs on a listener
+# thread instead of the request thread. Call sites go through log_event(),
+# which returns before building anything when the level is disabled.
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            # A field named like an envelope key (ts, event, ...) doesn't replace it
+            entry.update({key if key not in entry else f"field_{key}": value for key, value in fields.items()})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def prepare(self, record):
+        # Resolve %-args now (cheap, and args may change later) but skip
+        # the formatter; exc_info is rendered to text so it can cross threads
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level="INFO", json_format=True, use_queue=True):
+    """
+    Configure the root logger.
+
+    use_queue=True routes records through a QueueHandler and writes them
+    from a background listener. Keep it off in Lambda, where background
+    threads are frozen between invocations and the runtime owns the handler.
+    """
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    if not use_queue:
+        if not root.handlers:
+            root.addHandler(logging.StreamHandler())
+        for handler in root.handlers:
+            handler.setFormatter(formatter)
+        return None
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_event(logger, event, level=logging.INFO, /, **fields):
+    """
+    Log one structured event; free when the level is disabled. The first
+    three parameters are positional-only, so a field may be named `event`
+    or `level` without clashing with them.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+class PayloadSampler:
+    """Decides whether a full payload dump is logged (0.0 = never, 1.0 = always)"""
+
+    def __init__(self, rate=0.0):
+        self.rate = rate
+
+    def sample(self):
+        return self.rate >= 1.0 or (self.rate > 0.0 and random.random() < self.rate)
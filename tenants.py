@@ -0,0 +1,155 @@
+import os
+import threading
+
+from reply_rules import read_rules_file
+
+# ══════════════════════════════════════════════════════════
+# TENANT REGISTRY
+# ══════════════════════════════════════════════════════════
+#
+# One process can serve many Instagram accounts. Every webhook event names
+# the account it was sent to (recipient.id); the registry maps that ID to
+# the account's Tenant: access token, brand, reply rule file and send rate.
+# Accounts are listed in TENANTS_PATH (JSON, or YAML if PyYAML is installed):
+#
+#   {"tenants": [
+#       {"ig_id": "17841400000000001", "access_token_env": "ACME_TOKEN", "brand": "Acme"},
+#       {"ig_id": "17841400000000002", "access_token": "IGAA...", "brand": "Globex",
+#        "rules_path": "rules/globex.json", "send_rate": 5, "send_burst": 10}
+#   ]}
+#
+# The INSTAGRAM_USER_ID account from the environment, if set, is one more
+# and stays the default (outbox rows written before tenants existed).
+#
+# Loading stays cheap so thousands of mostly idle accounts cost little:
+#   - a Tenant is a slotted record; its Graph client, rule table and
+#     scheduler are built by the app's setup hook on its first message
+#   - clients share one connection pool (GraphClient.for_account)
+#   - rule files are compiled once per path with "{brand}" left in and
+#     filled per reply (fill()), so tenants on the same file share its
+#     matcher and reply cache
+#
+# Instagram-scoped sender IDs are unique per account, so dedup, the sender
+# index and the coalescer stay keyed by message / sender ID alone.
+
+
+class Tenant:
+    """One Instagram account served by this process"""
+
+    __slots__ = ("ig_id", "access_token", "brand", "rules_path", "send_rate", "send_burst",
+                 "client", "rules", "scheduler")
+
+    def __init__(self, ig_id, access_token, brand, rules_path=None, send_rate=None, send_burst=None):
+        self.ig_id = ig_id
+        self.access_token = access_token
+        self.brand = brand
+        self.rules_path = rules_path  # None = the process's REPLY_RULES_PATH
+        self.send_rate = send_rate    # None = the process's SEND_RATE_PER_SECOND / _BURST
+        self.send_burst = send_burst
+        # Set up on first use (TenantRegistry.get); scheduler last, it marks the tenant ready
+        self.client = None
+        self.rules = None
+        self.scheduler = None
+
+    @classmethod
+    def from_dict(cls, doc, position=0):
+        if not isinstance(doc, dict) or not doc.get("ig_id"):
+            raise ValueError(f"tenants[{position}] needs an 'ig_id'")
+        token = doc.get("access_token")
+        if not token and doc.get("access_token_env"):
+            token = os.getenv(doc["access_token_env"])
+        if not token:
+            raise ValueError(f"tenants[{position}] needs 'access_token' or a set 'access_token_env'")
+        send_rate, send_burst = doc.get("send_rate"), doc.get("send_burst")
+        return cls(
+            str(doc["ig_id"]),
+            token,
+            str(doc.get("brand") or doc["ig_id"]),
+            rules_path=doc.get("rules_path") or None,
+            send_rate=float(send_rate) if send_rate is not None else None,
+            send_burst=int(send_burst) if send_burst is not None else None
+        )
+
+    def fill(self, reply):
+        """A reply from a shared rule table, with this tenant's brand"""
+        return reply.replace("{brand}", self.brand) if "{brand}" in reply else reply
+
+    @property
+    def ready(self):
+        return self.scheduler is not None
+
+    def info(self):
+        return {
+            "ig_id": self.ig_id,
+            "brand": self.brand,
+            "rules_path": self.rules_path,
+            "active": self.ready,
+            "scheduler": self.scheduler.metrics() if self.ready else None
+        }
+
+
+class TenantRegistry:
+    """
+    Tenants by IG account ID.
+
+    setup(tenant) returns the tenant's (client, rules, scheduler); it runs
+    once per tenant, on the first get() for it. A tenant handed to the
+    constructor as `default` must come with those already set.
+    """
+
+    def __init__(self, setup, default=None):
+        self._setup = setup
+        self._tenants = {}
+        self._lock = threading.Lock()  # one setup at a time
+        self.default = default
+        if default is not None and default.ig_id:
+            self._tenants[default.ig_id] = default
+
+    def add(self, tenant):
+        if tenant.ig_id in self._tenants and self._tenants[tenant.ig_id] is not self.default:
+            raise ValueError(f"tenant {tenant.ig_id} is listed twice")
+        self._tenants[tenant.ig_id] = tenant
+
+    def load(self, path):
+        """Add every tenant in a JSON / YAML file; returns how many"""
+        doc = read_rules_file(path)
+        entries = doc.get("tenants") if isinstance(doc, dict) else doc
+        if not isinstance(entries, list):
+            raise ValueError(f"{path}: expected a list of tenants or {{\"tenants\": [...]}}")
+        for position, entry in enumerate(entries):
+            self.add(Tenant.from_dict(entry, position))
+        return len(entries)
+
+    def get(self, ig_id):
+        """
+        The tenant for an account, set up and ready to send. Accounts that
+        aren't registered (or None) get the default tenant, which may be None.
+        """
+        tenant = self._tenants.get(ig_id, self.default) if ig_id is not None else self.default
+        if tenant is not None and tenant.scheduler is None:
+            with self._lock:
+                if tenant.scheduler is None:
+                    tenant.client, tenant.rules, tenant.scheduler = self._setup(tenant)
+        return tenant
+
+    @property
+    def accounts(self):
+        """What ingress keeps messages to: the registered IDs (a live view), or None for any account"""
+        return self._tenants.keys() if self._tenants else None
+
+    def __contains__(self, ig_id):
+        return ig_id in self._tenants
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def __iter__(self):
+        return iter(list(self._tenants.values()))
+
+    def stats(self):
+        tenants = list(self._tenants.values())
+        return {
+            "tenants": len(tenants),
+            "active": sum(1 for tenant in tenants if tenant.ready),
+            "default": self.default.ig_id if self.default is not None else None
+        }
@@ -0,0 +1,129 @@
+import threading
+import time
+
+# ══════════════════════════════════════════════════════════
+# WEBHOOK BATCH PROCESSING
+# ══════════════════════════════════════════════════════════
+#
+# Handles a whole webhook payload at once instead of event by event:
+#   1. take the payload's text messages (ingress.parse_webhook() has
+#      already flattened entry[].messaging[] and dropped the rest)
+#   2. dedup all message IDs in one backend call
+#   3. generate every reply in one matcher pass
+#   4. drop replies the sender already got within the suppression window
+#   5. group by sender so each sender's replies go out in order, while
+#      different senders are sent concurrently
+
+
+def plan_batch(messages, add_many_if_absent, classify_replies, should_reply=None):
+    """
+    Bulk-dedup and generate replies.
+
+    classify_replies(texts) returns [(category, reply), ...]; should_reply
+    (sender_id, category), if given, is asked in arrival order and a False
+    drops that reply. Returns ({sender_id: [(message_id, text, category,
+    reply), ...]}, duplicates, suppressed) with each sender's messages kept
+    in arrival order.
+    """
+    fresh = add_many_if_absent([mid for _, mid, _ in messages])
+    kept = [m for m, is_new in zip(messages, fresh) if is_new]
+    results = classify_replies([text for _, _, text in kept])
+
+    groups = {}
+    suppressed = 0
+    for (sender_id, mid, text), (category, reply) in zip(kept, results):
+        if should_reply is not None and not should_reply(sender_id, category):
+            suppressed += 1
+            continue
+        groups.setdefault(sender_id, []).append((mid, text, category, reply))
+    return groups, len(messages) - len(kept), suppressed
+
+
+class BatchReport:
+    """Per-payload outcome; finishes once every sender group has been sent"""
+
+    def __init__(self, events, skipped=0, duplicates=0, on_finish=None, suppressed=0):
+        self.events = events
+        self.skipped = skipped
+        self.duplicates = duplicates
+        self.suppressed = suppressed
+        self.replies = 0
+        self.sent = 0
+        self.failures = 0
+        self.rejected = 0
+        self.retrying = 0
+        self.started = time.monotonic()
+        self.duration_ms = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._on_finish = on_finish
+
+    def expect(self, groups, replies):
+        """Register how many sender groups / replies are in flight"""
+        self._pending = groups
+        self.replies = replies
+        if groups == 0:
+            self._finish()
+
+    def group_done(self, sent, failed, rejected=0, retrying=0):
+        with self._lock:
+            self.sent += sent
+            self.failures += failed
+            self.rejected += rejected
+            self.retrying += retrying
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self._finish()
+
+    def _finish(self):
+        self.duration_ms = round((time.monotonic() - self.started) * 1000, 3)
+        if self._on_finish is not None:
+            self._on_finish(self)
+
+    def as_dict(self):
+        return {
+            "events": self.events,
+            "skipped": self.skipped,
+            "duplicates": self.duplicates,
+            "suppressed": self.suppressed,
+            "replies": self.replies,
+            "sent": self.sent,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "retrying": self.retrying,
+            "duration_ms": self.duration_ms
+        }
+
+
+class RetryGate:
+    """
+    on_result wrapper for one reply of a sender group. When the reply goes
+    to the retry queue, the rest of the group is passed to hold() and only
+    runs once the reply's final outcome is in, so a retried reply never
+    lands after the sender's next one.
+    """
+
+    __slots__ = ("on_result", "_resolved", "_held", "_lock")
+
+    def __init__(self, on_result):
+        self.on_result = on_result
+        self._resolved = False
+        self._held = None
+        self._lock = threading.Lock()
+
+    def __call__(self, ok):
+        self.on_result(ok)
+        with self._lock:
+            self._resolved = True
+            held, self._held = self._held, None
+        if held is not None:
+            held()
+
+    def hold(self, job):
+        """Run job after the outcome: later, or now if it is already in"""
+        with self._lock:
+            if not self._resolved:
+                self._held = job
+                return
+        job()